@@ -0,0 +1,84 @@
+"""
+Compare peak memory and time of gpxpy and the streaming GPX reader.
+
+Usage:
+    python benchmarks/bench_gpx_memory.py [number_of_points]
+
+Writes a synthetic GPX 1.1 track (500'000 points by default) in the
+MySchweizMobil format and loads it once with ``gpxpy.parse`` plus the list
+building that ``profile`` used to do, and once with ``tracks.read_gpx``.
+Peak memory is measured with ``tracemalloc``.
+"""
+
+import math
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(BASE_DIR, 'scripts'))
+
+import gpxpy
+
+from tracks import read_gpx
+
+
+def write_synthetic_gpx(path, points, segments=4):
+    header = ('<?xml version="1.0" encoding="utf-8"?><gpx version="1.1" '
+              'creator="MySchweizMobil - https://map.schweizmobil.ch/" '
+              'xmlns="http://www.topografix.com/GPX/1/1"><trk><name>synthetic</name>')
+    per_segment = points // segments
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(header)
+        for s in range(segments):
+            f.write('<trkseg>')
+            for i in range(per_segment):
+                t = (s * per_segment + i) / points
+                lat = 46.5 + 0.5 * t + 0.001 * math.sin(t * 5000)
+                lon = 8.0 + 0.8 * t + 0.001 * math.cos(t * 5000)
+                ele = 1200 + 600 * math.sin(t * 40)
+                f.write(f'<trkpt lat="{lat!r}" lon="{lon!r}"><ele>{ele!r}</ele></trkpt>')
+            f.write('</trkseg>')
+        f.write('</trk></gpx>')
+
+
+def load_with_gpxpy(path):
+    with open(path, 'r') as gpx_file:
+        gpx = gpxpy.parse(gpx_file)
+    coordinates = []
+    elevations = []
+    for track in gpx.tracks:
+        for segment in track.segments:
+            coordinates.append([[p.longitude, p.latitude] for p in segment.points])
+            elevations.extend(p.elevation for p in segment.points)
+    return coordinates, elevations
+
+
+def measure(label, func, path):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func(path)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    print(f"{label:<10} time={elapsed:6.2f}s  peak={peak / 2 ** 20:8.1f} MiB")
+    return peak
+
+
+def main():
+    points = int(sys.argv[1]) if len(sys.argv) > 1 else 500_000
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'synthetic.gpx')
+        write_synthetic_gpx(path, points)
+        print(f"{points} points, {os.path.getsize(path) / 2 ** 20:.1f} MiB GPX")
+        streaming = measure('streaming', read_gpx, path)
+        legacy = measure('gpxpy', load_with_gpxpy, path)
+    print(f"Output arrays: {points * 4 * 8 / 2 ** 20:.1f} MiB, "
+          f"peak reduction {legacy / streaming:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+Check the cold import time of the notebook helpers against a budget.
+
+Usage:
+    python benchmarks/bench_import.py [--budget MS] [--runs N]
+
+Imports ``scripts.py`` in fresh interpreters with ``python -X importtime``,
+once the way the notebooks do (``scripts/`` on sys.path, ``import scripts``)
+and once as the package module ``scripts.scripts``. Prints the median
+cumulative import time and the slowest imports it pulls in, and exits with
+status 1 if the median exceeds the budget or if any of the heavy
+dependencies (folium, matplotlib, NumPy, ...) is imported eagerly.
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Milliseconds a cold ``from scripts import *`` may take.
+DEFAULT_BUDGET_MS = 100
+
+# Top-level packages that must only be imported when a helper needs them.
+HEAVY = ('folium', 'branca', 'gpxpy', 'matplotlib', 'numpy', 'qrcode', 'PIL',
+         'selenium', 'IPython')
+
+CASES = {
+    'notebook': (os.path.join(BASE_DIR, 'scripts'), 'scripts'),
+    'package': (BASE_DIR, 'scripts.scripts'),
+}
+
+
+def import_times(cwd, module):
+    """
+    Import ``module`` in a fresh interpreter.
+
+    Returns:
+        list: (name, depth, self µs, cumulative µs) per imported module.
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=cwd, capture_output=True, text=True, check=True,
+        env={**os.environ, 'PYTHONPATH': cwd})
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), depth, int(self_us), int(cumulative_us)))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Import-time budget for scripts.py.')
+    parser.add_argument('--budget', type=float, default=DEFAULT_BUDGET_MS,
+                        help=f'budget in milliseconds (default: {DEFAULT_BUDGET_MS})')
+    parser.add_argument('--runs', type=int, default=5, help='runs per case (default: 5)')
+    args = parser.parse_args()
+
+    failed = False
+    for case, (cwd, module) in CASES.items():
+        timings = []
+        for _ in range(args.runs):
+            rows = import_times(cwd, module)
+            total = next(cum for name, depth, _, cum in rows if name == module and depth == 0)
+            timings.append(total / 1000)
+
+        median = statistics.median(timings)
+        heavy = sorted({name.split('.')[0] for name, *_ in rows
+                        if name.split('.')[0] in HEAVY})
+        ok = median <= args.budget and not heavy
+        failed |= not ok
+        print(f"{case:<9} import {module:<16} median={median:7.1f} ms  "
+              f"min={min(timings):7.1f} ms  budget={args.budget:g} ms  "
+              f"{'OK' if ok else 'FAIL'}")
+        if heavy:
+            print(f"          eagerly imported: {', '.join(heavy)}")
+        slowest = sorted((r for r in rows if r[0] != module), key=lambda r: -r[2])[:5]
+        for name, _, self_us, _ in slowest:
+            print(f"          {self_us / 1000:6.1f} ms  {name}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
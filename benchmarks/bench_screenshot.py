@@ -0,0 +1,98 @@
+"""
+Compare per-map screenshot latency: fresh Chrome + fixed sleep vs. browser pool.
+
+Usage:
+    python benchmarks/bench_screenshot.py [number_of_tours]
+
+The legacy path starts a new headless Chrome for every map, sleeps three
+seconds and quits, exactly like ``create_map`` used to. The pooled path uses
+``screenshot.capture`` with readiness-based waits.
+"""
+
+import glob
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(BASE_DIR, 'scripts'))
+
+import folium
+import gpxpy
+from selenium import webdriver
+
+from screenshot import BrowserPool, _chrome_options, capture
+
+
+def build_map(gpx_path):
+    with open(gpx_path, 'r') as gpx_file:
+        gpx = gpxpy.parse(gpx_file)
+    m = folium.Map(location=[46.8, 8.2], zoom_start=13, tiles='OpenStreetMap')
+    features = []
+    for track in gpx.tracks:
+        for segment in track.segments:
+            features.append({
+                'type': 'Feature',
+                'geometry': {
+                    'type': 'LineString',
+                    'coordinates': [[p.longitude, p.latitude] for p in segment.points]
+                },
+                'properties': {}
+            })
+    layer = folium.GeoJson({'type': 'FeatureCollection', 'features': features}).add_to(m)
+    m.fit_bounds(layer.get_bounds())
+    return m
+
+
+def legacy_screenshot(html_path, png_path, width=800, height=600):
+    driver = webdriver.Chrome(options=_chrome_options(width, height))
+    driver.get(f'file://{os.path.abspath(html_path)}')
+    time.sleep(3)
+    driver.save_screenshot(png_path)
+    driver.quit()
+
+
+def report(label, timings):
+    print(f"{label:<10} n={len(timings):<3} "
+          f"mean={statistics.mean(timings):6.2f}s  "
+          f"median={statistics.median(timings):6.2f}s  "
+          f"total={sum(timings):7.2f}s")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    gpx_files = sorted(glob.glob(os.path.join(BASE_DIR, 'files', '*', '*', '*.gpx')))[:count]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pages = []
+        for gpx_path in gpx_files:
+            m = build_map(gpx_path)
+            html_path = os.path.join(tmp, os.path.basename(gpx_path) + '.html')
+            m.save(html_path)
+            pages.append((html_path, m.get_name()))
+
+        legacy = []
+        for html_path, _ in pages:
+            start = time.perf_counter()
+            legacy_screenshot(html_path, html_path + '.legacy.png')
+            legacy.append(time.perf_counter() - start)
+
+        pool = BrowserPool(size=1)
+        pooled = []
+        try:
+            for html_path, map_name in pages:
+                start = time.perf_counter()
+                capture(html_path, html_path + '.pooled.png', map_name=map_name, pool=pool)
+                pooled.append(time.perf_counter() - start)
+        finally:
+            pool.close()
+
+    report('legacy', legacy)
+    report('pooled', pooled)
+    print(f"Speed-up: {statistics.mean(legacy) / statistics.mean(pooled):.1f}x")
+
+
+if __name__ == '__main__':
+    main()
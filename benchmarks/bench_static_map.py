@@ -0,0 +1,67 @@
+"""
+Time the browser-free map renderer over every GPX track in files/.
+
+Usage:
+    python benchmarks/bench_static_map.py [tile_dir]
+
+Renders every tour once sequentially and once on a process pool and prints
+the per-map latency. Compare with ``bench_screenshot.py`` for the browser path.
+"""
+
+import glob
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(BASE_DIR, 'scripts'))
+
+import gpxpy
+
+from static_map import render_static_map
+
+
+def load_lines(gpx_path):
+    with open(gpx_path, 'r') as gpx_file:
+        gpx = gpxpy.parse(gpx_file)
+    return [[[p.longitude, p.latitude] for p in segment.points]
+            for track in gpx.tracks for segment in track.segments]
+
+
+def timed_render(args):
+    lines, output_filename, tile_dir = args
+    start = time.perf_counter()
+    render_static_map(lines, output_filename, tile_dir=tile_dir)
+    return time.perf_counter() - start
+
+
+def main():
+    tile_dir = sys.argv[1] if len(sys.argv) > 1 else None
+    gpx_files = sorted(glob.glob(os.path.join(BASE_DIR, 'files', '*', '*', '*.gpx')))
+    tracks = [load_lines(path) for path in gpx_files]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        jobs = [(lines, os.path.join(tmp, f'{i}.png'), tile_dir)
+                for i, lines in enumerate(tracks)]
+
+        start = time.perf_counter()
+        sequential = [timed_render(job) for job in jobs]
+        sequential_total = time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ProcessPoolExecutor() as pool:
+            list(pool.map(timed_render, jobs))
+        parallel_total = time.perf_counter() - start
+
+    print(f"{len(jobs)} maps")
+    print(f"per map:    mean={statistics.mean(sequential) * 1000:.1f} ms  "
+          f"median={statistics.median(sequential) * 1000:.1f} ms")
+    print(f"sequential: {sequential_total:.2f} s")
+    print(f"pool:       {parallel_total:.2f} s ({os.cpu_count()} cores)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+Round-trip check of the polyline encoding on every GPX file under files/.
+
+Usage:
+    python benchmarks/check_polyline.py
+
+Every segment of every track (full resolution) is encoded and decoded
+again; no point may move further than half a quantisation step in latitude
+and in longitude, about 0.7 m diagonally. If Node.js is installed, the decoder shipped with the
+pages (``polyline.DECODER_JS``) decodes the same strings and must give the
+same coordinates as ``polyline.decode``. Exits with status 1 on a failure.
+"""
+
+import glob
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+import numpy as np
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(BASE_DIR, 'scripts'))
+
+from polyline import DECODER_JS, PRECISION, decode, encode
+from tracks import EARTH_RADIUS, load_track
+
+# Half a step of 10**-PRECISION degrees, in metres of latitude.
+HALF_STEP = np.radians(0.5 * 10 ** -PRECISION) * EARTH_RADIUS
+
+
+def deviation(lat, lon, lat2, lon2):
+    """
+    Return (largest distance in metres, largest distance / allowed distance)
+    between two point sequences.
+    """
+    if not len(lat):
+        return 0.0, 0.0
+    scale = np.cos(np.radians(lat))
+    dy = np.radians(lat2 - lat) * EARTH_RADIUS
+    dx = np.radians(lon2 - lon) * EARTH_RADIUS * scale
+    distance = np.hypot(dx, dy)
+    allowed = HALF_STEP * np.hypot(1.0, scale) * (1 + 1e-6)
+    return float(distance.max()), float((distance / allowed).max())
+
+
+def decode_js(strings):
+    """Decode with the page's decoder in Node.js; [[lon, lat], ...] per string."""
+    script = (DECODER_JS + '\nvar input = require("fs").readFileSync(0, "utf8");\n'
+              f'console.log(JSON.stringify(JSON.parse(input).map(function (t) '
+              f'{{ return decodePolyline(t, {PRECISION}); }})));')
+    result = subprocess.run(['node', '-e', script], input=json.dumps(strings),
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout)
+
+
+def main():
+    gpx_files = sorted(glob.glob(os.path.join(BASE_DIR, 'files', '*', '*', '*.gpx')))
+    strings, expected = [], []
+    worst, ratio, points = 0.0, 0.0, 0
+    for path in gpx_files:
+        track = load_track(path)
+        for s in track.segments():
+            lat, lon = track.lat[s], track.lon[s]
+            text = encode(lat, lon)
+            lat2, lon2 = decode(text)
+            if len(lat2) != len(lat):
+                print(f"✗ {path}: {len(lat2)} of {len(lat)} points decoded")
+                return 1
+            metres, share = deviation(lat, lon, lat2, lon2)
+            worst, ratio = max(worst, metres), max(ratio, share)
+            points += len(lat)
+            strings.append(text)
+            expected.append(np.column_stack((lon2, lat2)))
+
+    ok = ratio <= 1.0
+    print(f"{'✓' if ok else '✗'} {len(gpx_files)} tracks, {points} points: "
+          f"max deviation {worst:.3f} m ({ratio:.0%} of half a step)")
+
+    if shutil.which('node'):
+        decoded = decode_js(strings)
+        same = all(np.allclose(np.array(js).reshape(-1, 2), py, rtol=0, atol=1e-9)
+                   for js, py in zip(decoded, expected))
+        print(f"{'✓' if same else '✗'} JavaScript decoder agrees on {len(strings)} segments")
+        ok = ok and same
+    else:
+        print("- Node.js not found, JavaScript decoder not checked")
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
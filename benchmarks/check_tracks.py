@@ -0,0 +1,91 @@
+"""
+Regression check of GPX loading on tracks with empty segments.
+
+Usage:
+    python benchmarks/check_tracks.py
+
+GPS devices and editors write an empty ``<trkseg>`` when a recording is
+stopped and resumed without a fix, most often at the end of the track.
+Each variant below holds the same two segments plus empty ones at the end,
+the start or in between; every parser must read it, through the track
+cache too, with the same points and distance as the plain track. Exits
+with status 1 on a failure.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(BASE_DIR, 'scripts'))
+
+from tracks import TrackCache, parse_gpx, read_gpx
+
+PARSERS = {'read_gpx': read_gpx, 'parse_gpx': parse_gpx}
+
+_GPX = """<?xml version="1.0" encoding="UTF-8"?>
+<gpx version="1.1" creator="check_tracks" xmlns="http://www.topografix.com/GPX/1/1">
+<trk><name>check</name>{}</trk>
+</gpx>
+"""
+_SEGMENTS = [
+    [(47.2850, 8.8510, 700.0), (47.2861, 8.8532, 712.0), (47.2874, 8.8551, 731.0)],
+    [(47.2890, 8.8570, 745.0), (47.2902, 8.8588, 760.0)],
+]
+EMPTY = '<trkseg></trkseg>'
+
+
+def segment_xml(points):
+    return '<trkseg>' + ''.join(
+        f'<trkpt lat="{lat}" lon="{lon}"><ele>{ele}</ele></trkpt>'
+        for lat, lon, ele in points) + '</trkseg>'
+
+
+def variants():
+    """Yield (name, GPX text) of the plain track and its variants."""
+    first, second = (segment_xml(points) for points in _SEGMENTS)
+    yield 'plain', _GPX.format(first + second)
+    yield 'empty trailing segment', _GPX.format(first + second + EMPTY)
+    yield 'empty leading segment', _GPX.format(EMPTY + first + second)
+    yield 'empty middle segment', _GPX.format(first + EMPTY + second)
+    yield 'only empty segments', _GPX.format(EMPTY + EMPTY)
+
+
+def main():
+    tmp = tempfile.mkdtemp(prefix='wanderalbum-check-')
+    failures = 0
+    try:
+        cache = TrackCache(os.path.join(tmp, 'cache'))
+        expected = None
+        for name, text in variants():
+            path = os.path.join(tmp, f"{name.replace(' ', '_')}.gpx")
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(text)
+            for parser_name, parser in list(PARSERS.items()) + [('load', None)]:
+                try:
+                    track = cache.load(path) if parser is None else parser(path)
+                except Exception as e:
+                    print(f"✗ {name}, {parser_name}: {type(e).__name__}: {e}")
+                    failures += 1
+                    continue
+                if name == 'plain' and expected is None:
+                    expected = track
+                if name == 'only empty segments':
+                    ok = len(track) == 0 and len(track.dist) == 0
+                else:
+                    ok = (len(track) == len(expected)
+                          and np.allclose(track.dist, expected.dist)
+                          and track.distance > 0)
+                print(f"{'✓' if ok else '✗'} {name}, {parser_name}: {len(track)} points, "
+                      f"{track.distance:.1f} m")
+                failures += not ok
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,64 @@
+"""
+Report how much the polyline encoding shrinks the track geometry of the tour maps.
+
+Usage:
+    python benchmarks/report_encoding.py
+
+For every GPX file under files/ the map of ``build_map`` (simplified with the
+default tolerance) is rendered to HTML once with ``encoding='geojson'`` and
+once with ``encoding='polyline'``. The bytes of track geometry (GeoJSON
+coordinate arrays, respectively encoded strings plus the decoder) and the
+size of the whole page are printed. No screenshot is taken.
+"""
+
+import glob
+import json
+import os
+import sys
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(BASE_DIR, 'scripts'))
+
+from polyline import DECODER_JS, EncodedTrack
+from scripts import build_map
+
+
+def geometry_bytes(m):
+    """Return the bytes the track geometry of a map takes in its page."""
+    size = 0
+    for child in m._children.values():
+        if isinstance(child, EncodedTrack):
+            size += len(json.dumps(child.encoded)) + len(DECODER_JS)
+        elif hasattr(child, 'data') and isinstance(child.data, dict):
+            size += sum(len(json.dumps(feature['geometry']['coordinates']))
+                        for feature in child.data.get('features', []))
+    return size
+
+
+def main():
+    gpx_files = sorted(glob.glob(os.path.join(BASE_DIR, 'files', '*', '*', '*.gpx')))
+
+    totals = {'geojson': [0, 0], 'polyline': [0, 0]}
+    print(f"{'tour':<28}{'geojson':>10}{'html':>10}{'polyline':>10}{'html':>10}{'ratio':>8}")
+    for path in gpx_files:
+        row = f"{os.path.basename(os.path.dirname(path)):<28}"
+        sizes = {}
+        for encoding in totals:
+            m = build_map([46.8, 8.2], path, 'Track', encoding=encoding)
+            sizes[encoding] = geometry_bytes(m)
+            html = len(m.get_root().render().encode('utf-8'))
+            totals[encoding][0] += sizes[encoding]
+            totals[encoding][1] += html
+            row += f"{sizes[encoding] / 1024:>9.1f}K{html / 1024:>9.0f}K"
+        print(row + f"{sizes['geojson'] / sizes['polyline']:>7.1f}x")
+
+    (geometry, html), (encoded, encoded_html) = totals['geojson'], totals['polyline']
+    print(f"\nAll {len(gpx_files)} tours:")
+    print(f"  geometry: {geometry / 1024:.0f} KiB -> {encoded / 1024:.0f} KiB "
+          f"({geometry / encoded:.1f}x smaller)")
+    print(f"  pages:    {html / 1024:.0f} KiB -> {encoded_html / 1024:.0f} KiB "
+          f"({1 - encoded_html / html:.0%} less)")
+
+
+if __name__ == '__main__':
+    main()
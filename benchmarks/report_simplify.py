@@ -0,0 +1,66 @@
+"""
+Report how much track simplification shrinks the tour maps.
+
+Usage:
+    python benchmarks/report_simplify.py [tolerance_in_metres ...]
+
+For every GPX file under files/ the map built by ``create_map`` is rendered
+to HTML without and with simplification, and the number of track points and
+the HTML size are printed. No screenshot is taken.
+"""
+
+import glob
+import os
+import sys
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(BASE_DIR, 'scripts'))
+
+import folium
+
+from simplify import simplify_track
+from tracks import load_track
+
+
+def map_html(track):
+    m = folium.Map(location=[46.8, 8.2], zoom_start=13, tiles='OpenStreetMap')
+    features = [{
+        'type': 'Feature',
+        'geometry': {'type': 'LineString', 'coordinates': coordinates},
+        'properties': {'name': 'GPX Track Segment'}
+    } for coordinates in track.coordinates()]
+    layer = folium.GeoJson({'type': 'FeatureCollection', 'features': features},
+                           style_function=lambda x: {'color': 'red', 'weight': 3, 'opacity': 0.7}
+                           ).add_to(m)
+    m.fit_bounds(layer.get_bounds())
+    return m.get_root().render()
+
+
+def main():
+    tolerances = [float(t) for t in sys.argv[1:]] or [1.0, 2.0, 5.0]
+    gpx_files = sorted(glob.glob(os.path.join(BASE_DIR, 'files', '*', '*', '*.gpx')))
+
+    totals = {t: [0, 0] for t in [0.0] + tolerances}
+    print(f"{'tour':<28}{'points':>8}{'html':>10}" +
+          ''.join(f"{f'{t:g} m pts':>12}{'html':>10}" for t in tolerances))
+    for path in gpx_files:
+        track = load_track(path)
+        row = f"{os.path.basename(os.path.dirname(path)):<28}"
+        for t in totals:
+            small = simplify_track(track, t)
+            size = len(map_html(small).encode('utf-8'))
+            totals[t][0] += len(small)
+            totals[t][1] += size
+            row += f"{len(small):>{8 if t == 0 else 12}}{size / 1024:>9.0f}K"
+        print(row)
+
+    points, size = totals[0.0]
+    print(f"\nAll {len(gpx_files)} tours: {points} points, {size / 1024:.0f} KiB of HTML")
+    for t in tolerances:
+        p, s = totals[t]
+        print(f"  tolerance {t:g} m: {p} points ({p / points:.0%}), "
+              f"{s / 1024:.0f} KiB ({s / size:.0%})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+"""
+Stress test: render many tours in parallel into shared output directories.
+
+Usage:
+    python benchmarks/stress_outputs.py [--workers N] [--rounds N] [--tours N]
+
+Uses the static map backend and turns the memo cache off, so that every call
+really writes its files. Three checks:
+
+1. Reference outputs are rendered one after the other.
+2. Shared names: all workers render random tours with the default file names
+   into one directory (as two renders sharing a working directory would),
+   while a reader keeps opening the files. Every file the reader sees and
+   every final file must be a complete PNG equal to one of the references.
+3. Per-tour names: all tours are rendered at once into one directory with
+   ``output_name``; each file must equal its tour's reference.
+
+In all cases no temporary file may be left behind. Exits with status 1 on
+any failure.
+"""
+
+import argparse
+import filecmp
+import glob
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(BASE_DIR, 'scripts'))
+
+os.environ['WANDERALBUM_MEMO'] = '0'
+os.environ['WANDERALBUM_MAP_BACKEND'] = 'static'
+os.environ.setdefault('MPLBACKEND', 'Agg')
+
+from PIL import Image
+
+from tours import discover_tours
+
+KINDS = {
+    'map': 'map_output.png',
+    'profile': 'elevation_profile.png',
+    'qr': 'qr_tag.png',
+}
+
+
+def render(task):
+    """Render one output of a tour; ``task`` is (kind, tour dir, gpx, out dir, name)."""
+    import matplotlib.pyplot as plt
+    from scripts import create_map, generate_qr_code_for_url, profile
+
+    kind, directory, gpx, output_dir, output_name = task
+    if kind == 'map':
+        create_map([46.8, 8.2], gpx, 'Track', output_dir=output_dir, output_name=output_name)
+    elif kind == 'profile':
+        profile(gpx, output_dir=output_dir, output_name=output_name)
+        plt.close('all')
+    else:
+        generate_qr_code_for_url(f'https://example.org/{os.path.basename(directory)}',
+                                 output_dir=output_dir, output_name=output_name)
+    return task
+
+
+def check_png(path):
+    """Return True if ``path`` is a complete, decodable PNG."""
+    try:
+        with Image.open(path) as image:
+            image.load()
+        return True
+    except Exception:
+        return False
+
+
+def reader(directory, stop, bad):
+    """Keep opening the shared outputs until ``stop`` is set; count broken reads."""
+    while not stop.is_set():
+        for name in KINDS.values():
+            path = os.path.join(directory, name)
+            if os.path.exists(path):
+                try:
+                    with open(path, 'rb') as f:
+                        data = f.read()
+                except FileNotFoundError:
+                    continue
+                copy = os.path.join(tempfile.gettempdir(), f'.stress-read-{os.getpid()}.png')
+                with open(copy, 'wb') as f:
+                    f.write(data)
+                if not check_png(copy):
+                    with bad.get_lock():
+                        bad.value += 1
+                os.remove(copy)
+
+
+def leftovers(directory):
+    """Return temporary files left in ``directory``."""
+    return [p for p in glob.glob(os.path.join(directory, '**', '*'), recursive=True)
+            if '.tmp' in os.path.basename(p) or p.endswith('.html')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Parallel output stress test.')
+    parser.add_argument('--workers', type=int, default=max(4, os.cpu_count() or 1))
+    parser.add_argument('--rounds', type=int, default=3, help='passes over the tours in step 2')
+    parser.add_argument('--tours', type=int, default=8, help='number of tours to use')
+    args = parser.parse_args()
+
+    tours = discover_tours()[:args.tours]
+    root = tempfile.mkdtemp(prefix='wanderalbum-stress-')
+    failures = []
+    try:
+        # 1. References.
+        reference_dir = os.path.join(root, 'reference')
+        start = time.perf_counter()
+        for tour in tours:
+            for kind in KINDS:
+                render((kind, tour.directory, tour.gpx, reference_dir, f'{tour.slug}_{kind}.png'))
+        print(f"references: {len(tours) * len(KINDS)} files in {time.perf_counter() - start:.1f} s")
+
+        # 2. Shared default names in one directory, with a concurrent reader.
+        shared_dir = os.path.join(root, 'shared')
+        os.makedirs(shared_dir)
+        tasks = [(kind, t.directory, t.gpx, shared_dir, name)
+                 for _ in range(args.rounds) for t in tours for kind, name in KINDS.items()]
+        random.shuffle(tasks)
+        stop = multiprocessing.Event()
+        bad = multiprocessing.Value('i', 0)
+        watcher = multiprocessing.Process(target=reader, args=(shared_dir, stop, bad))
+        watcher.start()
+        start = time.perf_counter()
+        with multiprocessing.Pool(args.workers) as pool:
+            for _ in pool.imap_unordered(render, tasks):
+                pass
+        elapsed = time.perf_counter() - start
+        stop.set()
+        watcher.join()
+
+        for kind, name in KINDS.items():
+            final = os.path.join(shared_dir, name)
+            candidates = [os.path.join(reference_dir, f'{t.slug}_{kind}.png') for t in tours]
+            if not check_png(final) or not any(filecmp.cmp(final, c, shallow=False)
+                                               for c in candidates):
+                failures.append(f"shared: {name} is not a complete reference output")
+        if bad.value:
+            failures.append(f"shared: reader saw {bad.value} incomplete files")
+        print(f"shared names: {len(tasks)} renders by {args.workers} workers in {elapsed:.1f} s, "
+              f"{bad.value} incomplete reads")
+
+        # 3. Per-tour names in one directory.
+        tour_dir = os.path.join(root, 'per-tour')
+        tasks = [(kind, t.directory, t.gpx, tour_dir, f'{t.slug}_{kind}.png')
+                 for t in tours for kind in KINDS]
+        random.shuffle(tasks)
+        start = time.perf_counter()
+        with multiprocessing.Pool(args.workers) as pool:
+            for _ in pool.imap_unordered(render, tasks):
+                pass
+        elapsed = time.perf_counter() - start
+        for _, _, _, _, name in tasks:
+            if not filecmp.cmp(os.path.join(tour_dir, name), os.path.join(reference_dir, name),
+                               shallow=False):
+                failures.append(f"per-tour: {name} differs from its reference")
+        print(f"per-tour names: {len(tasks)} renders in {elapsed:.1f} s")
+
+        for directory in (shared_dir, tour_dir):
+            for path in leftovers(directory):
+                failures.append(f"left behind: {os.path.relpath(path, root)}")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    print('OK' if not failures else f"{len(failures)} failures")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
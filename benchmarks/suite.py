@@ -0,0 +1,416 @@
+"""
+Benchmark suite of the notebook helpers over the real GPX corpus.
+
+Usage:
+    python benchmarks/suite.py [--quick] [--repeat N] [--case NAME ...]
+                               [--screenshot mock|chrome] [--out FILE]
+                               [--baseline FILE] [--save-baseline]
+                               [--threshold 0.25]
+    python benchmarks/suite.py --compare OLD.json NEW.json
+
+The corpus is every GPX file under files/ plus synthetic tracks of
+SYNTHETIC_POINTS points (see ``bench_gpx_memory.write_synthetic_gpx``).
+Each case runs its helper over the corpus ``--repeat`` times:
+
+    gpx_parse          tracks.read_gpx, without the track cache
+    track_stats        stats.track_stats
+    profile_render     profiles.render_profile to PNG
+    profile            scripts.profile (memo cache off)
+    map_html_geojson   build_map + page HTML, encoding='geojson'
+    map_html_polyline  build_map + page HTML, encoding='polyline'
+    create_map         scripts.create_map (memo cache off)
+    swisstopo_url      create_swisstopo_url
+    swisstopo_link     create_swisstopo_link
+    qr_render          qr.render_qr, PNG and SVG
+    qr_generate        generate_qr_code_for_url (memo and QR cache off)
+
+``create_map`` takes its screenshot through ``screenshot.capture``. With
+``--screenshot mock`` (the default) that function is replaced by one that
+writes a blank PNG, so the suite runs without Chrome and measures
+everything but the browser.
+
+Results are written as JSON to ``.cache/benchmarks/latest.json`` (or
+``--out``) and compared per item with the baseline
+(``.cache/benchmarks/baseline.json`` or ``--baseline``), if there is one. A
+case is a regression if it got slower by more than ``--threshold`` and by
+more than NOISE_MS per item; the suite then exits with status 1.
+``--save-baseline`` makes the results the new baseline.
+"""
+
+import argparse
+import contextlib
+import datetime
+import glob
+import io
+import itertools
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from unittest import mock
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(BASE_DIR, 'scripts'))
+
+os.environ.setdefault('MPLBACKEND', 'Agg')
+
+import numpy as np
+
+import profiles
+import qr
+import screenshot
+import scripts as helpers
+import stats
+from bench_gpx_memory import write_synthetic_gpx
+from tracks import load_track, read_gpx
+
+RESULTS_DIR = os.path.join(BASE_DIR, '.cache', 'benchmarks')
+LATEST = os.path.join(RESULTS_DIR, 'latest.json')
+BASELINE = os.path.join(RESULTS_DIR, 'baseline.json')
+
+# Bump when the cases or the corpus change in a way that makes old results
+# incomparable.
+SUITE_VERSION = 1
+
+SYNTHETIC_POINTS = (20000, 100000)
+QUICK_TOURS = 8
+DEFAULT_THRESHOLD = 0.25
+# Differences below this many milliseconds per item are noise.
+NOISE_MS = 0.05
+
+GPX_URL = 'https://raw.githubusercontent.com/user/repo/main/{}'
+
+
+class Corpus:
+    """
+    The GPX files the cases run over.
+
+    Attributes:
+        real (list): GPX files under files/.
+        synthetic (list): Generated GPX files, in a temporary directory.
+        tmp (str): Scratch directory for outputs.
+    """
+
+    def __init__(self, quick=False):
+        self.tmp = tempfile.mkdtemp(prefix='wanderalbum-bench-')
+        self.real = sorted(glob.glob(os.path.join(BASE_DIR, 'files', '*', '*', '*.gpx')))
+        self.synthetic = []
+        if quick:
+            self.real = self.real[:QUICK_TOURS]
+        else:
+            for points in SYNTHETIC_POINTS:
+                path = os.path.join(self.tmp, f'synthetic_{points}.gpx')
+                write_synthetic_gpx(path, points)
+                self.synthetic.append(path)
+        self._tracks = {}
+
+    @property
+    def all(self):
+        return self.real + self.synthetic
+
+    def track(self, path):
+        if path not in self._tracks:
+            self._tracks[path] = load_track(path)
+        return self._tracks[path]
+
+    def center(self, path):
+        track = self.track(path)
+        return [round(float(np.mean(track.lat)), 5), round(float(np.mean(track.lon)), 5)]
+
+    def output(self, name):
+        return os.path.join(self.tmp, name)
+
+    def close(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+
+# Cases -----------------------------------------------------------------------
+# Each case returns the items to run over, the function to call per item and
+# how often to call it per item (for helpers that take microseconds).
+
+CASES = {}
+
+
+def case(func):
+    CASES[func.__name__] = func
+    return func
+
+
+@case
+def gpx_parse(corpus):
+    return corpus.all, read_gpx, 1
+
+
+@case
+def track_stats(corpus):
+    tracks = [corpus.track(path) for path in corpus.all]
+    return tracks, stats.track_stats, 1
+
+
+@case
+def profile_render(corpus):
+    tracks = [corpus.track(path) for path in corpus.all]
+    target = corpus.output('profile.png')
+    return tracks, lambda track: profiles.render_profile(track, target), 1
+
+
+@case
+def profile(corpus):
+    directory = corpus.output('profile')
+    return corpus.real, lambda path: helpers.profile(path, output_dir=directory), 1
+
+
+def _map_html(encoding):
+    def run(corpus):
+        return corpus.all, lambda path: helpers.build_map(
+            corpus.center(path), path, 'Track', encoding=encoding).get_root().render(), 1
+    return run
+
+
+CASES['map_html_geojson'] = _map_html('geojson')
+CASES['map_html_polyline'] = _map_html('polyline')
+
+
+@case
+def create_map(corpus):
+    directory = corpus.output('map')
+    return corpus.real, lambda path: helpers.create_map(
+        corpus.center(path), path, 'Track', output_dir=directory), 1
+
+
+@case
+def swisstopo_url(corpus):
+    items = [(corpus.center(path), GPX_URL.format(os.path.basename(path)))
+             for path in corpus.real]
+    return items, lambda item: helpers.create_swisstopo_url(*item), 1000
+
+
+@case
+def swisstopo_link(corpus):
+    items = [GPX_URL.format(os.path.basename(path)) for path in corpus.real]
+    return items, helpers.create_swisstopo_link, 1000
+
+
+@case
+def qr_render(corpus):
+    items = [GPX_URL.format(os.path.basename(path)) for path in corpus.real]
+
+    def run(url):
+        qr.render_qr(url, 'png')
+        qr.render_qr(url, 'svg')
+    return items, run, 1
+
+
+@case
+def qr_generate(corpus):
+    items = [GPX_URL.format(os.path.basename(path)) for path in corpus.real]
+    directory = corpus.output('qr')
+    return items, lambda url: helpers.generate_qr_code_for_url(url, output_dir=directory), 1
+
+
+# Running ---------------------------------------------------------------------
+
+def _blank_capture(html_path, output_filename, map_name=None, width=800, height=600,
+                   **kwargs):
+    from PIL import Image
+
+    Image.new('RGB', (width, height), 'white').save(output_filename, format='PNG')
+
+
+@contextlib.contextmanager
+def qr_cache_off(directory):
+    """
+    Give every ``qr.save_qr`` call an empty render cache below ``directory``.
+
+    ``generate_qr_code_for_url`` saves through qr.py's render cache, which
+    the warm-up pass would fill; with it, the case would time a file copy.
+    """
+    save_qr = qr.save_qr
+    counter = itertools.count()
+
+    def uncached(url, path, options=None, cache_dir=None):
+        save_qr(url, path, options, os.path.join(directory, str(next(counter))))
+
+    with mock.patch.object(qr, 'save_qr', uncached):
+        yield
+
+
+@contextlib.contextmanager
+def screenshot_mode(mode):
+    """Replace ``screenshot.capture`` by ``_blank_capture`` for ``'mock'``."""
+    if mode == 'mock':
+        with mock.patch.object(screenshot, 'capture', _blank_capture):
+            yield
+    else:
+        yield
+
+
+def run_case(name, corpus, repeat):
+    """
+    Time one case.
+
+    Returns:
+        dict: ``items``, ``number`` (calls per item), ``runs`` (seconds per
+            pass over all items), ``median``, ``min`` and ``per_item_ms``.
+    """
+    items, func, number = CASES[name](corpus)
+    # One untimed pass warms caches and imports.
+    with contextlib.redirect_stdout(io.StringIO()):
+        for item in items:
+            func(item)
+        runs = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for item in items:
+                for _ in range(number):
+                    func(item)
+            runs.append(time.perf_counter() - start)
+    median = statistics.median(runs)
+    return {
+        'items': len(items),
+        'number': number,
+        'runs': [round(r, 6) for r in runs],
+        'median': round(median, 6),
+        'min': round(min(runs), 6),
+        'per_item_ms': round(median / (len(items) * number) * 1000, 6) if items else 0.0,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=BASE_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(names, repeat=3, quick=False, screenshot='mock'):
+    """
+    Run the given cases and return the results document.
+
+    The memo cache and the QR render cache are turned off while the suite
+    runs, so every call does its work.
+    """
+    corpus = Corpus(quick)
+    results = {}
+    try:
+        with mock.patch.dict(os.environ, {'WANDERALBUM_MEMO': '0'}), \
+                qr_cache_off(corpus.output('qr-cache')), screenshot_mode(screenshot):
+            for name in names:
+                results[name] = run_case(name, corpus, repeat)
+                print(f"{name:<20}{results[name]['per_item_ms']:>12.3f} ms/item "
+                      f"({results[name]['items']} items, median of {repeat})", flush=True)
+    finally:
+        corpus.close()
+    return {
+        'version': SUITE_VERSION,
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'quick': quick,
+        'screenshot': screenshot,
+        'repeat': repeat,
+        'cases': results,
+    }
+
+
+# Comparing -------------------------------------------------------------------
+
+def compare(old, new, threshold=DEFAULT_THRESHOLD):
+    """
+    Compare two results documents case by case, per item.
+
+    Returns:
+        list: (case, old ms, new ms, relative change, status) for the cases
+            in both; status is ``'regression'``, ``'faster'`` or ``'ok'``.
+    """
+    rows = []
+    for name, result in new['cases'].items():
+        before = old.get('cases', {}).get(name)
+        if not before:
+            continue
+        a, b = before['per_item_ms'], result['per_item_ms']
+        change = (b - a) / a if a else 0.0
+        if change > threshold and b - a > NOISE_MS:
+            status = 'regression'
+        elif change < -threshold and a - b > NOISE_MS:
+            status = 'faster'
+        else:
+            status = 'ok'
+        rows.append((name, a, b, change, status))
+    return rows
+
+
+def print_comparison(rows, old, new):
+    print(f"\nVergleich mit {old.get('commit') or '?'} ({old.get('created')}):")
+    if old.get('screenshot') != new.get('screenshot') or old.get('quick') != new.get('quick'):
+        print("  (andere Einstellungen, Werte nur bedingt vergleichbar)")
+    marks = {'regression': '✗', 'faster': '+', 'ok': '✓'}
+    for name, a, b, change, status in rows:
+        print(f"  {marks[status]} {name:<20}{a:>10.3f} ->{b:>10.3f} ms/item {change:>+7.0%}")
+    regressions = [row for row in rows if row[4] == 'regression']
+    print(f"{len(regressions)} Regressionen in {len(rows)} Fällen")
+    return regressions
+
+
+def _load(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _save(path, document):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(document, f, indent=1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the notebook helpers.')
+    parser.add_argument('--case', dest='cases', action='append', choices=sorted(CASES),
+                        help='case to run, repeatable (default: all)')
+    parser.add_argument('--quick', action='store_true',
+                        help=f'only {QUICK_TOURS} tours and no synthetic tracks')
+    parser.add_argument('--repeat', type=int, default=3, help='timed passes per case')
+    parser.add_argument('--screenshot', choices=('mock', 'chrome'), default='mock',
+                        help='mock the browser screenshot of create_map (default) or use Chrome')
+    parser.add_argument('--out', default=LATEST, help='where to write the results')
+    parser.add_argument('--baseline', default=BASELINE, help='results to compare with')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='make these results the new baseline')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='relative slowdown that counts as a regression')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'),
+                        help='only compare two result files')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        old, new = (_load(path) for path in args.compare)
+        return 1 if print_comparison(compare(old, new, args.threshold), old, new) else 0
+
+    names = args.cases or list(CASES)
+    document = run_suite(names, args.repeat, args.quick, args.screenshot)
+    _save(args.out, document)
+    print(f"→ {os.path.relpath(args.out)}")
+
+    failed = False
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        old = _load(args.baseline)
+        if old.get('version') == SUITE_VERSION:
+            failed = bool(print_comparison(compare(old, document, args.threshold), old, document))
+        else:
+            print("Baseline von einer anderen Version der Suite, kein Vergleich")
+    if args.save_baseline:
+        _save(args.baseline, document)
+        print(f"→ {os.path.relpath(args.baseline)} (Baseline)")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
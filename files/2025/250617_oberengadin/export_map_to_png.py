@@ -12,11 +12,11 @@ Beispiele:
 
 import os
 import sys
-import time
 import folium
 import gpxpy
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'scripts'))
+from screenshot import capture
 
 # Kommandozeilenargumente verarbeiten
 output_filename = sys.argv[1] if len(sys.argv) > 1 else 'map_output.png'
@@ -93,18 +93,10 @@ m.save(tmpfile)
 
 # Screenshot mit Selenium erstellen
 print("Erstelle Screenshot mit Chrome (headless)...")
-options = Options()
-options.add_argument('--headless')
-options.add_argument('--no-sandbox')
-options.add_argument('--disable-dev-shm-usage')
-options.add_argument(f'--window-size={width},{height}')
 
 try:
-    driver = webdriver.Chrome(options=options)
-    driver.get(f'file://{os.path.abspath(tmpfile)}')
-    time.sleep(3)  # Warten bis Karte vollständig geladen ist
-    driver.save_screenshot(output_filename)
-    driver.quit()
+    # Wartet, bis alle Kacheln und der GPX-Track geladen sind
+    capture(tmpfile, output_filename, map_name=m.get_name(), width=width, height=height)
     print(f"✓ PNG erfolgreich erstellt: {output_filename}")
 except Exception as e:
     print(f"✗ Fehler beim Erstellen des Screenshots: {e}")
@@ -0,0 +1,319 @@
+"""
+Graph of the image references of the site: which document uses which asset.
+
+The notebooks (.ipynb) and Markdown pages (.md, .qmd) below files/ refer to
+images with relative paths, mostly into images/ (which is synced separately
+and not part of the repository). This module scans every document once with
+precompiled patterns and records an edge document -> asset per reference:
+
+    markdown images     ``![alt](path.png)`` in Markdown and markdown cells
+    quoted paths        ``"path.png"`` in code cells
+
+The images/ tree is listed once into an in-memory set, so checking the
+references needs no syscall per link. The graph answers
+
+    broken()          references whose file does not exist
+    orphans()         files in images/ no document refers to
+    impact(path)      references that change if a file or directory moves
+
+The edges are kept in ``.cache/asset_graph.json``; on the next run only
+documents whose size or modification time changed are scanned again.
+``verify_images.py`` and ``update_refs.py`` build on it.
+
+Usage:
+    python -m scripts.assets [broken | orphans | impact PATH] [--rescan]
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+try:
+    from .atomic import atomic_write
+    from .tours import BASE_DIR
+except ImportError:
+    from atomic import atomic_write
+    from tours import BASE_DIR
+
+
+GRAPH_PATH = os.path.join(BASE_DIR, '.cache', 'asset_graph.json')
+
+# Bump when the patterns or the file layout change, to rescan everything.
+GRAPH_VERSION = 1
+
+IMAGE_EXTENSIONS = ('png', 'jpg', 'jpeg', 'gif', 'webp')
+DOCUMENT_EXTENSIONS = ('.ipynb', '.md', '.qmd')
+
+_EXT = '(?:' + '|'.join(IMAGE_EXTENSIONS) + ')'
+# ``![alt](path)``; the alt text may span lines and contain links, remote
+# and absolute paths are not assets of the site.
+MARKDOWN_IMAGE = re.compile(r'!\[((?:[^\[\]]|\[[^\]]*\])*)\]\(((?!http|/|\\)[^)\n]+\.' + _EXT + r')\)')
+# ``"path"`` or ``'path'`` in code.
+QUOTED_IMAGE = re.compile(r'([\'"])((?!http|/|\\)[^\'"\n]+\.' + _EXT + r')\1')
+
+
+def _rel(path, base_dir):
+    return os.path.relpath(path, base_dir).replace(os.sep, '/')
+
+
+def scan_document(path, base_dir=BASE_DIR):
+    """
+    Return the image references of one document.
+
+    Args:
+        path (str): Absolute path of an .ipynb, .md or .qmd file.
+        base_dir (str, optional): Repository root the targets are relative to.
+
+    Returns:
+        list: [link as written, target relative to ``base_dir``] pairs, in
+            document order.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        content = f.read()
+
+    chunks = []
+    if path.endswith('.ipynb'):
+        for cell in json.loads(content).get('cells', []):
+            source = cell.get('source', '')
+            source = source if isinstance(source, str) else ''.join(source)
+            if cell.get('cell_type') == 'markdown':
+                chunks.append((MARKDOWN_IMAGE, source))
+            elif cell.get('cell_type') == 'code':
+                chunks.append((QUOTED_IMAGE, source))
+    else:
+        chunks.append((MARKDOWN_IMAGE, content))
+
+    directory = os.path.dirname(path)
+    references = []
+    for pattern, text in chunks:
+        for match in pattern.finditer(text):
+            link = match.group(2).strip()
+            target = _rel(os.path.normpath(os.path.join(directory, link)), base_dir)
+            references.append([link, target])
+    return references
+
+
+class AssetGraph:
+    """
+    Document -> asset edges plus a snapshot of the files they may point to.
+
+    Args:
+        base_dir (str, optional): Repository root.
+        documents (dict, optional): Document (relative path) -> entry with
+            ``stamp`` ([mtime_ns, size]) and ``refs`` (see ``scan_document``).
+
+    Attributes:
+        images (set): Files below images/, relative to ``base_dir``.
+    """
+
+    def __init__(self, base_dir=BASE_DIR, documents=None):
+        self.base_dir = base_dir
+        self.documents = documents or {}
+        self.images = set()
+        self._listings = {}
+
+    # Snapshot ---------------------------------------------------------------
+
+    def snapshot(self):
+        """List images/ into ``images`` and forget other cached listings."""
+        self._listings = {}
+        self.images = set()
+        root = os.path.join(self.base_dir, 'images')
+        for directory, _, names in os.walk(root):
+            rel_dir = _rel(directory, self.base_dir)
+            self._listings[rel_dir] = set(names)
+            self.images.update(f'{rel_dir}/{name}' for name in names)
+
+    def exists(self, target):
+        """Return True if ``target`` (relative to the root) exists, listing each directory once."""
+        directory, _, name = target.rpartition('/')
+        if directory not in self._listings:
+            try:
+                self._listings[directory] = set(os.listdir(os.path.join(self.base_dir, directory)))
+            except (FileNotFoundError, NotADirectoryError):
+                self._listings[directory] = set()
+        return name in self._listings[directory]
+
+    # Scanning ---------------------------------------------------------------
+
+    def update(self, files_dir=None, rescan=False):
+        """
+        Bring the edges up to date with the documents on disk.
+
+        Args:
+            files_dir (str, optional): Root of the documents. Defaults to files/.
+            rescan (bool, optional): Scan every document, even unchanged ones.
+
+        Returns:
+            tuple: (documents found, documents scanned)
+        """
+        files_dir = files_dir or os.path.join(self.base_dir, 'files')
+        seen = {}
+        for directory, dirs, names in os.walk(files_dir):
+            dirs[:] = [d for d in dirs if not d.startswith('.')]
+            for name in names:
+                if name.endswith(DOCUMENT_EXTENSIONS):
+                    path = os.path.join(directory, name)
+                    stat = os.stat(path)
+                    seen[_rel(path, self.base_dir)] = (path, [stat.st_mtime_ns, stat.st_size])
+
+        scanned = 0
+        documents = {}
+        for document, (path, stamp) in seen.items():
+            entry = self.documents.get(document)
+            if rescan or entry is None or entry['stamp'] != stamp:
+                try:
+                    refs = scan_document(path, self.base_dir)
+                except (OSError, ValueError) as e:
+                    print(f"Error reading {path}: {e}")
+                    refs = []
+                entry = {'stamp': stamp, 'refs': refs}
+                scanned += 1
+            documents[document] = entry
+        self.documents = documents
+        return len(seen), scanned
+
+    # Queries ----------------------------------------------------------------
+
+    def edges(self):
+        """Yield (document, link, target) for every reference."""
+        for document in sorted(self.documents):
+            for link, target in self.documents[document]['refs']:
+                yield document, link, target
+
+    def broken(self):
+        """Return (document, link) of every reference to a missing file."""
+        return [(document, link) for document, link, target in self.edges()
+                if not self.exists(target)]
+
+    def orphans(self):
+        """Return the files in images/ that no document refers to, sorted."""
+        used = {target for _, _, target in self.edges()}
+        # images/derived/ is written by derivatives.py and used via srcset.
+        return sorted(path for path in self.images - used
+                      if not path.startswith('images/derived/'))
+
+    def references_to(self, path):
+        """
+        Return the references to a file, or to anything below a directory.
+
+        Args:
+            path (str): Path relative to the root, e.g. ``'images/2026'``.
+
+        Returns:
+            list: (document, link, target) triples.
+        """
+        path = path.replace(os.sep, '/').strip('/')
+        return [(document, link, target) for document, link, target in self.edges()
+                if target == path or target.startswith(path + '/')]
+
+    def impact(self, old, new):
+        """
+        Return the link changes a move of ``old`` to ``new`` requires.
+
+        Args:
+            old (str): File or directory, relative to the root.
+            new (str): Its new location, relative to the root.
+
+        Returns:
+            list: (document, old link, new link) triples.
+        """
+        old = old.replace(os.sep, '/').strip('/')
+        new = new.replace(os.sep, '/').strip('/')
+        changes = []
+        for document, link, target in self.references_to(old):
+            moved = new + target[len(old):]
+            base = os.path.dirname(os.path.join(self.base_dir, document))
+            new_link = os.path.relpath(os.path.join(self.base_dir, moved), base)
+            changes.append((document, link, new_link.replace(os.sep, '/')))
+        return changes
+
+    # Persistence ------------------------------------------------------------
+
+    def save(self, path=GRAPH_PATH):
+        """Store the edges (not the snapshot) in ``path``."""
+        atomic_write(path, json.dumps({'version': GRAPH_VERSION, 'documents': self.documents},
+                                      ensure_ascii=False, separators=(',', ':')))
+
+    @classmethod
+    def load(cls, path=GRAPH_PATH, base_dir=BASE_DIR):
+        """Return the graph stored in ``path``, or an empty one."""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return cls(base_dir)
+        if data.get('version') != GRAPH_VERSION:
+            return cls(base_dir)
+        return cls(base_dir, data.get('documents'))
+
+
+def build_graph(base_dir=BASE_DIR, path=GRAPH_PATH, rescan=False):
+    """
+    Return the up-to-date graph of ``base_dir``, with a fresh snapshot.
+
+    Only documents that changed since the graph was stored are scanned; the
+    graph is stored again if any were.
+
+    Args:
+        base_dir (str, optional): Repository root.
+        path (str, optional): Where the graph is kept. The default is only
+            used for the repository itself.
+        rescan (bool, optional): Scan every document.
+
+    Returns:
+        AssetGraph: The graph.
+    """
+    if path == GRAPH_PATH and os.path.abspath(base_dir) != BASE_DIR:
+        path = os.path.join(base_dir, '.cache', 'asset_graph.json')
+    graph = AssetGraph.load(path, base_dir)
+    before = set(graph.documents)
+    _, scanned = graph.update(rescan=rescan)
+    if scanned or set(graph.documents) != before:
+        graph.save(path)
+    graph.snapshot()
+    return graph
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Image references of the site.')
+    parser.add_argument('command', nargs='?', default='broken',
+                        choices=('broken', 'orphans', 'impact'))
+    parser.add_argument('paths', nargs='*',
+                        help='impact: file or directory to move, and optionally its new place')
+    parser.add_argument('--rescan', action='store_true', help='scan every document again')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    graph = build_graph(rescan=args.rescan)
+    if args.command == 'broken':
+        items = graph.broken()
+        for document, link in items:
+            print(f"{document}: {link}")
+        print(f"{len(items)} fehlende Bilder in {len(graph.documents)} Dokumenten")
+    elif args.command == 'orphans':
+        items = graph.orphans()
+        for path in items:
+            print(path)
+        print(f"{len(items)} von {len(graph.images)} Bildern werden nicht verwendet")
+    else:
+        if not args.paths:
+            parser.error('impact needs a path')
+        if len(args.paths) > 1:
+            items = graph.impact(args.paths[0], args.paths[1])
+            for document, old, new in items:
+                print(f"{document}: {old} -> {new}")
+        else:
+            items = graph.references_to(args.paths[0])
+            for document, link, _ in items:
+                print(f"{document}: {link}")
+        print(f"{len(items)} Verweise in {len({item[0] for item in items})} Dokumenten")
+    print(f"({time.perf_counter() - start:.3f} s)", file=sys.stderr)
+    return 1 if args.command == 'broken' and items else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
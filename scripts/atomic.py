@@ -0,0 +1,61 @@
+"""
+Helpers for writing files atomically.
+
+Files are first written to a uniquely named temporary file next to the
+target and then moved into place with ``os.replace``. Readers (and parallel
+writers) therefore only ever see either the old or the complete new file.
+"""
+
+import os
+import tempfile
+from contextlib import contextmanager
+
+# mkstemp creates files readable only by the owner; published files get the
+# permissions a plain open() would have given them.
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+@contextmanager
+def atomic_path(path):
+    """
+    Yield a temporary path that is renamed to ``path`` on success.
+
+    The temporary file lives in the same directory as ``path`` so that the
+    final rename stays on one file system. If the block raises, the temporary
+    file is removed and ``path`` is left untouched.
+
+    Args:
+        path (str): Final location of the file.
+
+    Yields:
+        str: Path to write the new content to.
+    """
+    directory, name = os.path.split(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    stem, ext = os.path.splitext(name)
+    fd, tmp_path = tempfile.mkstemp(prefix=f'.{stem}.', suffix=f'.tmp{ext}', dir=directory)
+    os.close(fd)
+    os.chmod(tmp_path, 0o666 & ~_UMASK)
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def atomic_write(path, data):
+    """
+    Atomically replace ``path`` with ``data``.
+
+    Args:
+        path (str): File to write.
+        data (bytes or str): New content. Strings are written as UTF-8.
+    """
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    with atomic_path(path) as tmp_path:
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
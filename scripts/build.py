@@ -0,0 +1,311 @@
+"""
+Incremental, parallel build of the generated assets of every tour.
+
+For each tour directory under files/ (see ``tours.py``) the build produces
+the files the notebooks otherwise create as a side effect of being executed:
+
+    map_output.png          map screenshot (create_map)
+    elevation_profile.png   elevation profile (profile)
+    qr_tag.png              QR code of the URL the notebook passes to
+                            generate_qr_code_for_url
+    app_qr_tag.png          QR code of the swisstopo app link
+
+Every output has a key made from the hashes of its inputs (GPX file,
+parameters and the helper modules that render it). Keys are kept in
+``.cache/build_manifest.json``; only outputs whose key changed or which are
+missing are rebuilt, on a process pool. A static map drawn with missing
+tiles is written but not recorded, so it is drawn again once the tiles are
+there.
+
+Usage:
+    python -m scripts.build [--jobs N] [--force] [--dry-run]
+                            [--backend browser|static] [tour ...]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+try:
+    from .atomic import atomic_write
+    from .tours import BASE_DIR, discover_tours, wgs84_to_lv95
+    from .tracing import span
+    from .tracks import file_sha256
+except ImportError:
+    from atomic import atomic_write
+    from tours import BASE_DIR, discover_tours, wgs84_to_lv95
+    from tracing import span
+    from tracks import file_sha256
+
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+MANIFEST = os.path.join(BASE_DIR, '.cache', 'build_manifest.json')
+
+# Helper modules each kind of output depends on.
+CODE = {
+    'map': ('scripts.py', 'profiles.py', 'polyline.py', 'tracks.py', 'simplify.py',
+            'static_map.py', 'screenshot.py'),
+    'profile': ('scripts.py', 'profiles.py', 'tracks.py', 'stats.py'),
+    'qr': ('scripts.py', 'qr.py'),
+}
+
+
+class Job:
+    """
+    One output file and everything it is built from.
+
+    Attributes:
+        kind (str): ``'map'``, ``'profile'`` or ``'qr'``.
+        output (str): Absolute path of the file to produce.
+        inputs (tuple): Input files whose content goes into the key.
+        params (dict): JSON-serialisable parameters passed to the renderer.
+        key (str): Hash over kind, code, inputs and parameters.
+        missing_tiles (list): Tiles a static map was drawn without; set by
+            ``run_job``.
+    """
+
+    def __init__(self, kind, output, inputs=(), params=None):
+        self.kind = kind
+        self.output = output
+        self.inputs = tuple(inputs)
+        self.params = params or {}
+        self.key = None
+        self.missing_tiles = []
+
+    def __repr__(self):
+        return f"Job({self.kind}, {os.path.relpath(self.output, BASE_DIR)})"
+
+
+class _Hasher:
+    """Hashes files once per build run."""
+
+    def __init__(self):
+        self._hashes = {}
+
+    def __call__(self, path):
+        if path not in self._hashes:
+            self._hashes[path] = file_sha256(path)
+        return self._hashes[path]
+
+
+def job_key(job, hasher):
+    """Return the input hash of ``job``."""
+    digest = hashlib.sha256()
+    digest.update(job.kind.encode())
+    for name in CODE[job.kind]:
+        digest.update(hasher(os.path.join(SCRIPTS_DIR, name)).encode())
+    for path in job.inputs:
+        digest.update(hasher(path).encode())
+    digest.update(json.dumps(job.params, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+def plan(tours, backend='browser', width=800, height=600):
+    """
+    Return the jobs (the dependency graph) for ``tours``.
+
+    Args:
+        tours (list): Tour objects from ``tours.discover_tours``.
+        backend (str, optional): Map backend, ``'browser'`` or ``'static'``.
+        width (int, optional): Map width in pixels.
+        height (int, optional): Map height in pixels.
+
+    Returns:
+        list: Job objects.
+    """
+    jobs = []
+    for tour in tours:
+        variables = tour.variables
+        center, _ = map_center(tour)
+
+        def output(name):
+            return os.path.join(tour.directory, name)
+
+        jobs.append(Job('map', output('map_output.png'), [tour.gpx], {
+            'center': center,
+            'title': tour.metadata.get('title', tour.slug),
+            'width': width,
+            'height': height,
+            'backend': backend,
+            # Tile sources of the static and the browser backend.
+            'tile_dir': os.environ.get('WANDERALBUM_TILE_DIR'),
+            'tile_server': os.environ.get('WANDERALBUM_TILE_SERVER'),
+        }))
+        jobs.append(Job('profile', output('elevation_profile.png'), [tour.gpx]))
+        if 'qr_url' in variables:
+            # The notebook writes qr_tag.png too; use the same URL.
+            jobs.append(Job('qr', output('qr_tag.png'), params={
+                'link': 'notebook', 'url': variables['qr_url']}))
+        jobs.append(Job('qr', output('app_qr_tag.png'), params={
+            'link': 'app', 'gpx_url': tour.gpx_url}))
+    return jobs
+
+
+def map_center(tour):
+    """
+    Return the map centre of a tour, as set in its notebook or from its track.
+
+    Returns:
+        tuple: ([lat, lon], [east, north] in LV95)
+    """
+    variables = tour.variables
+    center = variables.get('center')
+    swiss_grid = variables.get('swiss_grid')
+    if center is None or swiss_grid is None:
+        from_track = _track_center(tour.gpx)
+        center = center or from_track
+        swiss_grid = swiss_grid or wgs84_to_lv95(*from_track)
+    return center, swiss_grid
+
+
+def _track_center(gpx):
+    try:
+        from .tracks import load_track
+    except ImportError:
+        from tracks import load_track
+
+    min_lat, min_lon, max_lat, max_lon = load_track(gpx).bounds()
+    return [round((min_lat + max_lat) / 2, 6), round((min_lon + max_lon) / 2, 6)]
+
+
+def _helpers():
+    os.environ.setdefault('MPLBACKEND', 'Agg')
+    try:
+        from . import scripts
+    except ImportError:
+        import scripts
+    return scripts
+
+
+def run_job(job):
+    """
+    Build one output (in a worker process) and publish it atomically.
+
+    Returns:
+        tuple: (job, error message or None, seconds taken)
+    """
+    start = time.perf_counter()
+    try:
+        helpers = _helpers()
+        params = job.params
+        # The helpers publish their output with an atomic rename.
+        with span(f'build.{job.kind}', path=job.output):
+            if job.kind == 'map':
+                m = helpers.build_map(params['center'], job.inputs[0], params['title'])
+                job.missing_tiles = helpers.save_map_png(
+                    m, job.output, params['width'], params['height'], params['backend'])
+            elif job.kind == 'profile':
+                helpers.profiles.render_profile(helpers.load_track(job.inputs[0]), job.output)
+            elif job.kind == 'qr':
+                if params['link'] == 'notebook':
+                    url = params['url']
+                else:
+                    url = helpers.create_swisstopo_link(params['gpx_url'])
+                helpers.save_qr_code(url, job.output)
+    except Exception as e:
+        return job, f"{type(e).__name__}: {e}", time.perf_counter() - start
+    return job, None, time.perf_counter() - start
+
+
+def read_manifest(path=MANIFEST):
+    """Return the output -> key mapping of the last build."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def build(tours=None, workers=None, force=False, dry_run=False, backend=None,
+          manifest_path=MANIFEST):
+    """
+    Rebuild every output whose inputs changed.
+
+    Args:
+        tours (list, optional): Tours to build. Defaults to all tours.
+        workers (int, optional): Size of the process pool. Defaults to the
+            number of CPUs.
+        force (bool, optional): Rebuild everything.
+        dry_run (bool, optional): Only report what would be rebuilt.
+        backend (str, optional): Map backend. Defaults to the
+            ``WANDERALBUM_MAP_BACKEND`` environment variable or ``'browser'``.
+        manifest_path (str, optional): Where the keys are stored.
+
+    Returns:
+        tuple: (jobs that were out of date, failed jobs with their errors)
+    """
+    tours = discover_tours() if tours is None else tours
+    backend = backend or os.environ.get('WANDERALBUM_MAP_BACKEND', 'browser')
+    manifest = read_manifest(manifest_path)
+    hasher = _Hasher()
+
+    stale = []
+    for job in plan(tours, backend):
+        job.key = job_key(job, hasher)
+        name = os.path.relpath(job.output, BASE_DIR).replace(os.sep, '/')
+        if force or manifest.get(name) != job.key or not os.path.exists(job.output):
+            stale.append(job)
+
+    if dry_run or not stale:
+        return stale, []
+
+    # One browser per worker process is plenty.
+    os.environ.setdefault('WANDERALBUM_BROWSERS', '1')
+    failed = []
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(run_job, job) for job in stale]
+            for future in as_completed(futures):
+                job, error, seconds = future.result()
+                name = os.path.relpath(job.output, BASE_DIR).replace(os.sep, '/')
+                if error:
+                    failed.append((job, error))
+                    manifest.pop(name, None)
+                    print(f"✗ {name}: {error}")
+                elif job.missing_tiles:
+                    manifest.pop(name, None)
+                    print(f"! {name}: {len(job.missing_tiles)} Kacheln fehlen, "
+                          f"z.B. {job.missing_tiles[0]}")
+                else:
+                    manifest[name] = job.key
+                    print(f"✓ {name} ({seconds:.1f} s)")
+    finally:
+        atomic_write(manifest_path, json.dumps(manifest, indent=1, sort_keys=True))
+    return stale, failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build the generated assets of all tours.')
+    parser.add_argument('tours', nargs='*',
+                        help='tour directories to build (default: all)')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='number of worker processes (default: CPU count)')
+    parser.add_argument('--force', action='store_true', help='rebuild everything')
+    parser.add_argument('--dry-run', action='store_true', help='only list stale outputs')
+    parser.add_argument('--backend', choices=('browser', 'static'), default=None,
+                        help='how map PNGs are rendered')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    tours = discover_tours()
+    if args.tours:
+        wanted = {os.path.basename(os.path.normpath(t)) for t in args.tours}
+        tours = [t for t in tours if t.slug in wanted]
+
+    stale, failed = build(tours, args.jobs, args.force, args.dry_run, args.backend)
+    if args.dry_run:
+        for job in stale:
+            print(os.path.relpath(job.output, BASE_DIR))
+        print(f"{len(stale)} outputs out of date for {len(tours)} tours")
+        return 0
+    print(f"{len(stale) - len(failed)} of {len(stale)} outputs rebuilt for "
+          f"{len(tours)} tours in {time.perf_counter() - start:.2f} s")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
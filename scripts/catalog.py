@@ -0,0 +1,251 @@
+"""
+Catalog of all tours, computed from the GPX files and ``_metadata.yml``.
+
+Scans files/ once and writes one row per tour with the computed statistics,
+bounding box, centroid, date, canton and the paths of its assets, so that
+listing pages and tools can query all tours without executing notebooks.
+Two forms are written:
+
+    files/catalog.json   list of rows, for the website and for humans
+    files/catalog.npz    the same data as columns (NumPy arrays)
+
+Each row carries a key made from the hashes of the tour's GPX file,
+metadata and notebook. A rebuild only recomputes rows whose key changed.
+
+Usage:
+    python -m scripts.catalog [--force] [tour ...]
+
+    from catalog import load_columns
+    columns = load_columns()
+    long_tours = columns['slug'][columns['distance'] > 15000]
+"""
+
+import argparse
+import hashlib
+import io
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+try:
+    from .atomic import atomic_write
+    from .stats import track_stats
+    from .tours import BASE_DIR, FILES_DIR, discover_tours, wgs84_to_lv95
+    from .tracks import file_sha256, load_track
+except ImportError:
+    from atomic import atomic_write
+    from stats import track_stats
+    from tours import BASE_DIR, FILES_DIR, discover_tours, wgs84_to_lv95
+    from tracks import file_sha256, load_track
+
+
+CATALOG_JSON = os.path.join(FILES_DIR, 'catalog.json')
+CATALOG_NPZ = os.path.join(FILES_DIR, 'catalog.npz')
+
+# Bump when the content of a row changes, to invalidate all rows.
+CATALOG_VERSION = 1
+
+ASSETS = {
+    'map': 'map_output.png',
+    'profile': 'elevation_profile.png',
+    'qr': 'qr_tag.png',
+    'app_qr': 'app_qr_tag.png',
+}
+
+# Columns of the binary form and their dtypes. Strings get the width of
+# their longest value.
+COLUMNS = {
+    'slug': str,
+    'year': np.int16,
+    'date': 'datetime64[D]',
+    'canton': str,
+    'title': str,
+    'distance': np.float64,
+    'ascent': np.float64,
+    'descent': np.float64,
+    'min_elevation': np.float64,
+    'max_elevation': np.float64,
+    'marschzeit': np.float64,
+    'points': np.int32,
+    'bbox': np.float64,
+    'centroid': np.float64,
+}
+
+
+def tour_key(tour):
+    """Return the hash over everything a catalog row is computed from."""
+    digest = hashlib.sha256(f"catalog-{CATALOG_VERSION}".encode())
+    digest.update(file_sha256(tour.gpx).encode())
+    for path in (os.path.join(os.path.dirname(tour.directory), '_metadata.yml'),
+                 os.path.join(tour.directory, '_metadata.yml'),
+                 tour.notebook):
+        if path and os.path.exists(path):
+            digest.update(file_sha256(path).encode())
+    return digest.hexdigest()
+
+
+def _rounded(value, digits):
+    return None if value != value else round(value, digits)
+
+
+def tour_row(tour, key=None):
+    """
+    Compute the catalog row of one tour.
+
+    Args:
+        tour (Tour): The tour.
+        key (str, optional): Its key, if already computed.
+
+    Returns:
+        dict: The row. Lengths and elevations are in metres, the hiking
+        time in minutes, coordinates in degrees (WGS84) and LV95 metres.
+    """
+    track = load_track(tour.gpx)
+    stats = track_stats(track)
+    if len(track):
+        min_lat, min_lon, max_lat, max_lon = track.bounds()
+        centroid = [round(float(np.mean(track.lat)), 6), round(float(np.mean(track.lon)), 6)]
+    else:
+        min_lat = min_lon = max_lat = max_lon = float('nan')
+        centroid = [None, None]
+
+    # The paths the build writes to (see build.py), whether built yet or not.
+    assets = {name: f"{tour.rel_dir}/{filename}" for name, filename in ASSETS.items()}
+
+    return {
+        'slug': tour.slug,
+        'year': int(tour.year),
+        'date': tour.date.isoformat(),
+        'title': tour.title,
+        'canton': tour.metadata.get('canton'),
+        'author': tour.metadata.get('author'),
+        'page': tour.page_url,
+        'gpx': f"{tour.rel_dir}/{os.path.basename(tour.gpx)}",
+        'assets': assets,
+        'distance': round(stats.distance, 1),
+        'ascent': round(stats.ascent, 1),
+        'descent': round(stats.descent, 1),
+        'min_elevation': _rounded(stats.min_elevation, 1),
+        'max_elevation': _rounded(stats.max_elevation, 1),
+        'marschzeit': round(stats.marschzeit, 1),
+        'points': len(track),
+        'bbox': [_rounded(v, 6) for v in (min_lat, min_lon, max_lat, max_lon)],
+        'centroid': centroid,
+        'centroid_lv95': wgs84_to_lv95(*centroid) if centroid[0] is not None else None,
+        'key': key or tour_key(tour),
+    }
+
+
+def load_catalog(path=CATALOG_JSON):
+    """Return the rows of the catalog, or [] if it was not built yet."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)['tours']
+    except (FileNotFoundError, ValueError, KeyError):
+        return []
+
+
+def columns(rows):
+    """
+    Convert catalog rows to NumPy columns.
+
+    Args:
+        rows (list): Catalog rows.
+
+    Returns:
+        dict: Column name -> numpy.ndarray, in row order. ``bbox`` has shape
+        (n, 4) and ``centroid`` shape (n, 2); missing values are NaN.
+    """
+    result = {}
+    for name, dtype in COLUMNS.items():
+        values = [row[name] for row in rows]
+        if dtype is str:
+            result[name] = np.array([v or '' for v in values], dtype=str)
+        elif name in ('bbox', 'centroid'):
+            width = 4 if name == 'bbox' else 2
+            result[name] = np.array([[np.nan if x is None else x for x in v] for v in values],
+                                    dtype=dtype).reshape(len(rows), width)
+        elif dtype == np.float64:
+            result[name] = np.array([np.nan if v is None else v for v in values], dtype=dtype)
+        else:
+            result[name] = np.array(values, dtype=dtype)
+    return result
+
+
+def load_columns(path=CATALOG_NPZ):
+    """Return the columnar catalog as a dict of NumPy arrays."""
+    with np.load(path) as data:
+        return {name: data[name] for name in data.files}
+
+
+def write_catalog(rows, json_path=CATALOG_JSON, npz_path=CATALOG_NPZ):
+    """Write the rows in both forms, atomically."""
+    document = {'version': CATALOG_VERSION, 'tours': rows}
+    atomic_write(json_path, json.dumps(document, ensure_ascii=False, separators=(',', ':')))
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, **columns(rows))
+    atomic_write(npz_path, buffer.getvalue())
+
+
+def build_catalog(tours=None, force=False, json_path=CATALOG_JSON, npz_path=CATALOG_NPZ):
+    """
+    Bring the catalog up to date.
+
+    Args:
+        tours (list, optional): Tours to check. Defaults to all tours, in
+            which case rows of tours that no longer exist are dropped. When a
+            subset is given, the other rows are kept as they are.
+        force (bool, optional): Recompute every checked row.
+        json_path (str, optional): Path of the JSON catalog.
+        npz_path (str, optional): Path of the columnar catalog.
+
+    Returns:
+        tuple: (all rows, slugs of the rows that were recomputed)
+    """
+    complete = tours is None
+    tours = discover_tours() if complete else tours
+    previous = {row['slug']: row for row in load_catalog(json_path)}
+
+    rows = {} if complete else dict(previous)
+    updated = []
+    for tour in tours:
+        key = tour_key(tour)
+        row = previous.get(tour.slug)
+        if force or row is None or row.get('key') != key:
+            row = tour_row(tour, key)
+            updated.append(tour.slug)
+        rows[tour.slug] = row
+
+    rows = sorted(rows.values(), key=lambda row: (row['date'], row['slug']))
+    if updated or set(previous) != {row['slug'] for row in rows} \
+            or not os.path.exists(npz_path):
+        write_catalog(rows, json_path, npz_path)
+    return rows, updated
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build the catalog of all tours.')
+    parser.add_argument('tours', nargs='*',
+                        help='tour directories to update (default: all)')
+    parser.add_argument('--force', action='store_true', help='recompute every row')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    tours = None
+    if args.tours:
+        wanted = {os.path.basename(os.path.normpath(t)) for t in args.tours}
+        tours = [t for t in discover_tours() if t.slug in wanted]
+    rows, updated = build_catalog(tours, args.force)
+    for slug in updated:
+        print(f"✓ {slug}")
+    print(f"{len(updated)} of {len(rows)} tours updated in "
+          f"{time.perf_counter() - start:.2f} s → "
+          f"{os.path.relpath(CATALOG_JSON, BASE_DIR)}, {os.path.relpath(CATALOG_NPZ, BASE_DIR)}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
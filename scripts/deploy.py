@@ -0,0 +1,345 @@
+"""
+Minimal uploads of the rendered site (docs/) to the bucket.
+
+``rclone sync docs <remote>`` asks the bucket about every file and uploads
+whatever differs in size or time, and ``quarto render`` touches every file.
+This module instead hashes docs/ and compares the hashes with the manifest of
+the last deploy, which is kept in the bucket itself:
+
+    <remote>/.deploy-manifest.json      relative path -> [hash, size]
+
+Only files whose content changed are uploaded (``rclone copy --files-from``)
+and only files that disappeared are deleted (``rclone delete --files-from``);
+the new manifest is uploaded last, so an interrupted deploy is simply
+repeated. The lists are written to ``.cache/deploy/`` and can be used with
+rclone by hand as well.
+
+Some generated outputs differ from render to render without any change in
+content; the hashes are taken over a normalised form of them:
+
+    .html   folium/branca element ids (``map_<32 hex digits>`` etc.) are
+            random on every run; they are numbered in order of appearance
+    .png    text and time chunks (matplotlib writes its version)
+    .svg    ``<dc:date>`` metadata
+    .pdf    ``/CreationDate`` and ``/ModDate``
+
+The files themselves are uploaded unchanged. Hashes are remembered in
+``.cache/deploy/hashes.json`` by size and modification time.
+
+The destination may also be a local directory, which stands in for the
+bucket in tests: it is updated with plain file operations instead of rclone.
+Files put into the bucket without this tool are not known to the manifest and
+not deleted; a full ``rclone sync`` now and then removes them.
+
+Usage:
+    python -m scripts.deploy [DEST] [--dry-run] [--docs DIR] [--jobs N]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from .atomic import atomic_path, atomic_write
+    from .tours import BASE_DIR
+except ImportError:
+    from atomic import atomic_path, atomic_write
+    from tours import BASE_DIR
+
+
+DOCS_DIR = os.path.join(BASE_DIR, 'docs')
+CACHE_DIR = os.path.join(BASE_DIR, '.cache', 'deploy')
+DEFAULT_DEST = 'cloudflare-r2:wanderalbum-web'
+MANIFEST_NAME = '.deploy-manifest.json'
+
+# Bump when the normalisation changes; the hashes of the previous manifest
+# are then not comparable and everything is uploaded once.
+MANIFEST_VERSION = 1
+
+_FOLIUM_ID = re.compile(rb'(?<=[a-z]_)[0-9a-f]{32}(?![0-9a-f])')
+_SVG_DATE = re.compile(rb'<dc:date>[^<]*</dc:date>')
+_PDF_DATE = re.compile(rb'/(?:CreationDate|ModDate) ?\([^)]*\)')
+_PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+_PNG_VOLATILE = {b'tEXt', b'zTXt', b'iTXt', b'tIME'}
+# rclone remotes look like ``name:path``; ``C:\...`` is a local path.
+_REMOTE = re.compile(r'^[\w.-]{2,}:')
+
+
+def _strip_png(data):
+    """Return a PNG without its text and time chunks."""
+    if not data.startswith(_PNG_SIGNATURE):
+        return data
+    chunks = [_PNG_SIGNATURE]
+    pos = len(_PNG_SIGNATURE)
+    while pos + 8 <= len(data):
+        length = int.from_bytes(data[pos:pos + 4], 'big')
+        end = pos + 12 + length
+        if data[pos + 4:pos + 8] not in _PNG_VOLATILE:
+            chunks.append(data[pos:end])
+        pos = end
+    return b''.join(chunks)
+
+
+def _number_ids(data):
+    numbers = {}
+    return _FOLIUM_ID.sub(
+        lambda m: numbers.setdefault(m.group(0), b'%032d' % len(numbers)), data)
+
+
+def normalize(name, data):
+    """
+    Return the content of a file without its render-to-render noise.
+
+    Args:
+        name (str): File name; its extension selects the normalisation.
+        data (bytes): Content of the file.
+
+    Returns:
+        bytes: The normalised content, ``data`` itself for other files.
+    """
+    ext = os.path.splitext(name)[1].lower()
+    if ext in ('.html', '.htm'):
+        return _number_ids(data)
+    if ext == '.png':
+        return _strip_png(data)
+    if ext == '.svg':
+        return _SVG_DATE.sub(b'', data)
+    if ext == '.pdf':
+        return _PDF_DATE.sub(b'', data)
+    return data
+
+
+def file_hash(path):
+    """Return the SHA-256 (hex) of the normalised content of a file."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    return hashlib.sha256(normalize(path, data)).hexdigest()
+
+
+def _load_json(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def scan(docs_dir=DOCS_DIR, cache_dir=CACHE_DIR, workers=None):
+    """
+    Hash every file below ``docs_dir``.
+
+    Files whose size and modification time are unchanged since the last
+    scan keep their hash; the others are hashed on a thread pool.
+
+    Args:
+        docs_dir (str, optional): Rendered site.
+        cache_dir (str, optional): Where the hashes are remembered.
+        workers (int, optional): Threads. Defaults to the number of CPUs.
+
+    Returns:
+        dict: Relative path (with ``/``) -> [hash, size], sorted by path.
+    """
+    cache_path = os.path.join(cache_dir, 'hashes.json')
+    cache = _load_json(cache_path) or {}
+    if cache.get('version') != MANIFEST_VERSION or cache.get('docs') != os.path.abspath(docs_dir):
+        cache = {}
+    known = cache.get('files', {})
+
+    stamps = {}
+    for directory, dirs, names in os.walk(docs_dir):
+        dirs.sort()
+        for name in names:
+            path = os.path.join(directory, name)
+            rel = os.path.relpath(path, docs_dir).replace(os.sep, '/')
+            if rel == MANIFEST_NAME:
+                continue
+            stat = os.stat(path)
+            stamps[rel] = [stat.st_mtime_ns, stat.st_size]
+
+    entries = {rel: known[rel] for rel, stamp in stamps.items()
+               if rel in known and known[rel][:2] == stamp}
+    todo = sorted(set(stamps) - set(entries))
+    if todo:
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+            paths = (os.path.join(docs_dir, rel) for rel in todo)
+            for rel, digest in zip(todo, pool.map(file_hash, paths)):
+                entries[rel] = stamps[rel] + [digest]
+        atomic_write(cache_path, json.dumps({'version': MANIFEST_VERSION,
+                                             'docs': os.path.abspath(docs_dir),
+                                             'files': entries}, separators=(',', ':')))
+
+    return {rel: [entries[rel][2], entries[rel][1]] for rel in sorted(entries)}
+
+
+def plan(current, previous):
+    """
+    Compare two manifests.
+
+    Args:
+        current (dict): Files of the new deploy, see ``scan``.
+        previous (dict or None): Files of the last deploy; None if unknown.
+
+    Returns:
+        tuple: (paths to upload, paths to delete), both sorted.
+    """
+    previous = previous or {}
+    upload = [rel for rel, entry in current.items()
+              if rel not in previous or previous[rel][0] != entry[0]]
+    delete = sorted(set(previous) - set(current))
+    return upload, delete
+
+
+# Destinations ----------------------------------------------------------------
+
+def is_remote(dest):
+    """Return True if ``dest`` names an rclone remote rather than a directory."""
+    return bool(_REMOTE.match(dest)) and not os.path.isdir(dest)
+
+
+def _manifest_files(data):
+    if not data or data.get('version') != MANIFEST_VERSION:
+        return None
+    return data.get('files')
+
+
+def read_manifest(dest):
+    """
+    Return the files of the last deploy to ``dest``, or None if unknown.
+
+    Args:
+        dest (str): rclone remote (``name:path``) or local directory.
+    """
+    if not is_remote(dest):
+        return _manifest_files(_load_json(os.path.join(dest, MANIFEST_NAME)))
+    result = subprocess.run(['rclone', 'cat', f'{dest.rstrip("/")}/{MANIFEST_NAME}'],
+                            capture_output=True)
+    if result.returncode != 0:
+        return None
+    try:
+        return _manifest_files(json.loads(result.stdout))
+    except ValueError:
+        return None
+
+
+def write_lists(upload, delete, files, cache_dir=CACHE_DIR):
+    """
+    Write the lists for ``rclone --files-from`` and the new manifest.
+
+    Returns:
+        tuple: Paths of upload.txt, delete.txt and the manifest.
+    """
+    paths = (os.path.join(cache_dir, 'upload.txt'),
+             os.path.join(cache_dir, 'delete.txt'),
+             os.path.join(cache_dir, MANIFEST_NAME))
+    atomic_write(paths[0], ''.join(rel + '\n' for rel in upload))
+    atomic_write(paths[1], ''.join(rel + '\n' for rel in delete))
+    atomic_write(paths[2], json.dumps({'version': MANIFEST_VERSION, 'files': files},
+                                      separators=(',', ':')))
+    return paths
+
+
+def _apply_local(docs_dir, dest, upload, delete, manifest_path):
+    for rel in upload:
+        target = os.path.join(dest, rel)
+        with atomic_path(target) as tmp_path:
+            shutil.copy2(os.path.join(docs_dir, rel), tmp_path)
+    for rel in delete:
+        target = os.path.join(dest, rel)
+        if os.path.exists(target):
+            os.remove(target)
+        # Drop directories that became empty, like rclone's bucket does.
+        directory = os.path.dirname(target)
+        while os.path.abspath(directory) != os.path.abspath(dest):
+            try:
+                os.rmdir(directory)
+            except OSError:
+                break
+            directory = os.path.dirname(directory)
+    shutil.copy2(manifest_path, os.path.join(dest, MANIFEST_NAME))
+
+
+def _apply_remote(docs_dir, dest, upload_list, delete_list, manifest_path, upload, delete):
+    if upload:
+        subprocess.run(['rclone', 'copy', docs_dir, dest, '--files-from', upload_list,
+                        '--no-traverse', '--progress'], check=True)
+    if delete:
+        subprocess.run(['rclone', 'delete', dest, '--files-from', delete_list], check=True)
+    subprocess.run(['rclone', 'copyto', manifest_path,
+                    f'{dest.rstrip("/")}/{MANIFEST_NAME}'], check=True)
+
+
+def deploy(dest=DEFAULT_DEST, docs_dir=DOCS_DIR, dry_run=False, workers=None,
+           cache_dir=CACHE_DIR):
+    """
+    Bring ``dest`` up to date with ``docs_dir``, transferring only changes.
+
+    Args:
+        dest (str, optional): rclone remote or local directory.
+        docs_dir (str, optional): Rendered site.
+        dry_run (bool, optional): Only write the lists, change nothing.
+        workers (int, optional): Threads for hashing.
+        cache_dir (str, optional): Where the lists and hashes are kept.
+
+    Returns:
+        dict: ``upload`` and ``delete`` (lists of relative paths), ``known``
+            (False if ``dest`` had no usable manifest) and the ``lists``
+            written.
+    """
+    if not os.path.isdir(docs_dir):
+        raise FileNotFoundError(f"{docs_dir} not found; run quarto render first")
+    files = scan(docs_dir, cache_dir, workers)
+    previous = read_manifest(dest)
+    upload, delete = plan(files, previous)
+    lists = write_lists(upload, delete, files, cache_dir)
+
+    if not dry_run:
+        if is_remote(dest):
+            _apply_remote(docs_dir, dest, lists[0], lists[1], lists[2], upload, delete)
+        else:
+            os.makedirs(dest, exist_ok=True)
+            _apply_local(docs_dir, dest, upload, delete, lists[2])
+    return {'upload': upload, 'delete': delete, 'known': previous is not None,
+            'lists': lists}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Upload only the changed files of docs/.')
+    parser.add_argument('dest', nargs='?', default=DEFAULT_DEST,
+                        help=f'rclone remote or local directory (default: {DEFAULT_DEST})')
+    parser.add_argument('--docs', default=DOCS_DIR, help='rendered site (default: docs/)')
+    parser.add_argument('-n', '--dry-run', action='store_true',
+                        help='only write the lists to .cache/deploy/')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='number of hashing threads (default: CPU count)')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    try:
+        result = deploy(args.dest, args.docs, args.dry_run, args.jobs)
+    except (FileNotFoundError, subprocess.CalledProcessError) as e:
+        print(e, file=sys.stderr)
+        return 1
+
+    if not result['known']:
+        print(f"Kein Manifest in {args.dest}: alles wird hochgeladen. "
+              f"Alte Dateien entfernt einmalig 'rclone sync'.")
+    upload, delete = (('hochzuladen', 'zu löschen') if args.dry_run
+                      else ('hochgeladen', 'gelöscht'))
+    print(f"{len(result['upload'])} Dateien {upload}, {len(result['delete'])} {delete} "
+          f"({time.perf_counter() - start:.1f} s)")
+    if args.dry_run:
+        upload_list, delete_list, _ = result['lists']
+        print(f"  rclone copy {args.docs} {args.dest} --files-from {upload_list} --no-traverse")
+        print(f"  rclone delete {args.dest} --files-from {delete_list}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,368 @@
+"""
+Responsive derivatives of the photos in images/: smaller WebP and AVIF files.
+
+The tour pages show the photos in images/ at their original size, which is
+far more than a phone needs. For every photo a notebook refers to (see
+``assets.py``) this module writes, on a process pool,
+
+    images/derived/<path>/<name>-<width>.<format>   at each of WIDTHS
+    images/derived/<path>/<name>-thumb.<format>     THUMB_SIZE, for listings
+
+in each of FORMATS (AVIF only where Pillow supports it), and a manifest
+
+    images/derived/manifest.json
+
+that maps each original to its size and its derivatives, for ``srcset``
+(see ``picture``). Widths above the original's are left out. Derivatives are
+stored in ``.cache/derivatives/`` under the content hash of the original and
+the settings, so an unchanged or merely renamed photo is not encoded again;
+the files in images/derived/ are hard links to (or copies of) them.
+
+Usage:
+    python -m scripts.derivatives [--jobs N] [--force] [--all]
+                                  [--formats webp avif] [--widths 480 960 1600]
+"""
+
+import argparse
+import filecmp
+import hashlib
+import json
+import math
+import os
+import shutil
+import sys
+import time
+
+try:
+    from .assets import build_graph
+    from .atomic import atomic_path, atomic_write
+    from .tours import BASE_DIR
+except ImportError:
+    from assets import build_graph
+    from atomic import atomic_path, atomic_write
+    from tours import BASE_DIR
+
+
+CACHE_DIR = os.path.join(BASE_DIR, '.cache', 'derivatives')
+DERIVED = 'images/derived'
+MANIFEST_NAME = 'manifest.json'
+
+# Bump when the encoding changes, to encode everything again.
+DERIVATIVES_VERSION = 1
+
+WIDTHS = (480, 960, 1600)
+FORMATS = ('avif', 'webp')
+THUMB_SIZE = (400, 300)
+QUALITY = {'webp': 80, 'avif': 60}
+
+# Width whose size the report compares with the originals: what a phone
+# with a 2x display loads for a full-width photo.
+REPORT_WIDTH = 960
+
+SOURCE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+def available_formats(formats=FORMATS):
+    """Return the formats of ``formats`` the installed Pillow can write."""
+    from PIL import features
+
+    return tuple(fmt for fmt in formats if features.check(fmt))
+
+
+def _is_source(target):
+    name = os.path.basename(target).lower()
+    return (target.startswith('images/') and not target.startswith(DERIVED + '/')
+            and name.endswith(SOURCE_EXTENSIONS) and 'qr_tag' not in name)
+
+
+def find_sources(graph, all_images=False):
+    """
+    Return the photos to make derivatives of, relative to the root.
+
+    Args:
+        graph (AssetGraph): The site's asset graph, with a fresh snapshot.
+        all_images (bool, optional): Include photos no document refers to.
+
+    Returns:
+        list: Sorted paths such as ``'images/2026/260203/260203_bachtel_kulm.jpg'``.
+    """
+    if all_images:
+        candidates = graph.images
+    else:
+        candidates = {target for _, _, target in graph.edges() if target in graph.images}
+    return sorted(target for target in candidates if _is_source(target))
+
+
+def settings_key(sha, widths, formats):
+    """Return the cache key of a photo with content hash ``sha``."""
+    payload = json.dumps({'version': DERIVATIVES_VERSION, 'sha': sha, 'widths': list(widths),
+                          'formats': list(formats), 'thumb': list(THUMB_SIZE),
+                          'quality': QUALITY}, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _save(image, path, fmt):
+    options = {'quality': QUALITY[fmt]}
+    if fmt == 'webp':
+        options['method'] = 4
+    elif fmt == 'avif':
+        options['speed'] = 6
+    with atomic_path(path) as tmp_path:
+        image.save(tmp_path, format=fmt.upper(), **options)
+
+
+def render(task):
+    """
+    Encode all derivatives of one photo into the cache (in a worker).
+
+    Args:
+        task (tuple): (source path, cache entry directory, widths, formats)
+
+    Returns:
+        dict: ``width``, ``height`` and ``widths`` actually made.
+    """
+    from PIL import Image, ImageOps
+
+    source, entry, widths, formats = task
+    with Image.open(source) as image:
+        width, height = image.size
+        if image.getexif().get(0x0112, 1) in (5, 6, 7, 8):
+            width, height = height, width
+        made = sorted({w for w in widths if w < width} or {width}, reverse=True)
+        # Let the JPEG decoder scale down by a power of two where it can.
+        scale = made[0] / width
+        image.draft('RGB', (math.ceil(image.size[0] * scale), math.ceil(image.size[1] * scale)))
+        image = ImageOps.exif_transpose(image)
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+
+        os.makedirs(entry, exist_ok=True)
+        current = image
+        for w in made:
+            # Each width is reduced from the next larger one.
+            h = max(1, round(height * w / width))
+            current = current.resize((w, h), Image.LANCZOS, reducing_gap=3.0)
+            for fmt in formats:
+                _save(current, os.path.join(entry, f'{w}.{fmt}'), fmt)
+        thumb = ImageOps.fit(current, THUMB_SIZE, Image.LANCZOS)
+        for fmt in formats:
+            _save(thumb, os.path.join(entry, f'thumb.{fmt}'), fmt)
+
+    info = {'width': width, 'height': height, 'widths': sorted(made)}
+    atomic_write(os.path.join(entry, 'info.json'), json.dumps(info))
+    return info
+
+
+def _publish(cached, path):
+    """Hard-link (or copy) a cached derivative to ``path`` unless it is there."""
+    try:
+        if os.path.samefile(cached, path) or filecmp.cmp(cached, path, shallow=False):
+            return
+    except FileNotFoundError:
+        pass
+    with atomic_path(path) as tmp_path:
+        os.remove(tmp_path)
+        try:
+            os.link(cached, tmp_path)
+        except OSError:
+            shutil.copyfile(cached, tmp_path)
+
+
+def _derived_name(source, label, fmt):
+    stem = os.path.splitext(source[len('images/'):])[0]
+    return f"{DERIVED}/{stem}-{label}.{fmt}"
+
+
+def read_manifest(base_dir=BASE_DIR):
+    """Return the manifest of ``base_dir``'s derivatives, or {}."""
+    try:
+        with open(os.path.join(base_dir, DERIVED, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def build_derivatives(base_dir=BASE_DIR, widths=WIDTHS, formats=FORMATS, workers=None,
+                      force=False, all_images=False, cache_dir=None):
+    """
+    Make the derivatives of every photo and write the manifest.
+
+    Args:
+        base_dir (str, optional): Repository root.
+        widths (tuple, optional): Widths in pixels.
+        formats (tuple, optional): Formats; those Pillow cannot write are
+            skipped.
+        workers (int, optional): Size of the process pool. Defaults to the
+            number of CPUs; 1 works in this process.
+        force (bool, optional): Encode everything again.
+        all_images (bool, optional): Include photos no document refers to.
+        cache_dir (str, optional): Where encoded derivatives are kept.
+            Defaults to ``.cache/derivatives`` of ``base_dir``.
+
+    Returns:
+        tuple: (manifest, number of photos encoded)
+    """
+    if not os.path.isdir(os.path.join(base_dir, 'images')):
+        # images/ is not part of the repository and may be missing.
+        return {}, 0
+    formats = available_formats(formats)
+    cache_dir = cache_dir or (CACHE_DIR if os.path.abspath(base_dir) == BASE_DIR
+                              else os.path.join(base_dir, '.cache', 'derivatives'))
+    sources = find_sources(build_graph(base_dir), all_images)
+    old = read_manifest(base_dir)
+
+    plans = {}
+    tasks = {}
+    for source in sources:
+        path = os.path.join(base_dir, source)
+        stat = os.stat(path)
+        stamp = [stat.st_mtime_ns, stat.st_size]
+        previous = old.get(source, {})
+        # The size and modification time stand in for the hash if unchanged.
+        sha = previous['sha'] if previous.get('stamp') == stamp else _sha256(path)
+        key = settings_key(sha, widths, formats)
+        entry = os.path.join(cache_dir, key[:2], key)
+        plans[source] = (stamp, sha, entry)
+        if force or not os.path.exists(os.path.join(entry, 'info.json')):
+            tasks.setdefault(entry, (path, entry, tuple(widths), formats))
+
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(tasks) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+            list(pool.map(render, tasks.values()))
+    else:
+        for task in tasks.values():
+            render(task)
+
+    manifest = {}
+    for source, (stamp, sha, entry) in plans.items():
+        with open(os.path.join(entry, 'info.json'), 'r', encoding='utf-8') as f:
+            info = json.load(f)
+        item = {'width': info['width'], 'height': info['height'], 'sha': sha, 'stamp': stamp,
+                'bytes': stamp[1], 'srcset': {}, 'thumb': {}}
+        for fmt in formats:
+            item['srcset'][fmt] = []
+            for w in info['widths']:
+                name = _derived_name(source, w, fmt)
+                _publish(os.path.join(entry, f'{w}.{fmt}'), os.path.join(base_dir, name))
+                item['srcset'][fmt].append([name, w, os.path.getsize(os.path.join(base_dir, name))])
+            name = _derived_name(source, 'thumb', fmt)
+            _publish(os.path.join(entry, f'thumb.{fmt}'), os.path.join(base_dir, name))
+            item['thumb'][fmt] = name
+        manifest[source] = item
+
+    _remove_stale(base_dir, manifest)
+    atomic_write(os.path.join(base_dir, DERIVED, MANIFEST_NAME),
+                 json.dumps(manifest, ensure_ascii=False, indent=1, sort_keys=True))
+    return manifest, len(tasks)
+
+
+def _remove_stale(base_dir, manifest):
+    """Remove derivatives of photos that are gone or were renamed."""
+    keep = {name for item in manifest.values()
+            for names in item['srcset'].values() for name, _, _ in names}
+    keep.update(name for item in manifest.values() for name in item['thumb'].values())
+    keep.add(f'{DERIVED}/{MANIFEST_NAME}')
+    root = os.path.join(base_dir, DERIVED)
+    for directory, _, names in os.walk(root, topdown=False):
+        for name in names:
+            path = os.path.join(directory, name)
+            if os.path.relpath(path, base_dir).replace(os.sep, '/') not in keep:
+                os.remove(path)
+        if directory != root and not os.listdir(directory):
+            os.rmdir(directory)
+
+
+def report(manifest, width=REPORT_WIDTH):
+    """
+    Return the bytes of the originals and of their derivatives at ``width``.
+
+    For each photo the derivative closest to ``width`` (or the largest one
+    below it) counts.
+
+    Returns:
+        dict: ``'originals'`` and one entry per format, in bytes.
+    """
+    totals = {'originals': 0}
+    for item in manifest.values():
+        totals['originals'] += item['bytes']
+        for fmt, names in item['srcset'].items():
+            fitting = [size for _, w, size in names if w <= width] or [names[0][2]]
+            totals[fmt] = totals.get(fmt, 0) + fitting[-1]
+    return totals
+
+
+def picture(src, alt='', sizes='(max-width: 800px) 100vw, 800px', manifest=None):
+    """
+    Return a ``<picture>`` element with ``srcset`` for a photo, for notebooks.
+
+    Falls back to a plain ``<img>`` if the photo has no derivatives yet.
+
+    Args:
+        src (str): The photo as the page refers to it, relative to the
+            working directory, e.g. ``'../../../images/2026/260203/x.jpg'``.
+        alt (str, optional): Alternative text.
+        sizes (str, optional): The ``sizes`` attribute.
+        manifest (dict, optional): Manifest to use instead of the one on disk.
+
+    Returns:
+        IPython.display.HTML: The element.
+    """
+    from html import escape
+
+    from IPython.display import HTML
+
+    manifest = read_manifest() if manifest is None else manifest
+    target = os.path.relpath(os.path.abspath(src), BASE_DIR).replace(os.sep, '/')
+    prefix = src[:len(src) - len(target)] if src.endswith(target) else ''
+    item = manifest.get(target)
+    if item is None:
+        return HTML(f'<img src="{escape(src)}" alt="{escape(alt)}" loading="lazy">')
+
+    sources = ''.join(
+        f'<source type="image/{fmt}" sizes="{escape(sizes)}" srcset="'
+        + ', '.join(f'{escape(prefix + name)} {w}w' for name, w, _ in names) + '">'
+        for fmt, names in sorted(item['srcset'].items()))
+    return HTML(f'<picture>{sources}<img src="{escape(src)}" alt="{escape(alt)}" '
+                f'width="{item["width"]}" height="{item["height"]}" loading="lazy" '
+                f'decoding="async"></picture>')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Make WebP/AVIF derivatives of the photos.')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='number of worker processes (default: CPU count)')
+    parser.add_argument('--force', action='store_true', help='encode everything again')
+    parser.add_argument('--all', action='store_true',
+                        help='also photos no document refers to')
+    parser.add_argument('--formats', nargs='+', choices=FORMATS, default=list(FORMATS))
+    parser.add_argument('--widths', nargs='+', type=int, default=list(WIDTHS))
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    manifest, encoded = build_derivatives(widths=tuple(sorted(args.widths)),
+                                          formats=tuple(args.formats), workers=args.jobs,
+                                          force=args.force, all_images=args.all)
+    totals = report(manifest)
+    print(f"{len(manifest)} Bilder, {encoded} neu kodiert "
+          f"({time.perf_counter() - start:.1f} s)")
+    originals = totals.pop('originals')
+    for fmt, size in sorted(totals.items()):
+        saved = originals - size
+        print(f"{fmt:>5} @ {REPORT_WIDTH}px: {size / 1024 / 1024:7.1f} MiB statt "
+              f"{originals / 1024 / 1024:.1f} MiB, {saved / 1024 / 1024:.1f} MiB gespart "
+              f"({saved / originals:.0%})" if originals else f"{fmt}: keine Bilder")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,291 @@
+"""
+Facet index of the tours and a client-side filter for the listing pages.
+
+Quarto's ``search.json`` is a full-text dump of every page; it cannot
+answer "tours in GR under 12 km with less than 800 m of ascent". The facet
+index holds only the fields to filter on, from ``_metadata.yml`` and the
+track statistics of the catalog (see ``catalog.py``), as typed columns:
+
+    canton      category (code into ``fields.canton.values``)
+    date        ISO date, compares as a string
+    distance    km, one decimal
+    ascent      m
+    descent     m
+    marschzeit  minutes
+
+plus ``title`` and ``page`` (relative to files/) to show and link a tour.
+For the whole corpus this is a few KB.
+
+``facet_filter`` embeds the index of one year in its listing page, together
+with a small script that filters the listing table as the fields change.
+``files/facets.json`` holds the index of all tours for other tools.
+
+Usage (in files/2025.qmd):
+    sys.path.append(os.path.abspath("../scripts"))
+    from facets import facet_filter
+    facet_filter("2025")
+
+    python -m scripts.facets [--canton GR ...] [--max-distance 12]
+                             [--max-ascent 800] [--since 2025-06-01] ...
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+try:
+    from .atomic import atomic_write
+    from .catalog import build_catalog
+    from .tours import BASE_DIR, FILES_DIR
+except ImportError:
+    from atomic import atomic_write
+    from catalog import build_catalog
+    from tours import BASE_DIR, FILES_DIR
+
+
+FACETS_JSON = os.path.join(FILES_DIR, 'facets.json')
+
+# Bump when the layout of the index changes.
+FACETS_VERSION = 1
+
+# Field -> (type, unit, catalog column, scale, digits).
+FIELDS = {
+    'canton': ('category', None, 'canton', None, None),
+    'date': ('date', None, 'date', None, None),
+    'distance': ('number', 'km', 'distance', 0.001, 1),
+    'ascent': ('number', 'm', 'ascent', 1, 0),
+    'descent': ('number', 'm', 'descent', 1, 0),
+    'marschzeit': ('number', 'min', 'marschzeit', 1, 0),
+}
+
+
+def _number(value, scale, digits):
+    if value is None:
+        return None
+    value = round(value * scale, digits)
+    return int(value) if digits == 0 else value
+
+
+def facet_index(rows):
+    """
+    Build the facet index of catalog rows.
+
+    Args:
+        rows (list): Catalog rows (see ``catalog.tour_row``).
+
+    Returns:
+        dict: ``version``, ``fields`` (type, unit and, for categories, the
+            sorted ``values``) and ``columns`` (field -> list, in row order).
+    """
+    fields = {}
+    columns = {
+        'title': [row['title'] for row in rows],
+        'page': [row['page'][len('/files/'):] if row.get('page') else None for row in rows],
+    }
+    for name, (kind, unit, source, scale, digits) in FIELDS.items():
+        values = [row.get(source) for row in rows]
+        field = {'type': kind}
+        if unit:
+            field['unit'] = unit
+        if kind == 'category':
+            field['values'] = sorted({v for v in values if v})
+            codes = {v: i for i, v in enumerate(field['values'])}
+            values = [codes.get(v) for v in values]
+        elif kind == 'number':
+            values = [_number(v, scale, digits) for v in values]
+        fields[name] = field
+        columns[name] = values
+    return {'version': FACETS_VERSION, 'fields': fields, 'columns': columns}
+
+
+def select(index, cantons=None, since=None, until=None, **ranges):
+    """
+    Return the positions of the tours that match all given filters.
+
+    The same rules as the script of ``facet_filter``: a missing value never
+    matches a filter on its field.
+
+    Args:
+        index (dict): Facet index.
+        cantons (iterable, optional): Canton codes; any of them matches.
+        since (str, optional): First ISO date, inclusive.
+        until (str, optional): Last ISO date, inclusive.
+        **ranges: ``min_<field>`` and ``max_<field>`` bounds (inclusive) of
+            the number fields, e.g. ``max_distance=12``.
+
+    Returns:
+        list: Row positions.
+
+    Raises:
+        ValueError: If a range names an unknown field.
+    """
+    fields, columns = index['fields'], index['columns']
+    tests = []
+    if cantons:
+        values = fields['canton']['values']
+        wanted = {values.index(c) for c in cantons if c in values}
+        tests.append(lambda i: columns['canton'][i] in wanted)
+    if since:
+        tests.append(lambda i: columns['date'][i] is not None and columns['date'][i] >= since)
+    if until:
+        tests.append(lambda i: columns['date'][i] is not None and columns['date'][i] <= until)
+    for key, bound in ranges.items():
+        if bound is None:
+            continue
+        side, _, name = key.partition('_')
+        if side not in ('min', 'max') or fields.get(name, {}).get('type') != 'number':
+            raise ValueError(f"Unknown range {key!r}")
+        column = columns[name]
+        if side == 'min':
+            tests.append(lambda i, c=column, b=bound: c[i] is not None and c[i] >= b)
+        else:
+            tests.append(lambda i, c=column, b=bound: c[i] is not None and c[i] <= b)
+    return [i for i in range(len(columns['title'])) if all(test(i) for test in tests)]
+
+
+def build_facets(path=FACETS_JSON):
+    """Bring the catalog up to date and write the index of all tours to ``path``."""
+    rows, _ = build_catalog()
+    index = facet_index(rows)
+    atomic_write(path, json.dumps(index, ensure_ascii=False, separators=(',', ':')))
+    return index
+
+
+_FILTER_HTML = """\
+<div class="facet-filter" id="{id}">
+<script type="application/json">{data}</script>
+<div class="facet-cantons" style="display:flex;flex-wrap:wrap;gap:0.2em 0.8em"></div>
+<div style="display:flex;flex-wrap:wrap;gap:0.4em 1.2em;margin:0.4em 0">
+<label>Distanz bis <input type="number" name="max_distance" min="0" step="1" style="width:5em"> km</label>
+<label>Aufstieg bis <input type="number" name="max_ascent" min="0" step="50" style="width:5em"> m</label>
+<label>von <input type="date" name="since"></label>
+<label>bis <input type="date" name="until"></label>
+</div>
+<div class="facet-count" style="font-size:0.9em;color:#666"></div>
+<script>
+(function() {{
+  var root = document.getElementById('{id}');
+  var index = JSON.parse(root.querySelector('script[type="application/json"]').textContent);
+  var c = index.columns, n = c.title.length, cantons = root.querySelector('.facet-cantons');
+  index.fields.canton.values.forEach(function(value, code) {{
+    if (c.canton.indexOf(code) < 0) return;
+    var label = document.createElement('label');
+    label.innerHTML = '<input type="checkbox" value="' + code + '"> ' + value;
+    cantons.appendChild(label);
+  }});
+  function selected() {{
+    var codes = [].map.call(root.querySelectorAll('.facet-cantons input:checked'),
+                            function(box) {{ return +box.value; }});
+    var value = function(name) {{ return root.querySelector('input[name=' + name + ']').value; }};
+    var maxDistance = value('max_distance'), maxAscent = value('max_ascent');
+    var since = value('since'), until = value('until'), pages = {{}}, count = 0;
+    for (var i = 0; i < n; i++) {{
+      if (codes.length && codes.indexOf(c.canton[i]) < 0) continue;
+      if (maxDistance !== '' && !(c.distance[i] !== null && c.distance[i] <= +maxDistance)) continue;
+      if (maxAscent !== '' && !(c.ascent[i] !== null && c.ascent[i] <= +maxAscent)) continue;
+      if (since && !(c.date[i] && c.date[i] >= since)) continue;
+      if (until && !(c.date[i] && c.date[i] <= until)) continue;
+      if (c.page[i]) pages[c.page[i]] = true;
+      count++;
+    }}
+    root.querySelector('.facet-count').textContent = count + ' von ' + n + ' Touren';
+    return pages;
+  }}
+  function matches(element, pages) {{
+    var link = element.querySelector('a[href]');
+    if (!link) return true;
+    for (var page in pages) if (link.pathname.endsWith('/' + page)) return true;
+    return false;
+  }}
+  function apply() {{
+    var pages = selected(), lists = window['quarto-listings'] || {{}}, filtered = false;
+    for (var id in lists) {{
+      lists[id].filter(function(item) {{ return matches(item.elm, pages); }});
+      filtered = true;
+    }}
+    if (!filtered) {{
+      document.querySelectorAll('.quarto-listing tbody tr').forEach(function(row) {{
+        row.style.display = matches(row, pages) ? '' : 'none';
+      }});
+    }}
+  }}
+  root.addEventListener('input', apply);
+  root.addEventListener('change', apply);
+  selected();
+}})();
+</script>
+</div>
+"""
+
+
+def filter_html(index, element_id='facet-filter'):
+    """
+    Return the filter of a facet index as an HTML fragment.
+
+    The fragment holds the index as JSON and a script that shows checkboxes
+    for the cantons and fields for distance, ascent and dates. On every
+    change it filters the Quarto listings of the page (through their
+    list.js objects, so paging keeps working) to the tours that match.
+
+    Args:
+        index (dict): Facet index, usually of one year.
+        element_id (str, optional): Id of the outer element.
+
+    Returns:
+        str: The fragment.
+    """
+    data = json.dumps(index, ensure_ascii=False, separators=(',', ':'))
+    return _FILTER_HTML.format(id=element_id, data=data.replace('</', '<\\/'))
+
+
+def facet_filter(year):
+    """
+    Return the filter for the listing page of a year.
+
+    Brings the catalog up to date first.
+
+    Args:
+        year (str or int): The year.
+
+    Returns:
+        IPython.display.HTML: The filter, see ``filter_html``.
+    """
+    from IPython.display import HTML
+
+    rows, _ = build_catalog()
+    rows = [row for row in rows if str(row['year']) == str(year)]
+    return HTML(filter_html(facet_index(rows), f'facet-filter-{year}'))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build the facet index and query it.')
+    parser.add_argument('--canton', dest='cantons', action='append',
+                        help='canton code, repeatable')
+    parser.add_argument('--since', help='first date (YYYY-MM-DD)')
+    parser.add_argument('--until', help='last date (YYYY-MM-DD)')
+    for name, (kind, unit, *_) in FIELDS.items():
+        if kind == 'number':
+            parser.add_argument(f'--min-{name}', type=float, help=f'in {unit}')
+            parser.add_argument(f'--max-{name}', type=float, help=f'in {unit}')
+    args = vars(parser.parse_args(argv))
+
+    start = time.perf_counter()
+    index = build_facets()
+    positions = select(index, **args)
+    columns = index['columns']
+    cantons = index['fields']['canton']['values']
+    for i in positions:
+        canton = cantons[columns['canton'][i]] if columns['canton'][i] is not None else '--'
+        print(f"{columns['date'][i]}  {canton:2}  {columns['distance'][i]:5.1f} km  "
+              f"{columns['ascent'][i]:5d} m  {columns['title'][i]}")
+    size = os.path.getsize(FACETS_JSON)
+    print(f"{len(positions)} von {len(columns['title'])} Touren; "
+          f"{os.path.relpath(FACETS_JSON, BASE_DIR)}: {size / 1024:.1f} KB "
+          f"({time.perf_counter() - start:.2f} s)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
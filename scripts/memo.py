@@ -0,0 +1,371 @@
+"""
+Disk-backed memoization for the notebook helpers.
+
+When ``quarto render`` executes a notebook again, ``create_map``, ``profile``
+and ``generate_qr_code_for_url`` would redo all their work even though the
+GPX file, the arguments and the code are unchanged. The ``memoize``
+decorator stores the files a helper writes (and, optionally, its return
+value) under a key made from
+
+- the source of the function and of the modules it depends on,
+- its arguments and selected environment variables,
+- the content of the input files named by its arguments,
+
+and on the next call with the same key copies the files back into place
+instead of calling the function.
+
+Entries live in ``.cache/memo/`` (``WANDERALBUM_MEMO_DIR``). The cache is
+kept below ``WANDERALBUM_MEMO_CACHE_MB`` megabytes (default 256) by evicting
+the least recently used entries. ``WANDERALBUM_MEMO=0`` turns it off.
+
+Usage:
+    @memoize(inputs=('path',), outputs=('elevation_profile.png',))
+    def profile(path): ...
+
+    python -m scripts.memo stats
+    python -m scripts.memo clear
+"""
+
+import functools
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+try:
+    from .atomic import atomic_path
+    from .tracing import annotate
+except ImportError:
+    from atomic import atomic_path
+    from tracing import annotate
+
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+BASE_DIR = os.path.dirname(SCRIPTS_DIR)
+DEFAULT_CACHE_DIR = os.environ.get('WANDERALBUM_MEMO_DIR',
+                                   os.path.join(BASE_DIR, '.cache', 'memo'))
+DEFAULT_MAX_BYTES = int(float(os.environ.get('WANDERALBUM_MEMO_CACHE_MB', 256)) * 1024 * 1024)
+
+# Bump when the layout of an entry changes.
+MEMO_VERSION = 2
+
+_META = 'meta.json'
+_RESULT = 'result'
+
+# Calls of memoized functions running in this thread, innermost last.
+_calls = threading.local()
+
+
+def enabled():
+    """Return False if memoization is turned off with ``WANDERALBUM_MEMO=0``."""
+    return os.environ.get('WANDERALBUM_MEMO', '1').lower() not in ('0', 'false', 'no', 'off')
+
+
+def _hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _stamp(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+class MemoCache:
+    """
+    A directory of memoized results with a size cap and LRU eviction.
+
+    Each entry is a directory named after its key that holds the output
+    files, the stored return value (if any) and ``meta.json``. The
+    directory's modification time records the last use.
+
+    Args:
+        root (str, optional): Cache directory.
+        max_bytes (int, optional): Size cap in bytes.
+    """
+
+    def __init__(self, root=None, max_bytes=None):
+        self.root = root or DEFAULT_CACHE_DIR
+        self.max_bytes = DEFAULT_MAX_BYTES if max_bytes is None else max_bytes
+
+    def _entry(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def get(self, key):
+        """Return the entry directory and its metadata, or None on a miss."""
+        entry = self._entry(key)
+        try:
+            with open(os.path.join(entry, _META), 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        try:
+            os.utime(entry)
+        except OSError:
+            pass
+        return entry, meta
+
+    def put(self, key, files, result=None, dump=None, function=''):
+        """
+        Store output files (and a return value) under ``key``.
+
+        The entry is assembled in a temporary directory and renamed into
+        place, so concurrent readers never see half an entry.
+
+        Args:
+            key (str): The key.
+            files (dict): Name in the entry -> path of the file to store.
+            result (optional): Return value of the function.
+            dump (callable, optional): ``dump(result, path)`` writes the
+                return value to ``path``. Without it the value is not stored.
+            function (str, optional): Name of the function, for ``stats``.
+        """
+        entry = self._entry(key)
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        tmp = tempfile.mkdtemp(prefix=f'.{key[:8]}.', dir=os.path.dirname(entry))
+        try:
+            size = 0
+            for name, path in files.items():
+                shutil.copyfile(path, os.path.join(tmp, name))
+                size += os.path.getsize(path)
+            if dump is not None:
+                dump(result, os.path.join(tmp, _RESULT))
+                size += os.path.getsize(os.path.join(tmp, _RESULT))
+            meta = {'version': MEMO_VERSION, 'function': function,
+                    'outputs': sorted(files), 'result': dump is not None,
+                    'size': size, 'created': time.time()}
+            with open(os.path.join(tmp, _META), 'w', encoding='utf-8') as f:
+                json.dump(meta, f)
+            try:
+                os.replace(tmp, entry)
+            except OSError:
+                # Another process stored the same entry first.
+                pass
+        finally:
+            if os.path.isdir(tmp):
+                shutil.rmtree(tmp, ignore_errors=True)
+        self.evict()
+
+    def entries(self):
+        """Return (last use, size, path, metadata) of every entry."""
+        result = []
+        if not os.path.isdir(self.root):
+            return result
+        for prefix in os.scandir(self.root):
+            if not prefix.is_dir():
+                continue
+            for entry in os.scandir(prefix.path):
+                if entry.name.startswith('.') or not entry.is_dir():
+                    continue
+                try:
+                    with open(os.path.join(entry.path, _META), 'r', encoding='utf-8') as f:
+                        meta = json.load(f)
+                    result.append((entry.stat().st_mtime, meta.get('size', 0), entry.path, meta))
+                except (FileNotFoundError, ValueError):
+                    continue
+        return result
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits its cap."""
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _, _ in entries)
+        for _, size, path, _ in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        """Remove every entry."""
+        if os.path.isdir(self.root):
+            shutil.rmtree(self.root, ignore_errors=True)
+
+
+_cache = None
+
+
+def get_cache():
+    """Return the process-wide MemoCache."""
+    global _cache
+    if _cache is None:
+        _cache = MemoCache()
+    return _cache
+
+
+def clear():
+    """Invalidate every memoized result."""
+    get_cache().clear()
+
+
+def skip_store():
+    """
+    Keep the result of the running memoized call out of the cache.
+
+    For results that depend on state the key does not cover, e.g. a map
+    drawn while some of its tiles were missing. Does nothing outside a
+    memoized call or with memoization turned off.
+    """
+    stack = getattr(_calls, 'stack', None)
+    if stack:
+        stack[-1]['store'] = False
+
+
+def memoize(inputs=(), outputs=(), code=(), env=(), ignore=(), dump=None, load=None,
+            replay=None):
+    """
+    Decorator that memoizes a helper on disk.
+
+    Args:
+        inputs (tuple, optional): Names of arguments that hold paths of
+            input files; their content goes into the key.
+        outputs (tuple or callable, optional): Files the function writes,
+            relative to the working directory, or a function that returns
+            them from the bound arguments (a dict). A call is only stored if
+            it (re)wrote all of them.
+        code (tuple, optional): Further modules in scripts/ whose source
+            goes into the key, e.g. ``('tracks.py',)``.
+        env (tuple, optional): Environment variables that go into the key.
+        ignore (tuple, optional): Arguments that do not change the result,
+            e.g. where it is written to; they are left out of the key.
+        dump (callable, optional): ``dump(result, path)`` stores the return
+            value; ``load(path)`` restores it. Without them the memoized
+            function returns None on a hit.
+        load (callable, optional): See ``dump``.
+        replay (callable, optional): Called with the original arguments on
+            a hit, for side effects like printing or displaying.
+
+    Returns:
+        callable: The decorator.
+    """
+    def decorator(function):
+        # inspect is only needed once the function is called.
+        state = {}
+
+        def code_hash():
+            # The function's own source plus the listed modules, once per process.
+            if 'code' not in state:
+                import inspect
+
+                try:
+                    source = inspect.getsource(function).encode()
+                except (OSError, TypeError):
+                    # Defined interactively: fall back to the bytecode.
+                    import marshal
+
+                    source = marshal.dumps(function.__code__)
+                digest = hashlib.sha256(source)
+                for name in code:
+                    digest.update(_hash_file(os.path.join(SCRIPTS_DIR, name)).encode())
+                state['code'] = digest.hexdigest()
+            return state['code']
+
+        def output_names(arguments):
+            return list(outputs(arguments) if callable(outputs) else outputs)
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not enabled():
+                annotate(memo='off')
+                return function(*args, **kwargs)
+
+            if 'signature' not in state:
+                import inspect
+
+                state['signature'] = inspect.signature(function)
+            bound = state['signature'].bind(*args, **kwargs)
+            bound.apply_defaults()
+            arguments = dict(bound.arguments)
+            keyed = {name: value for name, value in arguments.items() if name not in ignore}
+
+            digest = hashlib.sha256(f"memo-{MEMO_VERSION}-{function.__qualname__}".encode())
+            digest.update(code_hash().encode())
+            digest.update(json.dumps(keyed, sort_keys=True, default=repr).encode())
+            digest.update(json.dumps({name: os.environ.get(name) for name in env},
+                                     sort_keys=True).encode())
+            for name in inputs:
+                path = arguments.get(name)
+                if path and os.path.exists(path):
+                    digest.update(_hash_file(path).encode())
+            key = digest.hexdigest()
+
+            names = output_names(arguments)
+            cache = get_cache()
+            hit = cache.get(key)
+            if hit is not None:
+                entry, meta = hit
+                try:
+                    for i, name in enumerate(names):
+                        with atomic_path(name) as tmp_path:
+                            shutil.copyfile(os.path.join(entry, f'output-{i}'), tmp_path)
+                    result = load(os.path.join(entry, _RESULT)) if load and meta['result'] else None
+                except (FileNotFoundError, KeyError):
+                    # Evicted by another process in the meantime.
+                    hit = None
+                else:
+                    annotate(memo='hit')
+                    if replay is not None:
+                        replay(*args, **kwargs)
+                    return result
+
+            annotate(memo='miss')
+            before = [_stamp(name) for name in names]
+            stack = getattr(_calls, 'stack', None)
+            if stack is None:
+                stack = _calls.stack = []
+            call = {'store': True}
+            stack.append(call)
+            try:
+                result = function(*args, **kwargs)
+            finally:
+                stack.pop()
+            after = [_stamp(name) for name in names]
+            if not call['store']:
+                annotate(memo='skipped')
+            elif all(a is not None and a != b for a, b in zip(after, before)):
+                cache.put(key, {f'output-{i}': name for i, name in enumerate(names)},
+                          result, dump, function.__qualname__)
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Inspect or clear the helper memo cache.')
+    parser.add_argument('command', choices=('stats', 'clear'))
+    args = parser.parse_args(argv)
+
+    cache = get_cache()
+    if args.command == 'clear':
+        cache.clear()
+        print(f"Cache geleert: {cache.root}")
+        return 0
+
+    entries = cache.entries()
+    per_function = {}
+    for _, size, _, meta in entries:
+        count, total = per_function.get(meta.get('function', '?'), (0, 0))
+        per_function[meta.get('function', '?')] = (count + 1, total + size)
+    for function, (count, total) in sorted(per_function.items()):
+        print(f"{function:<28}{count:>6} entries {total / 1024 / 1024:>8.1f} MiB")
+    total = sum(size for _, size, _, _ in entries)
+    print(f"{len(entries)} entries, {total / 1024 / 1024:.1f} of "
+          f"{cache.max_bytes / 1024 / 1024:.0f} MiB in {cache.root}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
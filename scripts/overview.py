@@ -0,0 +1,343 @@
+"""
+Overview map of all tours of a year, with level-of-detail track chunks.
+
+Putting every full-resolution track into one folium map, the way
+``create_map`` does for a single tour, makes a page of several megabytes.
+Instead, each track is simplified once per detail level, and the result is
+cut along a Web Mercator tile grid into small GeoJSON files:
+
+    files/overview/<year>/index.json              levels, chunks and tours
+    files/overview/<year>/<level>/<x>/<y>.json    tracks of one chunk
+
+The map on the year page only embeds the index (tour titles, links and
+centres) and a small script that fetches the chunks of the detail level for
+the current zoom that intersect the view. Each track links to its tour page.
+The chunks are rebuilt only when a tour of the year changed (see
+``catalog.py``).
+
+Usage (in files/2025.qmd):
+    sys.path.append(os.path.abspath("../scripts"))
+    from overview import overview_map
+    overview_map("2025")
+
+    python -m scripts.overview [--force] [year ...]
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import shutil
+import sys
+import time
+from collections import defaultdict
+
+import folium
+import numpy as np
+from branca.element import MacroElement
+from jinja2 import Template
+
+try:
+    from .atomic import atomic_write
+    from .catalog import build_catalog
+    from .simplify import simplify_track, tolerance_for_zoom
+    from .tours import BASE_DIR, FILES_DIR, discover_tours
+    from .tracks import load_track
+except ImportError:
+    from atomic import atomic_write
+    from catalog import build_catalog
+    from simplify import simplify_track, tolerance_for_zoom
+    from tours import BASE_DIR, FILES_DIR, discover_tours
+    from tracks import load_track
+
+
+OVERVIEW_DIR = os.path.join(FILES_DIR, 'overview')
+
+# Bump when the chunk format changes, to rebuild all chunks.
+OVERVIEW_VERSION = 1
+
+# Detail levels: a level is used from its zoom up to the next level's zoom.
+# Its chunks are tiles of CHUNK_ZOOM_OFFSET zoom levels less, i.e. 4x4 map
+# tiles of 256 pixels each.
+LEVELS = (7, 10, 12, 14)
+CHUNK_ZOOM_OFFSET = 2
+
+# Below this zoom the tours are (also) shown as markers.
+MARKER_MAX_ZOOM = 9
+
+
+def _tile_xy(lat, lon, zoom):
+    """Return the fractional Web Mercator tile coordinates at ``zoom``."""
+    n = 2 ** zoom
+    x = (np.asarray(lon) + 180.0) / 360.0 * n
+    phi = np.radians(lat)
+    y = (1.0 - np.log(np.tan(phi) + 1.0 / np.cos(phi)) / math.pi) / 2.0 * n
+    return x, y
+
+
+def _decimals(tolerance):
+    """Return the decimals of a degree that are finer than ``tolerance`` metres."""
+    return max(3, math.ceil(-math.log10(tolerance / 111320.0)))
+
+
+def chunk_track(track, zoom):
+    """
+    Cut a track into pieces along the tile grid of ``zoom``.
+
+    A piece that leaves its tile keeps the first point of the next tile, so
+    the line stays connected; the connecting step is drawn only once.
+
+    Args:
+        track (Track): The (simplified) track.
+        zoom (int): Zoom level of the chunk grid.
+
+    Returns:
+        dict: (x, y) of the tile -> list of (lat, lon) array pairs.
+    """
+    pieces = defaultdict(list)
+    for s in track.segments():
+        lat, lon = track.lat[s], track.lon[s]
+        if len(lat) == 0:
+            continue
+        x, y = _tile_xy(lat, lon, zoom)
+        tx = np.floor(x).astype(np.int64)
+        ty = np.floor(y).astype(np.int64)
+        changes = np.flatnonzero((tx[1:] != tx[:-1]) | (ty[1:] != ty[:-1])) + 1
+        starts = np.concatenate(([0], changes))
+        stops = np.concatenate((changes + 1, [len(lat)]))
+        for start, stop in zip(starts, stops):
+            pieces[(int(tx[start]), int(ty[start]))].append((lat[start:stop], lon[start:stop]))
+    return pieces
+
+
+def overview_key(rows):
+    """Return the hash over the catalog rows a year's chunks are built from."""
+    digest = hashlib.sha256(f"overview-{OVERVIEW_VERSION}-{LEVELS}-{CHUNK_ZOOM_OFFSET}".encode())
+    for row in rows:
+        digest.update(row['key'].encode())
+    return digest.hexdigest()
+
+
+def read_index(year, out_dir=OVERVIEW_DIR):
+    """Return the index of a year's overview, or None if it was not built yet."""
+    try:
+        with open(os.path.join(out_dir, str(year), 'index.json'), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def build_overview(year, force=False, out_dir=OVERVIEW_DIR):
+    """
+    Build the chunks and the index of one year's overview map.
+
+    Args:
+        year (str or int): The year, i.e. the directory below files/.
+        force (bool, optional): Rebuild even if no tour changed.
+        out_dir (str, optional): Root of the overview files.
+
+    Returns:
+        dict: The index, as written to ``<out_dir>/<year>/index.json``.
+    """
+    year = str(year)
+    tours = [t for t in discover_tours() if t.year == year]
+    rows, _ = build_catalog()
+    rows = [row for row in rows if str(row['year']) == year]
+    key = overview_key(rows)
+
+    index = read_index(year, out_dir)
+    if not force and index is not None and index.get('key') == key:
+        return index
+
+    year_dir = os.path.join(out_dir, year)
+    if os.path.isdir(year_dir):
+        shutil.rmtree(year_dir)
+    tracks = {tour.slug: load_track(tour.gpx) for tour in tours}
+    levels = []
+    for level in LEVELS:
+        chunk_zoom = max(level - CHUNK_ZOOM_OFFSET, 0)
+        latitude = float(np.mean([row['centroid'][0] for row in rows])) if rows else 46.8
+        tolerance = tolerance_for_zoom(level, latitude)
+        decimals = _decimals(tolerance)
+
+        chunks = defaultdict(list)
+        for row in rows:
+            track = simplify_track(tracks[row['slug']], tolerance)
+            for tile, pieces in chunk_track(track, chunk_zoom).items():
+                lines = [np.column_stack((lon, lat)).round(decimals).tolist()
+                         for lat, lon in pieces]
+                chunks[tile].append({
+                    'type': 'Feature',
+                    'geometry': {'type': 'MultiLineString', 'coordinates': lines},
+                    'properties': {'slug': row['slug']},
+                })
+
+        level_dir = os.path.join(year_dir, str(level))
+        for (x, y), features in chunks.items():
+            atomic_write(os.path.join(level_dir, str(x), f'{y}.json'),
+                         json.dumps({'type': 'FeatureCollection', 'features': features},
+                                    separators=(',', ':')))
+        levels.append({
+            'zoom': level,
+            'chunk_zoom': chunk_zoom,
+            'chunks': sorted(f'{x}/{y}' for x, y in chunks),
+        })
+
+    index = {
+        'key': key,
+        'levels': levels,
+        'tours': [{
+            'slug': row['slug'],
+            'title': row['title'],
+            'date': row['date'],
+            'page': row['page'],
+            'centroid': row['centroid'],
+            'bbox': row['bbox'],
+        } for row in rows],
+    }
+    atomic_write(os.path.join(year_dir, 'index.json'),
+                 json.dumps(index, ensure_ascii=False, separators=(',', ':')))
+    return index
+
+
+class OverviewLayer(MacroElement):
+    """
+    Leaflet layer that loads the overview chunks of the current view.
+
+    Args:
+        index (dict): Index from ``build_overview``.
+        base_url (str): URL of the year's overview directory, relative to
+            the page the map is shown on.
+    """
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function() {
+            var map = {{ this._parent.get_name() }};
+            var index = {{ this.index_json }};
+            var base = {{ this.base_url_json }};
+            var style = {color: 'red', weight: 3, opacity: 0.7};
+            var tours = {};
+            index.tours.forEach(function(t) { tours[t.slug] = t; });
+
+            function link(t) {
+                var a = document.createElement('a');
+                a.href = t.page;
+                a.target = '_top';
+                a.textContent = t.title;
+                return a;
+            }
+
+            var markers = L.layerGroup(index.tours.map(function(t) {
+                return L.circleMarker(t.centroid, {radius: 6, color: 'red', fillOpacity: 0.7})
+                    .bindTooltip(t.title).bindPopup(link(t));
+            }));
+
+            var layers = index.levels.map(function(level) {
+                return {level: level, chunks: new Set(level.chunks), loaded: {},
+                        group: L.featureGroup()};
+            });
+
+            function onFeature(feature, layer) {
+                var t = tours[feature.properties.slug];
+                if (!t) return;
+                layer.bindTooltip(t.title, {sticky: true}).bindPopup(link(t));
+                layer.on('mouseover', function() { layer.setStyle({weight: 5, opacity: 1}); });
+                layer.on('mouseout', function() { layer.setStyle(style); });
+            }
+
+            function current() {
+                var zoom = map.getZoom(), found = layers[0];
+                layers.forEach(function(l) { if (l.level.zoom <= zoom) found = l; });
+                return found;
+            }
+
+            function update() {
+                var active = current();
+                layers.forEach(function(l) {
+                    if (l !== active && map.hasLayer(l.group)) map.removeLayer(l.group);
+                });
+                if (!map.hasLayer(active.group)) active.group.addTo(map);
+                if (map.getZoom() <= {{ this.marker_max_zoom }}) markers.addTo(map);
+                else map.removeLayer(markers);
+
+                var z = active.level.chunk_zoom, b = map.getPixelBounds();
+                var scale = Math.pow(2, map.getZoom() - z) * 256;
+                for (var x = Math.floor(b.min.x / scale); x <= Math.floor(b.max.x / scale); x++) {
+                    for (var y = Math.floor(b.min.y / scale); y <= Math.floor(b.max.y / scale); y++) {
+                        var name = x + '/' + y;
+                        if (!active.chunks.has(name) || active.loaded[name]) continue;
+                        active.loaded[name] = true;
+                        fetch(base + active.level.zoom + '/' + name + '.json')
+                            .then(function(r) { return r.json(); })
+                            .then(function(group) { return function(data) {
+                                L.geoJSON(data, {style: style, onEachFeature: onFeature}).addTo(group);
+                            }; }(active.group));
+                    }
+                }
+            }
+
+            map.on('moveend zoomend', update);
+            update();
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, index, base_url):
+        super().__init__()
+        self._name = 'OverviewLayer'
+        self.index_json = json.dumps({'levels': index['levels'], 'tours': index['tours']},
+                                     ensure_ascii=False, separators=(',', ':'))
+        self.base_url_json = json.dumps(base_url.rstrip('/') + '/')
+        self.marker_max_zoom = MARKER_MAX_ZOOM
+
+
+def overview_map(year, force=False, base_url=None):
+    """
+    Return a folium map of all tours of a year, for the year pages.
+
+    Builds the chunks first if a tour changed.
+
+    Args:
+        year (str or int): The year.
+        force (bool, optional): Rebuild the chunks.
+        base_url (str, optional): URL of the chunks relative to the page.
+            Defaults to ``overview/<year>/``, which fits files/<year>.qmd.
+
+    Returns:
+        folium.Map: The map.
+    """
+    index = build_overview(year, force)
+    m = folium.Map(location=[46.8182, 8.2275], zoom_start=8, tiles='OpenStreetMap')
+    bboxes = [t['bbox'] for t in index['tours'] if None not in t['bbox']]
+    if bboxes:
+        bboxes = np.array(bboxes)
+        m.fit_bounds([[bboxes[:, 0].min(), bboxes[:, 1].min()],
+                      [bboxes[:, 2].max(), bboxes[:, 3].max()]])
+    OverviewLayer(index, base_url or f'overview/{year}/').add_to(m)
+    return m
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build the overview map chunks of the year pages.')
+    parser.add_argument('years', nargs='*', help='years to build (default: all)')
+    parser.add_argument('--force', action='store_true', help='rebuild even if nothing changed')
+    args = parser.parse_args(argv)
+
+    years = args.years or sorted({t.year for t in discover_tours()})
+    for year in years:
+        start = time.perf_counter()
+        index = build_overview(year, args.force)
+        year_dir = os.path.join(OVERVIEW_DIR, year)
+        sizes = [os.path.getsize(os.path.join(root, name))
+                 for root, _, names in os.walk(year_dir) for name in names]
+        chunks = sum(len(level['chunks']) for level in index['levels'])
+        print(f"{year}: {len(index['tours'])} Touren, {chunks} Chunks, "
+              f"{sum(sizes) / 1024:.0f} KiB → {os.path.relpath(year_dir, BASE_DIR)} "
+              f"({time.perf_counter() - start:.2f} s)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
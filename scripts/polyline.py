@@ -0,0 +1,186 @@
+"""
+Compact encoding of track geometry for the map pages.
+
+folium writes the GeoJSON of a track into the page as JSON, every
+coordinate a float with 15 to 17 digits. This module quantises the
+coordinates to PRECISION decimals (1e-5 degrees: 1.1 m north-south, 0.8 m
+east-west in Switzerland) and writes each segment as an encoded polyline,
+the format of the Google Maps APIs: the differences between consecutive
+points, zigzag-encoded, in 5-bit groups of printable ASCII. A point of a
+hiking track then takes 4 to 8 bytes instead of about 40.
+
+``EncodedTrack`` is the folium layer for it: the page carries the encoded
+strings and a small decoder that turns them back into an ``L.geoJSON``
+layer, so the map looks and behaves like one built with ``folium.GeoJson``.
+Encoding and decoding are vectorised with NumPy.
+
+Usage:
+    from polyline import encode, decode
+    text = encode(track.lat, track.lon)
+    lat, lon = decode(text)
+"""
+
+import json
+
+import folium
+import numpy as np
+from jinja2 import Template
+
+PRECISION = 5
+
+# Decoder shipped with the page; ``decodePolyline(text, precision)``
+# returns [[lon, lat], ...] (GeoJSON order).
+DECODER_JS = """\
+function decodePolyline(text, precision) {
+    var factor = Math.pow(10, precision), coordinates = [], lat = 0, lon = 0, i = 0;
+    function next() {
+        var result = 0, shift = 0, b;
+        do {
+            b = text.charCodeAt(i++) - 63;
+            result |= (b & 0x1f) << shift;
+            shift += 5;
+        } while (b >= 0x20);
+        return result & 1 ? ~(result >> 1) : result >> 1;
+    }
+    while (i < text.length) {
+        lat += next();
+        lon += next();
+        coordinates.push([lon / factor, lat / factor]);
+    }
+    return coordinates;
+}"""
+
+# The groups of a 32-bit zigzag value.
+_MAX_GROUPS = 7
+
+
+def quantize(values, precision=PRECISION):
+    """Return coordinates in degrees as integers of 10**-precision degrees."""
+    return np.round(np.asarray(values, dtype=np.float64) * 10 ** precision).astype(np.int64)
+
+
+def encode(lat, lon, precision=PRECISION):
+    """
+    Encode a line as a polyline string.
+
+    Args:
+        lat (numpy.ndarray): Latitudes in degrees.
+        lon (numpy.ndarray): Longitudes in degrees.
+        precision (int, optional): Decimals kept.
+
+    Returns:
+        str: The encoded polyline.
+    """
+    deltas = np.empty((len(lat), 2), dtype=np.int64)
+    deltas[:, 0] = np.diff(quantize(lat, precision), prepend=0)
+    deltas[:, 1] = np.diff(quantize(lon, precision), prepend=0)
+    values = deltas.ravel()
+    values = np.where(values < 0, ~(values << 1), values << 1)
+
+    shifts = 5 * np.arange(_MAX_GROUPS, dtype=np.int64)
+    groups = (values[:, None] >> shifts) & 0x1f
+    # Number of groups per value: up to the highest non-zero group, at least one.
+    nonzero = groups != 0
+    counts = np.where(nonzero.any(axis=1), _MAX_GROUPS - np.argmax(nonzero[:, ::-1], axis=1), 1)
+    position = np.arange(_MAX_GROUPS)
+    used = position < counts[:, None]
+    groups |= np.where(position < counts[:, None] - 1, 0x20, 0)
+    return (groups[used] + 63).astype(np.uint8).tobytes().decode('ascii')
+
+
+def decode(text, precision=PRECISION):
+    """
+    Decode a polyline string.
+
+    Args:
+        text (str): The encoded polyline.
+        precision (int, optional): Decimals it was encoded with.
+
+    Returns:
+        tuple: (lat, lon) as numpy.ndarray of degrees.
+    """
+    if not text:
+        return np.empty(0), np.empty(0)
+    chunks = np.frombuffer(text.encode('ascii'), dtype=np.uint8).astype(np.int64) - 63
+    ends = np.flatnonzero(chunks < 0x20)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    position = np.arange(len(chunks)) - np.repeat(starts, ends - starts + 1)
+    values = np.add.reduceat((chunks & 0x1f) << (5 * position), starts)
+    values = np.where(values & 1, ~(values >> 1), values >> 1)
+    points = np.cumsum(values.reshape(-1, 2), axis=0) / 10 ** precision
+    return points[:, 0], points[:, 1]
+
+
+class EncodedTrack(folium.map.Layer):
+    """
+    A track layer carried as encoded polylines, drawn as ``L.geoJSON``.
+
+    Args:
+        track (Track): The (simplified) track; one polyline per segment.
+        name (str, optional): Name in the layer control.
+        style (dict, optional): Leaflet path options, as a
+            ``folium.GeoJson`` style function would return them.
+        precision (int, optional): Decimals kept.
+
+    Attributes:
+        data (dict): The GeoJSON FeatureCollection the page decodes to, with
+            the quantised coordinates (for ``save_map_png``).
+    """
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        var {{ this.get_name() }} = L.geoJSON({
+            type: 'FeatureCollection',
+            features: {{ this.encoded_json }}.map(function (text) {
+                return {type: 'Feature', properties: {name: 'GPX Track Segment'},
+                        geometry: {type: 'LineString',
+                                   coordinates: decodePolyline(text, {{ this.precision }})}};
+            })
+        }, {style: function () { return {{ this.style|tojson }}; }}
+        ).addTo({{ this._parent.get_name() }});
+        {% endmacro %}
+        """)
+
+    def __init__(self, track, name=None, style=None, precision=PRECISION):
+        super().__init__(name=name, overlay=True, control=True)
+        self._name = 'EncodedTrack'
+        self.precision = precision
+        self.style = style or {}
+        self.encoded = []
+        features = []
+        for s in track.segments():
+            if s.stop - s.start < 1:
+                continue
+            lat, lon = track.lat[s], track.lon[s]
+            self.encoded.append(encode(lat, lon, precision))
+            factor = 10 ** precision
+            coordinates = np.column_stack((quantize(lon, precision) / factor,
+                                           quantize(lat, precision) / factor))
+            features.append({
+                'type': 'Feature',
+                'geometry': {'type': 'LineString', 'coordinates': coordinates.tolist()},
+                'properties': {'name': 'GPX Track Segment'},
+            })
+        self.data = {'type': 'FeatureCollection', 'features': features}
+
+    @property
+    def encoded_json(self):
+        """The encoded strings as a JavaScript array."""
+        # branca parses the rendered script as a template again, so a '{{'
+        # in the data must not reach it.
+        return json.dumps(self.encoded).replace('{', '\\u007b')
+
+    def render(self, **kwargs):
+        # The decoder goes into the page once, however many tracks it has.
+        figure = self.get_root()
+        figure.script.add_child(folium.Element(DECODER_JS), name='decode_polyline')
+        super().render(**kwargs)
+
+    def get_bounds(self):
+        """Return [[south, west], [north, east]] of the track."""
+        coordinates = [point for feature in self.data['features']
+                       for point in feature['geometry']['coordinates']]
+        if not coordinates:
+            return [[None, None], [None, None]]
+        lon, lat = np.array(coordinates).T
+        return [[float(lat.min()), float(lon.min())], [float(lat.max()), float(lon.max())]]
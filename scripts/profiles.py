@@ -0,0 +1,476 @@
+"""
+Fast rendering of the elevation profiles, as PNG, SVG or PDF.
+
+``plot_profile`` in ``scripts.py`` draws through the pyplot state machine.
+This module draws the same figure with the object-oriented API on an Agg
+canvas, without pyplot and its figure manager, and thins the track out
+before drawing:
+
+    lttb            Largest-Triangle-Three-Buckets downsampling to at most
+                    one point per pixel column of the figure; it keeps the
+                    peaks and valleys a plain stride would cut off
+
+The statistics in the text box are computed from the full track. The file
+format follows from the extension of the output path:
+
+    .png    raster image, as ``elevation_profile.png`` today
+    .svg    vector image
+    .pdf    vector image for print
+
+SVG and PDF contain no dates and fixed element ids, so an unchanged track
+gives the same bytes (see ``deploy.py``). ``render_profiles`` renders the
+profiles of many tours on a process pool.
+
+For the HTML pages, ``profile_html`` embeds the profile as a few KB of JSON
+(``profile_data``, LTTB-downsampled to PROFILE_POINTS from the same arrays
+as the PNG) and draws it on a canvas in the browser. Hovering it posts the
+position to the map of the page, where the listener ``add_profile_marker``
+adds to the folium map moves a marker along the track.
+
+Usage:
+    python -m scripts.profiles [--format png|svg|pdf ...] [--out DIR]
+                               [--jobs N] [tour ...]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+try:
+    from .atomic import atomic_path
+    from .stats import track_stats
+    from .tours import discover_tours
+    from .tracing import span
+    from .tracks import load_track
+except ImportError:
+    from atomic import atomic_path
+    from stats import track_stats
+    from tours import discover_tours
+    from tracing import span
+    from tracks import load_track
+
+
+FORMATS = ('png', 'svg', 'pdf')
+FIGSIZE = (12, 4)
+DPI = 150
+COLOR = '#d62728'
+
+# One point per pixel column of the figure.
+MAX_POINTS = FIGSIZE[0] * DPI
+
+# Points of the interactive profile: plenty for a few hundred pixels.
+PROFILE_POINTS = 250
+
+# Below this many tours, a process pool costs more than it saves.
+_MIN_PARALLEL = 4
+
+_METADATA = {
+    'png': None,
+    'svg': {'Date': None},
+    'pdf': {'CreationDate': None},
+}
+
+
+def lttb(x, y, n):
+    """
+    Downsample a line to ``n`` points with Largest-Triangle-Three-Buckets.
+
+    The first and last points are kept. The points in between are split
+    into ``n - 2`` buckets; from each the point is taken that forms the
+    largest triangle with the point taken from the previous bucket and the
+    mean of the next bucket.
+
+    Args:
+        x (numpy.ndarray): Increasing x values.
+        y (numpy.ndarray): y values; without NaN.
+        n (int): Number of points to keep, at least 3.
+
+    Returns:
+        numpy.ndarray: Indices of the kept points, increasing.
+    """
+    size = len(x)
+    if n >= size or n < 3:
+        return np.arange(size)
+
+    edges = (np.arange(n - 1) * ((size - 2) / (n - 2))).astype(np.intp) + 1
+    edges[-1] = size - 1
+    keep = np.empty(n, dtype=np.intp)
+    keep[0] = 0
+    keep[-1] = size - 1
+    for i in range(n - 2):
+        start, stop = edges[i], edges[i + 1]
+        after = edges[i + 2] if i + 2 < n - 1 else size
+        next_x = x[stop:after].mean()
+        next_y = y[stop:after].mean()
+        prev_x, prev_y = x[keep[i]], y[keep[i]]
+        area = np.abs((prev_x - next_x) * (y[start:stop] - prev_y)
+                      - (prev_x - x[start:stop]) * (next_y - prev_y))
+        keep[i + 1] = start + int(area.argmax())
+    return keep
+
+
+def downsample(distances, elevations, max_points=MAX_POINTS):
+    """
+    Return the points of a profile worth drawing.
+
+    Args:
+        distances (numpy.ndarray): Distances along the track.
+        elevations (numpy.ndarray): Elevations.
+        max_points (int, optional): Upper bound of points to keep.
+
+    Returns:
+        tuple: (distances, elevations), unchanged if they are short enough or
+            have gaps (NaN), which LTTB would close.
+    """
+    if len(distances) <= max_points or not np.isfinite(elevations).all():
+        return distances, elevations
+    keep = lttb(distances, elevations, max_points)
+    return distances[keep], elevations[keep]
+
+
+def draw_profile(fig, track, max_points=MAX_POINTS):
+    """
+    Draw the elevation profile of a track into a figure.
+
+    Args:
+        fig (matplotlib.figure.Figure): Empty figure of size ``FIGSIZE``.
+        track (Track): Track loaded with ``tracks.load_track``.
+        max_points (int, optional): Points to draw at most; None draws all.
+
+    Returns:
+        matplotlib.axes.Axes: The axes of the profile.
+    """
+    distances = track.dist / 1000
+    elevations = track.ele
+    if max_points:
+        distances, elevations = downsample(distances, elevations, max_points)
+
+    ax = fig.add_subplot()
+    ax.plot(distances, elevations, linewidth=2, color=COLOR)
+    ax.fill_between(distances, elevations, alpha=0.3, color=COLOR)
+
+    ax.set_xlabel('Distanz (km)', fontsize=12)
+    ax.set_ylabel('Höhe (m ü. M.)', fontsize=12)
+    ax.set_title('Höhenprofil', fontsize=14, fontweight='bold')
+    ax.grid(True, alpha=0.3)
+
+    stats = track_stats(track)
+    ax.set_ylim(stats.min_elevation - 200, stats.max_elevation + 50)
+
+    ax.text(0.5, 0.02, stats.summary(), transform=ax.transAxes,
+            ha='center', fontsize=10,
+            bbox=dict(boxstyle='round', facecolor='wheat', alpha=0.5))
+
+    fig.tight_layout()
+    return ax
+
+
+def _format(path):
+    fmt = os.path.splitext(path)[1][1:].lower()
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown profile format {fmt!r} of {path}, expected one of {FORMATS}")
+    return fmt
+
+
+def render_profile(track, output_filename, max_points=MAX_POINTS):
+    """
+    Render the elevation profile of a track to a file.
+
+    Args:
+        track (Track): Track loaded with ``tracks.load_track``.
+        output_filename (str): Path of the image to write; the extension
+            selects the format. It is written to a unique temporary file
+            first and renamed into place.
+        max_points (int, optional): Points to draw at most; None draws all.
+
+    Raises:
+        ValueError: If the extension is not one of FORMATS.
+    """
+    from matplotlib import rc_context
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    fmt = _format(output_filename)
+    with span('profile.render', format=fmt), rc_context({'svg.hashsalt': 'elevation_profile'}):
+        fig = Figure(figsize=FIGSIZE)
+        FigureCanvasAgg(fig)
+        with span('profile.draw', points=len(track)):
+            draw_profile(fig, track, max_points)
+        with span('profile.savefig'), atomic_path(output_filename) as tmp_path:
+            fig.savefig(tmp_path, format=fmt, dpi=DPI, bbox_inches='tight',
+                        metadata=_METADATA[fmt])
+
+
+def profile_data(track, points=PROFILE_POINTS):
+    """
+    Return the interactive profile of a track as JSON-serialisable data.
+
+    Args:
+        track (Track): Track loaded with ``tracks.load_track``.
+        points (int, optional): Points to keep (LTTB over distance and
+            elevation, see ``lttb``).
+
+    Returns:
+        dict: Parallel lists ``d`` (m along the track), ``e`` (m, None in
+            gaps), ``lat`` and ``lon`` (first value, then differences, in
+            1e-5 degrees), the y range ``ylim`` of the PNG and its
+            ``summary`` line.
+    """
+    keep = np.arange(len(track))
+    if len(track) > points and np.isfinite(track.ele).all():
+        keep = lttb(track.dist, track.ele, points)
+    stats = track_stats(track)
+
+    def deltas(values):
+        fixed = np.round(values[keep] * 1e5).astype(np.int64)
+        return np.diff(fixed, prepend=0).tolist()
+
+    return {
+        'd': np.round(track.dist[keep]).astype(np.int64).tolist(),
+        'e': [None if np.isnan(e) else round(float(e)) for e in track.ele[keep]],
+        'lat': deltas(track.lat),
+        'lon': deltas(track.lon),
+        'ylim': [round(stats.min_elevation - 200), round(stats.max_elevation + 50)],
+        'summary': stats.summary(),
+    }
+
+
+_PROFILE_HTML = """\
+<div class="wanderalbum-profile" id="{id}" style="position:relative;width:100%;max-width:1200px">
+<canvas style="width:100%;height:{height}px;display:block"></canvas>
+<div style="text-align:center;font-size:0.85em">{summary}</div>
+<script type="application/json">{data}</script>
+<script>
+(function() {{
+  var root = document.getElementById('{id}');
+  var canvas = root.querySelector('canvas');
+  var p = JSON.parse(root.querySelector('script[type="application/json"]').textContent);
+  var n = p.d.length, pad = {{l: 48, r: 10, t: 10, b: 24}}, hover = -1;
+  p.d = p.d.map(function(d) {{ return d / 1000; }});
+  ['lat', 'lon'].forEach(function(k) {{
+    var sum = 0;
+    p[k] = p[k].map(function(v) {{ sum += v; return sum / 1e5; }});
+  }});
+  function x(d) {{ return pad.l + d / p.d[n - 1] * (canvas.clientWidth - pad.l - pad.r); }}
+  function y(e) {{ return pad.t + (p.ylim[1] - e) / (p.ylim[1] - p.ylim[0]) * (canvas.clientHeight - pad.t - pad.b); }}
+  function ticks(lo, hi, count) {{
+    var step = Math.pow(10, Math.floor(Math.log10((hi - lo) / count)));
+    step *= [1, 2, 5, 10].find(function(f) {{ return (hi - lo) / (step * f) <= count; }});
+    var out = [];
+    for (var v = Math.ceil(lo / step) * step; v <= hi; v += step) out.push(v);
+    return out;
+  }}
+  function draw() {{
+    var ratio = window.devicePixelRatio || 1, w = canvas.clientWidth, h = canvas.clientHeight;
+    canvas.width = w * ratio; canvas.height = h * ratio;
+    var c = canvas.getContext('2d');
+    c.scale(ratio, ratio);
+    c.font = '11px sans-serif'; c.fillStyle = '#444'; c.strokeStyle = 'rgba(0,0,0,0.1)';
+    c.textAlign = 'right';
+    ticks(p.ylim[0], p.ylim[1], 4).forEach(function(v) {{
+      c.beginPath(); c.moveTo(pad.l, y(v)); c.lineTo(w - pad.r, y(v)); c.stroke();
+      c.fillText(v + ' m', pad.l - 4, y(v) + 4);
+    }});
+    c.textAlign = 'center';
+    ticks(0, p.d[n - 1], 8).forEach(function(v) {{
+      c.beginPath(); c.moveTo(x(v), pad.t); c.lineTo(x(v), h - pad.b); c.stroke();
+      c.fillText(v + ' km', x(v), h - 8);
+    }});
+    c.beginPath();
+    p.d.forEach(function(d, i) {{ if (p.e[i] !== null) c.lineTo(x(d), y(p.e[i])); }});
+    c.strokeStyle = '{color}'; c.lineWidth = 2; c.stroke();
+    c.lineTo(x(p.d[n - 1]), h - pad.b); c.lineTo(x(0), h - pad.b);
+    c.globalAlpha = 0.3; c.fillStyle = '{color}'; c.fill(); c.globalAlpha = 1;
+    if (hover >= 0 && p.e[hover] !== null) {{
+      var hx = x(p.d[hover]), hy = y(p.e[hover]);
+      c.strokeStyle = '#444'; c.lineWidth = 1;
+      c.beginPath(); c.moveTo(hx, pad.t); c.lineTo(hx, h - pad.b); c.stroke();
+      c.beginPath(); c.arc(hx, hy, 4, 0, 2 * Math.PI); c.fillStyle = '{color}'; c.fill();
+      c.fillStyle = '#000'; c.textAlign = hx > w / 2 ? 'right' : 'left';
+      c.fillText(p.d[hover].toFixed(1) + ' km, ' + p.e[hover] + ' m', hx + (hx > w / 2 ? -6 : 6), pad.t + 12);
+    }}
+  }}
+  function post(message) {{
+    message.wanderalbum = 'profile';
+    window.postMessage(message, '*');
+    document.querySelectorAll('iframe').forEach(function(f) {{
+      if (f.contentWindow) f.contentWindow.postMessage(message, '*');
+    }});
+  }}
+  canvas.addEventListener('mousemove', function(event) {{
+    var d = (event.offsetX - pad.l) / (canvas.clientWidth - pad.l - pad.r) * p.d[n - 1];
+    var lo = 0, hi = n - 1;
+    while (lo < hi) {{ var mid = (lo + hi) >> 1; if (p.d[mid] < d) lo = mid + 1; else hi = mid; }}
+    if (lo > 0 && d - p.d[lo - 1] < p.d[lo] - d) lo -= 1;
+    if (lo !== hover) {{ hover = lo; draw(); post({{lat: p.lat[lo], lon: p.lon[lo]}}); }}
+  }});
+  canvas.addEventListener('mouseleave', function() {{ hover = -1; draw(); post({{lat: null}}); }});
+  window.addEventListener('resize', draw);
+  draw();
+}})();
+</script>
+</div>
+"""
+
+_MARKER_JS = """
+{% macro script(this, kwargs) %}
+(function() {
+    var map = {{ this._parent.get_name() }}, marker = null;
+    window.addEventListener('message', function(event) {
+        var data = event.data;
+        if (!data || data.wanderalbum !== 'profile') return;
+        if (data.lat === null) {
+            if (marker) { map.removeLayer(marker); marker = null; }
+        } else if (marker) {
+            marker.setLatLng([data.lat, data.lon]);
+        } else {
+            marker = L.circleMarker([data.lat, data.lon], {
+                radius: 6, color: '#fff', weight: 2, fillColor: '{{ this.color }}', fillOpacity: 1
+            }).addTo(map);
+        }
+    });
+})();
+{% endmacro %}
+"""
+
+
+def profile_html(track, points=PROFILE_POINTS, height=220):
+    """
+    Return the interactive elevation profile of a track as an HTML fragment.
+
+    The fragment holds the data of ``profile_data`` as JSON and a script
+    that draws it on a canvas. Moving the mouse over the profile posts
+    ``{wanderalbum: 'profile', lat, lon}`` (``lat: null`` on leaving) to the
+    page and to its iframes, where the map of ``create_map`` shows the
+    position (see ``add_profile_marker``).
+
+    Args:
+        track (Track): Track loaded with ``tracks.load_track``.
+        points (int, optional): Points to keep.
+        height (int, optional): Height of the canvas in CSS pixels.
+
+    Returns:
+        str: The fragment. Its element id derives from the track's hash, so
+            the same track always gives the same bytes.
+    """
+    from html import escape
+
+    data = profile_data(track, points)
+    payload = json.dumps(data, separators=(',', ':'), ensure_ascii=False)
+    return _PROFILE_HTML.format(
+        id=f'profile-{track.sha256[:12] or id(track)}', height=height, color=COLOR,
+        summary=escape(data['summary']), data=payload.replace('</', '<\\/'))
+
+
+def add_profile_marker(m):
+    """
+    Let a folium map show the position hovered in ``profile_html``.
+
+    Args:
+        m (folium.Map): The map.
+
+    Returns:
+        folium.Map: ``m``.
+    """
+    from branca.element import MacroElement
+    from jinja2 import Template
+
+    element = MacroElement()
+    element._name = 'profile_marker'
+    element._template = Template(_MARKER_JS)
+    element.color = COLOR
+    m.add_child(element)
+    return m
+
+
+def profile_paths(tour, formats=('png',), out_dir=None):
+    """
+    Return the output paths of the profile of a tour.
+
+    Args:
+        tour (Tour): The tour.
+        formats (tuple, optional): Formats to produce.
+        out_dir (str, optional): Write into this directory, as
+            ``<prefix>_elevation_profile.<ext>``, instead of the tour
+            directory.
+
+    Returns:
+        list: One path per format.
+    """
+    if out_dir:
+        return [os.path.join(out_dir, f'{tour.prefix}_elevation_profile.{fmt}')
+                for fmt in formats]
+    return [os.path.join(tour.directory, f'elevation_profile.{fmt}') for fmt in formats]
+
+
+def _render_task(task):
+    gpx, paths = task
+    start = time.perf_counter()
+    try:
+        track = load_track(gpx)
+        for path in paths:
+            render_profile(track, path)
+    except Exception as e:
+        return paths, f"{type(e).__name__}: {e}", time.perf_counter() - start
+    return paths, None, time.perf_counter() - start
+
+
+def render_profiles(tours, formats=('png',), workers=None, out_dir=None):
+    """
+    Render the profiles of many tours.
+
+    All formats of a tour are rendered in the same worker, from one parse
+    of its GPX file.
+
+    Args:
+        tours (list): Tour objects.
+        formats (tuple, optional): Formats to produce.
+        workers (int, optional): Size of the process pool. Defaults to the
+            number of CPUs; 1 renders in this process.
+        out_dir (str, optional): See ``profile_paths``.
+
+    Returns:
+        list: (output paths, error message or None, seconds) per tour.
+    """
+    tasks = [(tour.gpx, profile_paths(tour, formats, out_dir)) for tour in tours]
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(tasks) >= _MIN_PARALLEL:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+            return list(pool.map(_render_task, tasks))
+    return [_render_task(task) for task in tasks]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Render the elevation profiles of all tours.')
+    parser.add_argument('tours', nargs='*', help='tour directories (default: all)')
+    parser.add_argument('-f', '--format', dest='formats', action='append', choices=FORMATS,
+                        help='output format, repeatable (default: png)')
+    parser.add_argument('--out', help='write all profiles into this directory')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='number of worker processes (default: CPU count)')
+    args = parser.parse_args(argv)
+
+    tours = discover_tours()
+    if args.tours:
+        wanted = {os.path.basename(os.path.normpath(t)) for t in args.tours}
+        tours = [t for t in tours if t.slug in wanted]
+
+    start = time.perf_counter()
+    results = render_profiles(tours, tuple(args.formats or ('png',)), args.jobs, args.out)
+    failed = [(paths, error) for paths, error, _ in results if error]
+    for paths, error in failed:
+        print(f"✗ {paths[0]}: {error}")
+    rendered = sum(len(paths) for paths, error, _ in results if not error)
+    print(f"{len(tours)} Touren, {rendered} Profile gerendert, "
+          f"{len(failed)} Fehler ({time.perf_counter() - start:.2f} s)")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
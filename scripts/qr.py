@@ -0,0 +1,402 @@
+"""
+Batch generation of the QR codes of the tours, as PNG, SVG or PDF.
+
+Every tour page has two QR codes: one for the map.geo.admin.ch link and one
+for the swisstopo app link. ``generate_qr_codes`` renders any number of
+them at once on a process pool. The file format follows from the extension
+of each output path:
+
+    .png    raster image, as made by ``generate_qr_code_for_url``
+    .svg    vector image for the web pages
+    .pdf    vector image for the LaTeX build, which then does not have to
+            scale a raster image
+
+SVG and PDF are drawn from the module matrix of the code, one rectangle per
+run of dark modules, and contain no timestamps, so the same URL always
+gives the same bytes. Rendered files are cached in ``.cache/qr/`` under a
+hash of the URL, the rendering options and the format. An output whose
+content is already right is not rewritten.
+
+The file names are deterministic, ``<prefix>_qr_tag.<ext>`` and
+``<prefix>_app_qr_tag.<ext>``, the names the PDF tables of the notebooks
+refer to (see ``qr_filename``).
+
+Usage:
+    python -m scripts.qr [--format png|svg|pdf ...] [--images | --out DIR]
+                         [--jobs N] [tour ...]
+"""
+
+import argparse
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import sys
+import time
+
+try:
+    from .atomic import atomic_path, atomic_write
+    from .tours import BASE_DIR, discover_tours
+except ImportError:
+    from atomic import atomic_path, atomic_write
+    from tours import BASE_DIR, discover_tours
+
+
+QR_CACHE_DIR = os.path.join(BASE_DIR, '.cache', 'qr')
+IMAGES_DIR = os.path.join(BASE_DIR, 'images')
+
+# Bump when the rendering changes, to invalidate the cache.
+QR_VERSION = 1
+
+FORMATS = ('png', 'svg', 'pdf')
+
+# The options of save_qr_code in scripts.py.
+DEFAULT_OPTIONS = {
+    'error_correction': 'L',
+    'box_size': 10,
+    'border': 4,
+    'fill_color': 'black',
+    'back_color': 'white',
+}
+
+# Kinds of QR code per tour, i.e. the part of the file name after the prefix.
+KINDS = ('qr_tag', 'app_qr_tag')
+
+# Batches with fewer codes to render are not worth starting a pool for.
+_MIN_PARALLEL = 8
+
+_IMAGE_REF = re.compile(r"(?:\.\./)*(images/[^\s)\"'\\]*?)/?(\d{6})_[\w.-]+\.(?:png|jpe?g)")
+
+
+def _options(options):
+    merged = dict(DEFAULT_OPTIONS)
+    merged.update(options or {})
+    return merged
+
+
+def _format(path):
+    fmt = os.path.splitext(path)[1].lstrip('.').lower()
+    if fmt not in FORMATS:
+        raise ValueError(f"Unbekanntes QR-Format: {path} (erwartet: {', '.join(FORMATS)})")
+    return fmt
+
+
+def _qr(url, options):
+    import qrcode
+    from qrcode import constants
+
+    qr = qrcode.QRCode(
+        version=None,
+        error_correction=getattr(constants, f"ERROR_CORRECT_{options['error_correction']}"),
+        box_size=options['box_size'],
+        border=options['border'],
+    )
+    qr.add_data(url)
+    qr.make(fit=True)
+    return qr
+
+
+def _runs(matrix):
+    """Yield (x, y, length) of every horizontal run of dark modules."""
+    for y, row in enumerate(matrix):
+        x = 0
+        while x < len(row):
+            if row[x]:
+                start = x
+                while x < len(row) and row[x]:
+                    x += 1
+                yield start, y, x - start
+            else:
+                x += 1
+
+
+def _svg(matrix, options):
+    size = len(matrix)
+    pixels = size * options['box_size']
+    path = ''.join(f"M{x} {y}h{n}v1h-{n}z" for x, y, n in _runs(matrix))
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{pixels}" height="{pixels}" '
+        f'viewBox="0 0 {size} {size}" shape-rendering="crispEdges">'
+        f'<rect width="{size}" height="{size}" fill="{options["back_color"]}"/>'
+        f'<path d="{path}" fill="{options["fill_color"]}"/></svg>\n'
+    ).encode('ascii')
+
+
+def _pdf_color(name):
+    from PIL import ImageColor
+
+    return ' '.join(f'{c / 255:g}' for c in ImageColor.getrgb(name)[:3])
+
+
+def _pdf(matrix, options):
+    # One page of box_size points per module; y runs downwards in the matrix.
+    size = len(matrix)
+    box = options['box_size']
+    rects = '\n'.join(f"{x} {size - y - 1} {n} 1 re" for x, y, n in _runs(matrix))
+    content = (f"q {box} 0 0 {box} 0 0 cm\n"
+               f"{_pdf_color(options['back_color'])} rg 0 0 {size} {size} re f\n"
+               f"{_pdf_color(options['fill_color'])} rg\n{rects}\nf\nQ\n").encode('ascii')
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {size * box} {size * box}] "
+        f"/Contents 4 0 R /Resources << >> >>".encode('ascii'),
+        b"<< /Length %d >>\nstream\n%sendstream" % (len(content), content),
+    ]
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n%s\nendobj\n" % (number, body))
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for offset in offsets:
+        out.write(b"%010d 00000 n \n" % offset)
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+              % (len(objects) + 1, xref))
+    return out.getvalue()
+
+
+def render_qr(url, fmt='png', options=None):
+    """
+    Render the QR code of a URL.
+
+    Args:
+        url (str): The URL to encode.
+        fmt (str, optional): ``'png'``, ``'svg'`` or ``'pdf'``.
+        options (dict, optional): Overrides of ``DEFAULT_OPTIONS``.
+
+    Returns:
+        bytes: The file content.
+    """
+    return _render(url, (fmt,), _options(options))[fmt]
+
+
+def _render(url, formats, options):
+    # The matrix is computed once for all formats of a URL.
+    qr = _qr(url, options)
+    result = {}
+    for fmt in formats:
+        if fmt == 'png':
+            image = qr.make_image(fill_color=options['fill_color'],
+                                  back_color=options['back_color'])
+            buffer = io.BytesIO()
+            image.save(buffer, format='PNG')
+            result[fmt] = buffer.getvalue()
+        elif fmt == 'svg':
+            result[fmt] = _svg(qr.get_matrix(), options)
+        else:
+            result[fmt] = _pdf(qr.get_matrix(), options)
+    return result
+
+
+def cache_key(url, fmt, options=None):
+    """Return the cache key of a URL rendered as ``fmt`` with ``options``."""
+    payload = json.dumps({'version': QR_VERSION, 'url': url, 'format': fmt,
+                          'options': _options(options)}, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _cache_path(cache_dir, key, fmt):
+    return os.path.join(cache_dir, key[:2], f'{key}.{fmt}')
+
+
+def _render_to_cache(task):
+    """Render the missing formats of one URL into the cache (in a worker)."""
+    url, formats, options, cache_dir = task
+    for fmt, data in _render(url, formats, options).items():
+        atomic_write(_cache_path(cache_dir, cache_key(url, fmt, options), fmt), data)
+    return url
+
+
+def _publish(source, path):
+    """Copy ``source`` to ``path`` unless it already has that content."""
+    try:
+        if os.path.getsize(path) == os.path.getsize(source):
+            with open(path, 'rb') as a, open(source, 'rb') as b:
+                if a.read() == b.read():
+                    return False
+    except FileNotFoundError:
+        pass
+    with atomic_path(path) as tmp_path:
+        shutil.copyfile(source, tmp_path)
+    return True
+
+
+def generate_qr_codes(requests, options=None, workers=None, cache_dir=QR_CACHE_DIR):
+    """
+    Generate many QR codes at once.
+
+    Codes that are not in the cache yet are rendered on a process pool, all
+    formats of one URL in the same worker. Every output is then published
+    atomically from the cache, unless it already has the right content.
+
+    Args:
+        requests (iterable): (url, output path) pairs. The extension of the
+            path selects the format.
+        options (dict, optional): Overrides of ``DEFAULT_OPTIONS``, for all
+            codes of the batch.
+        workers (int, optional): Size of the process pool. Defaults to the
+            number of CPUs; 1 renders in this process.
+        cache_dir (str, optional): Where rendered codes are cached.
+
+    Returns:
+        dict: Counts of ``'rendered'`` codes and of ``'written'`` and
+            ``'unchanged'`` outputs.
+
+    Raises:
+        ValueError: If an output path has an unknown extension.
+    """
+    options = _options(options)
+    requests = [(url, path, _format(path)) for url, path in requests]
+
+    missing = {}
+    for url, _, fmt in requests:
+        if not os.path.exists(_cache_path(cache_dir, cache_key(url, fmt, options), fmt)):
+            formats = missing.setdefault(url, [])
+            if fmt not in formats:
+                formats.append(fmt)
+    tasks = [(url, tuple(formats), options, cache_dir) for url, formats in missing.items()]
+
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(tasks) >= _MIN_PARALLEL:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+            list(pool.map(_render_to_cache, tasks, chunksize=max(1, len(tasks) // (4 * workers))))
+    else:
+        for task in tasks:
+            _render_to_cache(task)
+
+    counts = {'rendered': sum(len(t[1]) for t in tasks), 'written': 0, 'unchanged': 0}
+    for url, path, fmt in requests:
+        source = _cache_path(cache_dir, cache_key(url, fmt, options), fmt)
+        counts['written' if _publish(source, path) else 'unchanged'] += 1
+    return counts
+
+
+def save_qr(url, path, options=None, cache_dir=QR_CACHE_DIR):
+    """
+    Save the QR code of one URL; the extension of ``path`` selects the format.
+
+    Args:
+        url (str): The URL to encode.
+        path (str): Output file (.png, .svg or .pdf).
+        options (dict, optional): Overrides of ``DEFAULT_OPTIONS``.
+        cache_dir (str, optional): Where rendered codes are cached.
+    """
+    generate_qr_codes([(url, path)], options, workers=1, cache_dir=cache_dir)
+
+
+def qr_filename(tour, kind='qr_tag', fmt='png'):
+    """
+    Return the deterministic file name of a tour's QR code.
+
+    Args:
+        tour (Tour): The tour.
+        kind (str, optional): ``'qr_tag'`` (map.geo.admin.ch link) or
+            ``'app_qr_tag'`` (swisstopo app link).
+        fmt (str, optional): ``'png'``, ``'svg'`` or ``'pdf'``.
+
+    Returns:
+        str: E.g. ``'260203_app_qr_tag.pdf'``.
+    """
+    if kind not in KINDS:
+        raise ValueError(f"Unbekannte QR-Art: {kind} (erwartet: {', '.join(KINDS)})")
+    return f"{tour.prefix}_{kind}.{fmt}"
+
+
+def images_dir(tour):
+    """
+    Return the directory below images/ the notebook's images are in.
+
+    The 2025 notebooks use ``images/`` itself, the 2026 notebooks
+    ``images/<year>/<prefix>/``; tours whose notebook refers to no image of
+    their own get the latter.
+    """
+    if tour.notebook:
+        with open(tour.notebook, 'r', encoding='utf-8') as f:
+            for match in _IMAGE_REF.finditer(f.read()):
+                if match.group(2) == tour.prefix:
+                    return os.path.join(BASE_DIR, *match.group(1).rstrip('/').split('/'))
+    return os.path.join(IMAGES_DIR, tour.year, tour.prefix)
+
+
+def tour_urls(tour):
+    """Return the URL of each kind of QR code of a tour."""
+    try:
+        from . import scripts as helpers
+        from .build import map_center
+    except ImportError:
+        import scripts as helpers
+        from build import map_center
+
+    _, swiss_grid = map_center(tour)
+    return {
+        'qr_tag': helpers.create_swisstopo_url(swiss_grid, tour.gpx_url),
+        'app_qr_tag': helpers.create_swisstopo_link(tour.gpx_url),
+    }
+
+
+def tour_requests(tours, formats=('png',), layout='tour', out_dir=None):
+    """
+    Return the (url, output path) pairs of the QR codes of ``tours``.
+
+    Args:
+        tours (list): Tour objects.
+        formats (tuple, optional): Formats to produce.
+        layout (str, optional): ``'tour'`` writes next to the notebook,
+            ``'images'`` to where the notebook's PDF table expects it (see
+            ``images_dir``).
+        out_dir (str, optional): Write all codes into this directory instead.
+
+    Returns:
+        list: (url, path) pairs for ``generate_qr_codes``.
+    """
+    requests = []
+    for tour in tours:
+        if out_dir:
+            directory = out_dir
+        elif layout == 'images':
+            directory = images_dir(tour)
+        else:
+            directory = tour.directory
+        for kind, url in tour_urls(tour).items():
+            for fmt in formats:
+                requests.append((url, os.path.join(directory, qr_filename(tour, kind, fmt))))
+    return requests
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate the QR codes of all tours.')
+    parser.add_argument('tours', nargs='*', help='tour directories (default: all)')
+    parser.add_argument('-f', '--format', dest='formats', action='append', choices=FORMATS,
+                        help='output format, repeatable (default: png)')
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument('--images', action='store_true',
+                        help='write to images/, where the PDF tables refer to')
+    target.add_argument('--out', help='write all codes into this directory')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='number of worker processes (default: CPU count)')
+    args = parser.parse_args(argv)
+
+    tours = discover_tours()
+    if args.tours:
+        wanted = {os.path.basename(os.path.normpath(t)) for t in args.tours}
+        tours = [t for t in tours if t.slug in wanted]
+
+    start = time.perf_counter()
+    requests = tour_requests(tours, tuple(args.formats or ('png',)),
+                             'images' if args.images else 'tour', args.out)
+    counts = generate_qr_codes(requests, workers=args.jobs)
+    print(f"{len(tours)} Touren, {len(requests)} QR-Codes: {counts['rendered']} gerendert, "
+          f"{counts['written']} geschrieben, {counts['unchanged']} unverändert "
+          f"({time.perf_counter() - start:.2f} s)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
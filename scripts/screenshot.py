@@ -0,0 +1,225 @@
+"""
+Screenshot service for Folium maps.
+
+Starting Chrome is the most expensive part of turning a map into a PNG, so
+this module keeps a small pool of long-lived headless browsers that callers
+borrow from. Instead of sleeping a fixed amount of time, a capture waits until
+Leaflet reports that every tile layer has finished loading and the GeoJSON
+track layer is on the map.
+
+Usage:
+    from screenshot import capture
+    capture('temp_map_export.html', 'map_output.png', map_name=m.get_name())
+"""
+
+import atexit
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    from .tracing import span
+except ImportError:
+    from tracing import span
+
+# Selenium is imported where a browser is actually needed, so that importing
+# this module (and scripts.py) stays cheap.
+
+
+DEFAULT_TIMEOUT = float(os.environ.get('WANDERALBUM_SCREENSHOT_TIMEOUT', 15))
+DEFAULT_POOL_SIZE = int(os.environ.get('WANDERALBUM_BROWSERS', 2))
+
+# Time to let Leaflet's tile fade-in animation (200 ms) finish after the
+# last tile has loaded.
+SETTLE_SECONDS = 0.3
+
+# Returns true once the page has loaded, no tile layer is loading any more
+# and (if requested) a GeoJSON layer has been added to the map.
+_READY_SCRIPT = """
+var map = window[arguments[0]];
+var needTrack = arguments[1];
+if (document.readyState !== 'complete' || !map || !window.L) {
+    return false;
+}
+var ready = true;
+var hasTrack = false;
+map.eachLayer(function (layer) {
+    if (layer instanceof L.GridLayer) {
+        var loading = layer.isLoading ? layer.isLoading() : layer._loading;
+        if (loading) {
+            ready = false;
+        }
+    }
+    if (layer instanceof L.GeoJSON) {
+        hasTrack = true;
+    }
+});
+return ready && (hasTrack || !needTrack);
+"""
+
+
+def _chrome_options(width=800, height=600):
+    from selenium.webdriver.chrome.options import Options
+
+    options = Options()
+    options.add_argument('--headless')
+    options.add_argument('--no-sandbox')
+    options.add_argument('--disable-dev-shm-usage')
+    options.add_argument(f'--window-size={width},{height}')
+    return options
+
+
+class BrowserPool:
+    """
+    A pool of long-lived headless Chrome instances.
+
+    Browsers are started lazily, up to ``size`` at a time, and reused for
+    subsequent screenshots. A browser that raised an error while borrowed is
+    discarded and replaced on the next request.
+
+    Args:
+        size (int, optional): Maximum number of browsers. Defaults to the
+            ``WANDERALBUM_BROWSERS`` environment variable or 2.
+    """
+
+    def __init__(self, size=None):
+        self.size = size or DEFAULT_POOL_SIZE
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._started = 0
+        self._closed = False
+
+    def acquire(self):
+        """Return an idle browser, starting a new one if the pool has room."""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Browser pool is closed")
+            start_new = self._started < self.size
+            if start_new:
+                self._started += 1
+
+        if not start_new:
+            return self._idle.get()
+
+        try:
+            with span('screenshot.chrome_start'):
+                from selenium import webdriver
+
+                return webdriver.Chrome(options=_chrome_options())
+        except Exception:
+            with self._lock:
+                self._started -= 1
+            raise
+
+    def release(self, driver, broken=False):
+        """Return a browser to the pool, or quit it if it is broken."""
+        if broken or self._closed:
+            with self._lock:
+                self._started -= 1
+            try:
+                driver.quit()
+            except Exception:
+                pass
+            return
+        self._idle.put(driver)
+
+    @contextmanager
+    def borrow(self):
+        """Context manager that lends out a browser and takes it back."""
+        driver = self.acquire()
+        try:
+            yield driver
+        except Exception:
+            self.release(driver, broken=True)
+            raise
+        self.release(driver)
+
+    def close(self):
+        """Quit all idle browsers. Borrowed ones are quit when released."""
+        self._closed = True
+        while True:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self.release(driver, broken=True)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the process-wide browser pool, creating it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = BrowserPool()
+            atexit.register(_pool.close)
+        return _pool
+
+
+def wait_until_ready(driver, map_name, timeout=DEFAULT_TIMEOUT, need_track=True):
+    """
+    Block until the Leaflet map ``map_name`` has finished loading.
+
+    Args:
+        driver: Selenium WebDriver showing the map page.
+        map_name (str): JavaScript variable name of the map (``m.get_name()``).
+        timeout (float, optional): Maximum seconds to wait.
+        need_track (bool, optional): Also wait for a GeoJSON layer.
+
+    Raises:
+        selenium.common.exceptions.TimeoutException: If the map is not ready
+            within ``timeout`` seconds.
+    """
+    from selenium.webdriver.support.ui import WebDriverWait
+
+    with span('screenshot.wait'):
+        WebDriverWait(driver, timeout, poll_frequency=0.05).until(
+            lambda d: d.execute_script(_READY_SCRIPT, map_name, need_track))
+    with span('screenshot.settle'):
+        time.sleep(SETTLE_SECONDS)
+
+
+def capture(html_path, output_filename, map_name=None, width=800, height=600,
+            timeout=DEFAULT_TIMEOUT, need_track=True, pool=None):
+    """
+    Render a saved Folium map page to a PNG using a pooled browser.
+
+    Args:
+        html_path (str): Path to the HTML file written by ``m.save``.
+        output_filename (str): Path of the PNG to write.
+        map_name (str, optional): JavaScript name of the map (``m.get_name()``).
+            Without it the function falls back to waiting for the page load.
+        width (int, optional): Width of the screenshot in pixels.
+        height (int, optional): Height of the screenshot in pixels.
+        timeout (float, optional): Maximum seconds to wait for the tiles.
+        need_track (bool, optional): Wait for the GeoJSON track layer too.
+        pool (BrowserPool, optional): Pool to borrow from. Defaults to the
+            process-wide pool.
+    """
+    pool = pool or get_pool()
+    with span('screenshot.capture'), pool.borrow() as driver:
+        with span('screenshot.load'):
+            driver.set_window_size(width, height)
+            driver.get(f'file://{os.path.abspath(html_path)}')
+        if map_name:
+            wait_until_ready(driver, map_name, timeout, need_track)
+        else:
+            from selenium.webdriver.support.ui import WebDriverWait
+
+            with span('screenshot.wait'):
+                WebDriverWait(driver, timeout).until(
+                    lambda d: d.execute_script('return document.readyState') == 'complete')
+            with span('screenshot.settle'):
+                time.sleep(SETTLE_SECONDS)
+        with span('screenshot.save'):
+            driver.save_screenshot(output_filename)
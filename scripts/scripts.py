@@ -8,26 +8,215 @@ This module provides functions to:
 - Generate QR codes for URLs
 """
 
-import folium
-import gpxpy
+import base64
 import os
-from IPython.display import Image, display
-import matplotlib.pyplot as plt
-import qrcode
 import sys
-import time
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-import base64
+import tempfile
+from importlib import import_module
+
+try:
+    from . import screenshot
+    from .atomic import atomic_path
+    from .memo import memoize, skip_store
+    from .tracing import span, traced
+except ImportError:
+    import screenshot
+    from atomic import atomic_path
+    from memo import memoize, skip_store
+    from tracing import span, traced
+
+
+class _Lazy:
+    """
+    Stand-in for a module, or a name in a module, that is imported on first use.
+
+    Notebooks run ``from scripts import *``; importing folium, matplotlib,
+    qrcode, IPython and NumPy up front would cost over a second even when
+    only ``create_swisstopo_url`` is needed. The stand-in replaces itself in
+    this module's namespace once the real object is loaded.
+
+    Args:
+        name (str): Name of the stand-in in this module.
+        module (str): Module to import.
+        attribute (str, optional): Name to take from the module.
+        local (bool, optional): ``module`` is a sibling in scripts/.
+    """
+
+    def __init__(self, name, module, attribute=None, local=False):
+        self._name = name
+        self._module = module
+        self._attribute = attribute
+        self._local = local
+        self._target = None
+
+    def _load(self):
+        if self._target is None:
+            with span('import', module=self._module):
+                if self._local and __package__:
+                    module = import_module(f'.{self._module}', __package__)
+                else:
+                    module = import_module(self._module)
+            self._target = getattr(module, self._attribute) if self._attribute else module
+            globals()[self._name] = self._target
+        return self._target
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+
+    def __call__(self, *args, **kwargs):
+        return self._load()(*args, **kwargs)
+
+    def __repr__(self):
+        target = self._module + (f'.{self._attribute}' if self._attribute else '')
+        return f"<lazy {target}>"
+
+
+folium = _Lazy('folium', 'folium')
+gpxpy = _Lazy('gpxpy', 'gpxpy')
+plt = _Lazy('plt', 'matplotlib.pyplot')
+qrcode = _Lazy('qrcode', 'qrcode')
+Image = _Lazy('Image', 'IPython.display', 'Image')
+HTML = _Lazy('HTML', 'IPython.display', 'HTML')
+display = _Lazy('display', 'IPython.display', 'display')
+static_map = _Lazy('static_map', 'static_map', local=True)
+simplify_track = _Lazy('simplify_track', 'simplify', 'simplify_track', local=True)
+track_stats = _Lazy('track_stats', 'stats', 'track_stats', local=True)
+load_track = _Lazy('load_track', 'tracks', 'load_track', local=True)
+polyline = _Lazy('polyline', 'polyline', local=True)
+profiles = _Lazy('profiles', 'profiles', local=True)
+
+# The stand-ins are not star-exported: they would replace the real folium,
+# plt, Image, display, ... that the notebooks import just before
+# ``from scripts import *``. Use them as attributes of this module.
+__all__ = [
+    'base64', 'os', 'sys', 'screenshot',
+    'MAP_BACKENDS', 'MAP_ENCODINGS', 'SavedMap', 'output_path', 'create_map', 'build_map',
+    'save_map_png', 'profile', 'plot_profile', 'create_swisstopo_url',
+    'generate_qr_code_for_url', 'save_qr_code', 'create_swisstopo_link',
+]
+
+
+def __getattr__(name):
+    # Constants of the helper modules, without importing NumPy up front.
+    if name == 'DEFAULT_TOLERANCE':
+        return _Lazy(name, 'simplify', name, local=True)._load()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+MAP_BACKENDS = ('browser', 'static')
+MAP_ENCODINGS = ('polyline', 'geojson')
+
+
+def output_path(output_dir, output_name):
+    """
+    Return where a helper writes its output, creating the directory.
+
+    Args:
+        output_dir (str or None): Directory; None means the working directory.
+        output_name (str): File name.
+
+    Returns:
+        str: The path.
+    """
+    if not output_dir:
+        return output_name
+    os.makedirs(output_dir, exist_ok=True)
+    return os.path.join(output_dir, output_name)
+
 
+def _outputs(arguments):
+    # Output of a helper from its bound arguments, for memoize.
+    return [output_path(arguments['output_dir'], arguments['output_name'])]
 
-def create_map(middle, path, title, width=800, height=600, gpx_url=None):
+
+class SavedMap:
+    """
+    A map restored from the memo cache (see ``memo.py``).
+
+    Holds the page rendered from a ``folium.Map`` and displays in a notebook
+    exactly like the map itself.
+
+    Args:
+        html (str): The rendered page (``m.get_root().render()``).
+    """
+
+    def __init__(self, html):
+        self.html = html
+
+    @classmethod
+    def dump(cls, m, path):
+        """Store the page of a folium.Map (or SavedMap) in ``path``."""
+        html = m.html if isinstance(m, cls) else m.get_root().render()
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(html)
+
+    @classmethod
+    def load(cls, path):
+        """Return the SavedMap stored in ``path``."""
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(f.read())
+
+    def save(self, outfile):
+        """Write the page to ``outfile``, like ``folium.Map.save``."""
+        with open(outfile, 'w', encoding='utf-8') as f:
+            f.write(self.html)
+
+    def _repr_html_(self):
+        # Same markup as branca's Figure._repr_html_ with its defaults.
+        from html import escape
+
+        return ('<div style="width:100%;">'
+                '<div style="position:relative;width:100%;height:0;padding-bottom:60%;">'
+                '<span style="color:#565656">Make this Notebook Trusted to load map: '
+                'File -> Trust Notebook</span>'
+                f'<iframe srcdoc="{escape(self.html)}" style="position:absolute;width:100%;'
+                'height:100%;left:0;top:0;border:none !important;" '
+                'allowfullscreen webkitallowfullscreen mozallowfullscreen></iframe>'
+                '</div></div>')
+
+
+def _replay_create_map(middle, path, title, width=800, height=600, gpx_url=None,
+                       timeout=None, backend=None, tolerance=None, encoding=None,
+                       output_dir=None, output_name='map_output.png'):
+    # What create_map prints and displays besides writing the PNG.
+    if gpx_url:
+        print(f"Swisstopo URL: {create_swisstopo_url(middle, gpx_url)}")
+    if os.environ.get('QUARTO_PROJECT_OUTPUT_FORMAT', '') == 'pdf':
+        display(Image(filename=output_path(output_dir, output_name), width=800, height=600))
+
+
+def _replay_profile(path, output_dir=None, output_name='elevation_profile.png',
+                    interactive=False):
+    _show_profile(path, output_path(output_dir, output_name), interactive)
+
+
+def _show_profile(path, png_path, interactive):
+    # The PNG is always written, for the PDF build; HTML pages may show the
+    # interactive profile instead.
+    with span('profile.display', interactive=interactive):
+        if interactive and os.environ.get('QUARTO_PROJECT_OUTPUT_FORMAT', '') != 'pdf':
+            display(HTML(profiles.profile_html(load_track(path))))
+        else:
+            display(Image(filename=png_path))
+
+
+@traced('create_map', path='path')
+@memoize(inputs=('path',), outputs=_outputs, ignore=('timeout', 'output_dir', 'output_name'),
+         code=('scripts.py', 'profiles.py', 'polyline.py', 'tracks.py', 'simplify.py',
+               'static_map.py', 'screenshot.py'),
+         env=('WANDERALBUM_MAP_BACKEND', 'WANDERALBUM_TILE_SERVER', 'WANDERALBUM_TILE_DIR'),
+         dump=SavedMap.dump, load=SavedMap.load, replay=_replay_create_map)
+def create_map(middle, path, title, width=800, height=600, gpx_url=None,
+               timeout=screenshot.DEFAULT_TIMEOUT, backend=None,
+               tolerance=None, encoding=None, output_dir=None, output_name='map_output.png'):
     """
     Create an interactive Folium map with GPX track overlay and save as PNG.
 
     This function creates a Folium map centered at the specified coordinates,
     overlays a GPX track, and saves both an interactive HTML version and a
-    PNG screenshot using Selenium. For PDF output formats, it displays an
+    PNG screenshot using a pooled headless browser (see ``screenshot.py``).
+    With the ``'static'`` backend the PNG is drawn directly from local tiles
+    instead (see ``static_map.py``). For PDF output formats, it displays an
     existing PNG file instead.
 
     Args:
@@ -38,11 +227,42 @@ def create_map(middle, path, title, width=800, height=600, gpx_url=None):
         height (int, optional): Height of the output PNG in pixels. Defaults to 600.
         gpx_url (str, optional): URL to the GPX file (e.g., GitHub raw URL).
             If provided, prints the corresponding Swisstopo URL. Defaults to None.
+        timeout (float, optional): Maximum seconds to wait for the map tiles
+            and track to finish loading before the screenshot is taken.
+        backend (str, optional): How the PNG is produced: ``'browser'`` for a
+            Chrome screenshot or ``'static'`` for the browser-free renderer.
+            Defaults to the ``WANDERALBUM_MAP_BACKEND`` environment variable,
+            or ``'browser'`` if it is unset.
+        tolerance (float, optional): The track is simplified so that it
+            deviates at most this many metres from the GPX (see
+            ``simplify.py``). 0 keeps every point. Defaults to
+            ``simplify.DEFAULT_TOLERANCE`` (2 m).
+        encoding (str, optional): How the track is put into the page, see
+            ``build_map``. Defaults to ``'polyline'``.
+        output_dir (str, optional): Directory for the PNG. Defaults to the
+            working directory.
+        output_name (str, optional): File name of the PNG. Defaults to
+            'map_output.png'.
+
+    The PNG is published with an atomic rename, and the HTML page for the
+    browser is a unique temporary file, so several maps can be rendered
+    into the same directory at once.
+
+    Calls with the same GPX content, arguments and code are memoized on
+    disk (see ``memo.py``): the PNG is copied back into place and the map
+    is returned as a ``SavedMap``. A static map drawn with missing tiles is
+    not stored, so that it is drawn again once the tiles are there.
+
+    With ``WANDERALBUM_TRACE`` set, the call and its stages (GPX loading,
+    map building, ``m.save``, the browser steps) are timed into a trace
+    file, see ``tracing.py``.
 
     Returns:
-        folium.Map: The created Folium map object.
+        folium.Map: The created Folium map object, or a SavedMap with its
+        page when the result comes from the memo cache.
 
     Raises:
+        ValueError: If ``backend`` or ``encoding`` is unknown.
         SystemExit: If screenshot creation fails.
     """
     is_pdf = os.environ.get('QUARTO_PROJECT_OUTPUT_FORMAT', '') == 'pdf'
@@ -50,21 +270,72 @@ def create_map(middle, path, title, width=800, height=600, gpx_url=None):
     if gpx_url:
         print(f"Swisstopo URL: {create_swisstopo_url(middle, gpx_url)}")
 
+    png_path = output_path(output_dir, output_name)
     if is_pdf:
-        display(Image(filename='map_output.png', width=800, height=600))
-    else:
-        import folium
-        import gpxpy
+        with span('map.display'):
+            display(Image(filename=png_path, width=800, height=600))
+
+    backend = backend or os.environ.get('WANDERALBUM_MAP_BACKEND', 'browser')
+    if backend not in MAP_BACKENDS:
+        raise ValueError(f"Unknown map backend: {backend}")
+
+    m = build_map(middle, path, title, tolerance, encoding)
+
+    try:
+        missing = save_map_png(m, png_path, width, height, backend, timeout)
+    except Exception as e:
+        sys.exit(1)
+    if missing:
+        print(f"{len(missing)} Kacheln fehlen, z.B. {missing[0]}; "
+              "siehe python -m scripts.tile_cache prefetch --layers osm")
+        skip_store()
+
+    return m
+
+
+@traced()
+def build_map(center, path, title, tolerance=None, encoding=None):
+    """
+    Build the Folium map of a tour without rendering it.
+
+    Args:
+        center (list): Center coordinates as [latitude, longitude].
+        path (str): Path to the GPX file to overlay on the map.
+        title (str): Title for the GPX track layer.
+        tolerance (float, optional): Simplification tolerance in metres.
+            Defaults to ``simplify.DEFAULT_TOLERANCE``.
+        encoding (str, optional): ``'polyline'`` puts the track into the page
+            as encoded polylines quantised to about 1 m, decoded by a small
+            script (see ``polyline.py``); ``'geojson'`` as plain GeoJSON.
+            Defaults to ``'polyline'``.
+
+    Returns:
+        folium.Map: The map with both tile layers, the track and a layer control.
+
+    Raises:
+        ValueError: If ``encoding`` is unknown.
+    """
+    encoding = encoding or MAP_ENCODINGS[0]
+    if encoding not in MAP_ENCODINGS:
+        raise ValueError(f"Unknown map encoding: {encoding}")
 
-    center = middle
     m = folium.Map(location=center,
                    zoom_start=13,
                    tiles=None)
 
-    folium.TileLayer('OpenStreetMap', name='OpenStreetMap (Standard)').add_to(m)
+    # Optional local tile server from tile_cache.py, e.g. http://127.0.0.1:8765
+    tile_server = os.environ.get('WANDERALBUM_TILE_SERVER', '').rstrip('/')
+
+    if tile_server:
+        folium.TileLayer(f'{tile_server}/osm/{{z}}/{{x}}/{{y}}.png',
+                         name='OpenStreetMap (Standard)',
+                         attr='&copy; <a href="https://www.openstreetmap.org/copyright">OpenStreetMap</a> contributors'
+                         ).add_to(m)
+    else:
+        folium.TileLayer('OpenStreetMap', name='OpenStreetMap (Standard)').add_to(m)
 
     folium.raster_layers.WmsTileLayer(
-        url='https://wms.geo.admin.ch/',
+        url=f'{tile_server}/wms' if tile_server else 'https://wms.geo.admin.ch/',
         layers='ch.swisstopo.pixelkarte-farbe',
         fmt='image/png',
         name='Swisstopo',
@@ -75,143 +346,166 @@ def create_map(middle, path, title, width=800, height=600, gpx_url=None):
 
     gpx_path = path
     if os.path.exists(gpx_path):
-        with open(gpx_path, 'r') as gpx_file:
-            gpx = gpxpy.parse(gpx_file)
-
-        gpx_geojson = {
-            'type': 'FeatureCollection',
-            'features': []
-        }
-
-        for track in gpx.tracks:
-            for segment in track.segments:
-                coordinates = [[point.longitude, point.latitude] for point in segment.points]
-
-                gpx_geojson['features'].append({
-                    'type': 'Feature',
-                    'geometry': {
-                        'type': 'LineString',
-                        'coordinates': coordinates
-                    },
-                    'properties': {
-                        'name': 'GPX Track Segment'
-                    }
-                })
-
-        geojson_layer = folium.GeoJson(
-            gpx_geojson,
-            name=title,
-            style_function=lambda x: {
-                'color': 'red',
-                'weight': 3,
-                'opacity': 0.7
-            }
-        ).add_to(m)
-
-        m.fit_bounds(geojson_layer.get_bounds())
+        track = load_track(gpx_path)
+        with span('simplify', points=len(track)) as stage:
+            track = simplify_track(track) if tolerance is None else simplify_track(track, tolerance)
+            stage.set(kept=len(track))
+
+        style = {'color': 'red', 'weight': 3, 'opacity': 0.7}
+
+        with span('map.layer', encoding=encoding):
+            if encoding == 'polyline':
+                track_layer = polyline.EncodedTrack(track, name=title, style=style).add_to(m)
+            else:
+                gpx_geojson = {
+                    'type': 'FeatureCollection',
+                    'features': []
+                }
+
+                for coordinates in track.coordinates():
+                    gpx_geojson['features'].append({
+                        'type': 'Feature',
+                        'geometry': {
+                            'type': 'LineString',
+                            'coordinates': coordinates
+                        },
+                        'properties': {
+                            'name': 'GPX Track Segment'
+                        }
+                    })
+
+                track_layer = folium.GeoJson(
+                    gpx_geojson,
+                    name=title,
+                    style_function=lambda x: style
+                ).add_to(m)
+
+        m.fit_bounds(track_layer.get_bounds())
 
     folium.LayerControl().add_to(m)
+    # Shows the position hovered in an interactive profile (see profile).
+    profiles.add_profile_marker(m)
 
-    tempfile = 'temp_map_export.html'
-    output_filename = 'map_output.png'
-    m.save(tempfile)
-
-    options = Options()
-    options.add_argument('--headless')
-    options.add_argument('--no-sandbox')
-    options.add_argument('--disable-dev-shm-usage')
-    options.add_argument(f'--window-size={width},{height}')
+    return m
 
-    try:
-        driver = webdriver.Chrome(options=options)
-        driver.get(f'file://{os.path.abspath(tempfile)}')
-        time.sleep(3)
-        driver.save_screenshot(output_filename)
-        driver.quit()
-    except Exception as e:
-        if os.path.exists(tempfile):
-            os.remove(tempfile)
-        sys.exit(1)
 
-    if os.path.exists(tempfile):
-        os.remove(tempfile)
+@traced()
+def save_map_png(m, output_filename, width=800, height=600, backend='browser',
+                 timeout=screenshot.DEFAULT_TIMEOUT, html_path=None):
+    """
+    Render a map built by ``build_map`` to a PNG file.
 
-    return m
+    Args:
+        m (folium.Map): The map.
+        output_filename (str): Path of the PNG to write.
+        width (int, optional): Width of the PNG in pixels. Defaults to 800.
+        height (int, optional): Height of the PNG in pixels. Defaults to 600.
+        backend (str, optional): ``'browser'`` or ``'static'``.
+        timeout (float, optional): Seconds to wait for the tiles (browser only).
+        html_path (str, optional): Where to save the HTML page for the
+            browser. Defaults to a unique temporary file next to the PNG.
+            The page is removed afterwards.
+
+    The PNG is written to a unique temporary file and renamed into place.
 
+    Returns:
+        list: Paths of the tiles missing from a static map (see
+        ``static_map.missing_tiles``); empty for the browser.
 
-def profile(path):
+    Raises:
+        ValueError: If ``backend`` is unknown.
+    """
+    if backend not in MAP_BACKENDS:
+        raise ValueError(f"Unknown map backend: {backend}")
+
+    lines = [feature['geometry']['coordinates']
+             for child in m._children.values()
+             if isinstance(child, (folium.GeoJson, polyline.EncodedTrack))
+             for feature in child.data['features']]
+
+    with atomic_path(output_filename) as tmp_path:
+        if backend == 'static':
+            with span('static_map.render'):
+                static_map.render_static_map(lines, tmp_path, width, height,
+                                             center=m.location)
+            return static_map.missing_tiles(lines, width, height, center=m.location)
+
+        if html_path is None:
+            fd, html_path = tempfile.mkstemp(suffix='.html',
+                                             dir=os.path.dirname(os.path.abspath(output_filename)))
+            os.close(fd)
+        try:
+            with span('map.save'):
+                m.save(html_path)
+            screenshot.capture(html_path, tmp_path, map_name=m.get_name(),
+                               width=width, height=height, timeout=timeout,
+                               need_track=bool(lines))
+        finally:
+            if os.path.exists(html_path):
+                os.remove(html_path)
+    return []
+
+
+@traced('profile', path='path')
+@memoize(inputs=('path',), outputs=_outputs, ignore=('output_dir', 'output_name', 'interactive'),
+         code=('scripts.py', 'profiles.py', 'tracks.py', 'stats.py'), replay=_replay_profile)
+def profile(path, output_dir=None, output_name='elevation_profile.png', interactive=False):
     """
     Generate and display an elevation profile from a GPX file.
 
-    This function parses a GPX file, extracts elevation and distance data,
-    creates a visualization with statistics, and saves it as a PNG file.
-    The profile includes distance vs. elevation plot with min/max elevations,
-    total ascent, and total descent information.
+    This function loads a GPX file (cached as arrays, see ``tracks.py``),
+    extracts elevation and distance data, creates a visualization with
+    statistics (see ``profiles.render_profile``), and saves it as a PNG
+    file. The profile includes distance
+    vs. elevation plot with min/max elevations, total ascent, and total
+    descent information (computed by ``stats.track_stats``).
 
     Args:
         path (str): Path to the GPX file to process.
+        output_dir (str, optional): Directory for the PNG. Defaults to the
+            working directory.
+        output_name (str, optional): File name of the PNG. Defaults to
+            'elevation_profile.png'.
+        interactive (bool, optional): Except for PDF output, display the
+            interactive profile (``profiles.profile_html``) instead of the
+            PNG; hovering it moves a marker on the map of ``create_map``.
+
+    Memoized on disk like ``create_map``; on a hit the saved PNG is displayed.
 
     Returns:
-        None: The function saves 'elevation_profile.png' and displays the plot.
+        None: The function saves 'elevation_profile.png' and displays it.
     """
     gpx_path = path
 
     if os.path.exists(gpx_path):
-        with open(gpx_path, 'r') as gpx_file:
-            gpx = gpxpy.parse(gpx_file)
-
-        distances = []
-        elevations = []
-        total_distance = 0
-
-        for track in gpx.tracks:
-            for segment in track.segments:
-                for i, point in enumerate(segment.points):
-                    if i == 0:
-                        distances.append(0)
-                    else:
-                        prev_point = segment.points[i - 1]
-                        distance = point.distance_2d(prev_point)
-                        total_distance += distance
-                        distances.append(total_distance / 1000)
-                    elevations.append(point.elevation)
-
-        plt.figure(figsize=(12, 4))
-        plt.plot(distances, elevations, linewidth=2, color='#d62728')
-        plt.fill_between(distances, elevations, alpha=0.3, color='#d62728')
-
-        plt.xlabel('Distanz (km)', fontsize=12)
-        plt.ylabel('Höhe (m ü. M.)', fontsize=12)
-        plt.title('Höhenprofil', fontsize=14, fontweight='bold')
-        plt.grid(True, alpha=0.3)
-
-        min_elevation = min(elevations)
-        max_elevation = max(elevations)
-        total_ascent = sum(elevations[i] - elevations[i - 1]
-                           for i in range(1, len(elevations))
-                           if elevations[i] > elevations[i - 1])
-        total_descent = sum(elevations[i - 1] - elevations[i]
-                            for i in range(1, len(elevations))
-                            if elevations[i] < elevations[i - 1])
-
-        plt.ylim(min_elevation - 200, max_elevation + 50)
-
-        stats_text = (f'Distanz: {total_distance / 1000:.2f} km | '
-                      f'Min: {min_elevation:.0f} m | Max: {max_elevation:.0f} m | '
-                      f'↑ {total_ascent:.0f} m | ↓ {total_descent:.0f} m')
-        plt.text(0.5, 0.02, stats_text, transform=plt.gca().transAxes,
-                 ha='center', fontsize=10,
-                 bbox=dict(boxstyle='round', facecolor='wheat', alpha=0.5))
-
-        plt.tight_layout()
-        plt.savefig('elevation_profile.png', dpi=150, bbox_inches='tight')
-        plt.show()
-        plt.close()
+        track = load_track(gpx_path)
+        output_filename = output_path(output_dir, output_name)
+        profiles.render_profile(track, output_filename)
+        _show_profile(gpx_path, output_filename, interactive)
     else:
         print(f"Error: GPX file not found at {gpx_path}")
         return
 
 
+def plot_profile(track, output_filename):
+    """
+    Draw the elevation profile of a track and save it.
+
+    The figure is left open as the current pyplot figure, so that callers
+    can show it; close it with ``plt.close()``. ``profiles.render_profile``
+    draws the same figure faster, without pyplot.
+
+    Args:
+        track (Track): Track loaded with ``tracks.load_track``.
+        output_filename (str): Path of the image to write. It is written to
+            a unique temporary file first and renamed into place.
+    """
+    fig = plt.figure(figsize=profiles.FIGSIZE)
+    profiles.draw_profile(fig, track, max_points=None)
+    with atomic_path(output_filename) as tmp_path:
+        fig.savefig(tmp_path, dpi=profiles.DPI, bbox_inches='tight')
+
+
 def create_swisstopo_url(center, gpx_url):
     """
     Create a Swisstopo map URL with an embedded GPX track overlay.
@@ -234,7 +528,9 @@ def create_swisstopo_url(center, gpx_url):
             + gpx_url)
 
 
-def generate_qr_code_for_url(url: str):
+@traced()
+@memoize(outputs=_outputs, ignore=('output_dir', 'output_name'), code=('scripts.py', 'qr.py'))
+def generate_qr_code_for_url(url: str, output_dir=None, output_name='qr_tag.png'):
     """
     Generate a QR code for a URL and save it as a PNG image.
 
@@ -243,28 +539,39 @@ def generate_qr_code_for_url(url: str):
 
     Args:
         url (str): The URL to encode in the QR code.
+        output_dir (str, optional): Directory for the PNG. Defaults to the
+            working directory.
+        output_name (str, optional): File name of the PNG. Defaults to
+            'qr_tag.png'.
 
     Returns:
         None: The function saves 'qr_tag.png' or prints an error message.
     """
     try:
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
-        )
-
-        qr.add_data(url)
-        qr.make(fit=True)
-
-        img = qr.make_image(fill_color="black", back_color="white")
-        img.save("qr_tag.png")
+        save_qr_code(url, output_path(output_dir, output_name))
 
     except Exception as e:
         print(f"❌ Ein Fehler ist aufgetreten: {e}")
 
 
+def save_qr_code(url, output_filename):
+    """
+    Save a black-and-white QR code for a URL.
+
+    Rendered codes are cached, see ``qr.py``; the extension of the file
+    selects PNG, SVG or PDF.
+
+    Args:
+        url (str): The URL to encode in the QR code.
+        output_filename (str): Path of the file to write, atomically.
+    """
+    try:
+        from .qr import save_qr
+    except ImportError:
+        from qr import save_qr
+
+    save_qr(url, output_filename)
+
 
 def create_swisstopo_link(gpx_url):
     """
@@ -0,0 +1,153 @@
+"""
+Track simplification for map output.
+
+Removes points that do not change the shape of a track by more than a
+tolerance in metres (Douglas-Peucker), so that the GeoJSON embedded in the
+map pages stays small. ``create_map`` simplifies between loading the track
+and building the GeoJSON; ``simplify_levels`` produces several levels of
+detail for zoom-dependent display.
+
+Usage:
+    from simplify import simplify_track
+    small = simplify_track(load_track(path), tolerance=5)
+"""
+
+import math
+
+import numpy as np
+
+try:
+    from .tracks import EARTH_RADIUS, Track
+except ImportError:
+    from tracks import EARTH_RADIUS, Track
+
+
+# Default tolerance in metres for the map of a single tour. Well below one
+# pixel at the zoom levels the tour maps are viewed at.
+DEFAULT_TOLERANCE = 2.0
+
+
+def _to_metres(lat, lon):
+    """Project to a local equirectangular plane in metres."""
+    lat0 = math.radians(float(np.mean(lat))) if len(lat) else 0.0
+    x = np.radians(lon) * EARTH_RADIUS * math.cos(lat0)
+    y = np.radians(lat) * EARTH_RADIUS
+    return x, y
+
+
+def douglas_peucker(x, y, tolerance):
+    """
+    Return a mask of the points kept by the Douglas-Peucker algorithm.
+
+    Works with an explicit stack instead of recursion; the distances of all
+    points of a range to its chord are computed at once with NumPy.
+
+    Args:
+        x (numpy.ndarray): X coordinates in metres.
+        y (numpy.ndarray): Y coordinates in metres.
+        tolerance (float): Maximum allowed deviation in metres.
+
+    Returns:
+        numpy.ndarray: Boolean mask, True for points to keep. The first and
+        last point are always kept.
+    """
+    n = len(x)
+    keep = np.zeros(n, dtype=bool)
+    if n == 0:
+        return keep
+    keep[0] = keep[-1] = True
+
+    stack = [(0, n - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        dx = x[end] - x[start]
+        dy = y[end] - y[start]
+        px = x[start + 1:end] - x[start]
+        py = y[start + 1:end] - y[start]
+        length = math.hypot(dx, dy)
+        if length == 0:
+            distances = np.hypot(px, py)
+        else:
+            distances = np.abs(px * dy - py * dx) / length
+        index = int(np.argmax(distances))
+        if distances[index] > tolerance:
+            split = start + 1 + index
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    return keep
+
+
+def simplify_mask(track, tolerance=DEFAULT_TOLERANCE):
+    """
+    Return the Douglas-Peucker mask of a whole track, segment by segment.
+
+    Args:
+        track (Track): The track.
+        tolerance (float, optional): Maximum deviation in metres.
+
+    Returns:
+        numpy.ndarray: Boolean mask over all points of the track.
+    """
+    x, y = _to_metres(track.lat, track.lon)
+    keep = np.zeros(len(track), dtype=bool)
+    for s in track.segments():
+        keep[s] = douglas_peucker(x[s], y[s], tolerance)
+    return keep
+
+
+def simplify_track(track, tolerance=DEFAULT_TOLERANCE):
+    """
+    Return a simplified copy of a track.
+
+    Args:
+        track (Track): The track.
+        tolerance (float, optional): Maximum deviation in metres. Values of
+            0 or less return the track unchanged.
+
+    Returns:
+        Track: A track with a subset of the points. Elevation and distance of
+        the kept points are those of the original track.
+    """
+    if tolerance <= 0 or len(track) == 0:
+        return track
+    keep = simplify_mask(track, tolerance)
+    # Each segment start maps to the number of kept points before it.
+    offsets = np.concatenate(([0], np.cumsum(keep)))[track.offsets]
+    return Track(track.lat[keep], track.lon[keep], track.ele[keep],
+                 track.dist[keep], offsets, track.sha256)
+
+
+def tolerance_for_zoom(zoom, latitude=46.8, pixels=0.5):
+    """
+    Return a tolerance in metres that is invisible at a Web Mercator zoom.
+
+    Args:
+        zoom (int): Zoom level.
+        latitude (float, optional): Latitude the map is viewed at; defaults
+            to the middle of Switzerland.
+        pixels (float, optional): Allowed deviation in screen pixels.
+
+    Returns:
+        float: Tolerance in metres.
+    """
+    metres_per_pixel = 2 * math.pi * 6378137 * math.cos(math.radians(latitude)) / (256 * 2 ** zoom)
+    return pixels * metres_per_pixel
+
+
+def simplify_levels(track, zooms):
+    """
+    Return one simplified track per zoom level.
+
+    Args:
+        track (Track): The track.
+        zooms (iterable): Zoom levels.
+
+    Returns:
+        dict: Zoom level -> simplified Track.
+    """
+    latitude = float(np.mean(track.lat)) if len(track) else 46.8
+    return {zoom: simplify_track(track, tolerance_for_zoom(zoom, latitude))
+            for zoom in zooms}
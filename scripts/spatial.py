@@ -0,0 +1,398 @@
+"""
+Spatial index over the tracks of all tours.
+
+Every track is cut into its straight segments, projected to Swiss LV95
+metres, and the segments are put into a uniform grid. Queries only look at
+the grid cells they touch and then measure exact point-to-segment distances
+with NumPy, so they take milliseconds instead of reading every GPX file:
+
+    within(lat, lon, radius)   tours passing within ``radius`` metres
+    in_bbox(...)               tours with a part inside a bounding box
+    nearest(lat, lon, k)       the ``k`` closest tours
+
+The index is stored in ``.cache/spatial_index.npz``. Tracks are loaded with
+``tracks.load_track`` like in ``create_map``; on a rebuild only tours whose
+GPX file changed are loaded again.
+
+Usage:
+    python -m scripts.spatial build [--force]
+    python -m scripts.spatial within 47.2878 8.8863 --radius 2000
+    python -m scripts.spatial bbox 46.9 8.3 47.3 8.9
+    python -m scripts.spatial nearest 46.5 9.0 -k 3
+
+    from spatial import build_index
+    index = build_index()
+    index.within(47.2878, 8.8863, 2000)
+"""
+
+import argparse
+import io
+import math
+import os
+import sys
+import time
+
+import numpy as np
+
+try:
+    from .atomic import atomic_write
+    from .tours import BASE_DIR, discover_tours, lv95
+    from .tracks import file_sha256, load_track
+except ImportError:
+    from atomic import atomic_write
+    from tours import BASE_DIR, discover_tours, lv95
+    from tracks import file_sha256, load_track
+
+
+INDEX_PATH = os.path.join(BASE_DIR, '.cache', 'spatial_index.npz')
+
+# Bump when the stored arrays change meaning.
+INDEX_VERSION = 1
+
+# Edge length of a grid cell in metres, and the most cells the grid may have
+# (the cells grow if the tours are spread over a larger area).
+CELL_SIZE = 1000.0
+MAX_CELLS = 1_000_000
+
+
+def track_segments(track):
+    """
+    Return the straight segments of a track.
+
+    Args:
+        track (Track): The track.
+
+    Returns:
+        numpy.ndarray: Shape (n, 8) with the columns ax, ay, bx, by in LV95
+        metres followed by the same points as longitude and latitude. A
+        segment of the GPX file with a single point gives one segment of
+        length zero; no segment joins two GPX segments.
+    """
+    x, y = lv95(track.lat, track.lon)
+    lon, lat = track.lon, track.lat
+    starts = np.asarray(track.offsets[:-1])
+    stops = np.asarray(track.offsets[1:])
+    # Pairs (i, i + 1) within a segment, plus (i, i) for single points.
+    follows = np.ones(len(track), dtype=bool)
+    follows[stops[stops > 0] - 1] = False
+    a = np.flatnonzero(follows)
+    b = a + 1
+    single = starts[stops - starts == 1]
+    a = np.concatenate((a, single))
+    b = np.concatenate((b, single))
+    order = np.argsort(a, kind='stable')
+    a, b = a[order], b[order]
+    return np.column_stack((x[a], y[a], x[b], y[b], lon[a], lat[a], lon[b], lat[b]))
+
+
+def _point_segment_distance(px, py, segments):
+    """Return the distance of a point to each segment."""
+    ax, ay, bx, by = segments.T
+    dx = bx - ax
+    dy = by - ay
+    length2 = dx * dx + dy * dy
+    with np.errstate(invalid='ignore', divide='ignore'):
+        t = ((px - ax) * dx + (py - ay) * dy) / length2
+    t = np.clip(np.nan_to_num(t), 0.0, 1.0)
+    return np.hypot(ax + t * dx - px, ay + t * dy - py)
+
+
+class SpatialIndex:
+    """
+    Segments of all tracks in a uniform grid.
+
+    Attributes:
+        slugs (numpy.ndarray): Tour slugs, one per tour.
+        hashes (numpy.ndarray): SHA-256 of each tour's GPX file.
+        offsets (numpy.ndarray): Start of each tour's segments, followed by
+            the total number of segments.
+        segments (numpy.ndarray): All segments, shape (n, 4), LV95 metres.
+        geographic (numpy.ndarray): The same segments as longitude and
+            latitude, shape (n, 4).
+        tour_of (numpy.ndarray): Tour number of every segment.
+        origin (numpy.ndarray): LV95 coordinates of the grid's corner.
+        cell_size (float): Edge length of a cell in metres.
+        shape (tuple): Number of cells (nx, ny).
+        cell_start (numpy.ndarray): For cell ``iy * nx + ix``, its entries in
+            ``cell_segments`` are ``cell_start[c]:cell_start[c + 1]``.
+        cell_segments (numpy.ndarray): Segment numbers, grouped by cell.
+    """
+
+    def __init__(self, slugs, hashes, offsets, segments):
+        self.slugs = np.asarray(slugs, dtype=str)
+        self.hashes = np.asarray(hashes, dtype=str)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        segments = np.asarray(segments, dtype=np.float64).reshape(-1, 8)
+        self.segments = segments[:, :4]
+        self.geographic = segments[:, 4:]
+        self.tour_of = np.repeat(np.arange(len(self.slugs), dtype=np.int32),
+                                 np.diff(self.offsets))
+        self._build_grid()
+
+    def __len__(self):
+        return len(self.slugs)
+
+    def __repr__(self):
+        return (f"SpatialIndex({len(self)} tours, {len(self.segments)} segments, "
+                f"{self.shape[0]}x{self.shape[1]} cells of {self.cell_size:.0f} m)")
+
+    def _build_grid(self):
+        s = self.segments
+        if len(s) == 0:
+            self.origin = np.zeros(2)
+            self.cell_size = CELL_SIZE
+            self.shape = (1, 1)
+            self.cell_start = np.zeros(2, dtype=np.int64)
+            self.cell_segments = np.zeros(0, dtype=np.int64)
+            return
+
+        low = np.minimum(s[:, :2], s[:, 2:])
+        high = np.maximum(s[:, :2], s[:, 2:])
+        self.origin = low.min(axis=0)
+        extent = high.max(axis=0) - self.origin
+        self.cell_size = max(CELL_SIZE, math.sqrt(extent[0] * extent[1] / MAX_CELLS))
+        nx, ny = (extent // self.cell_size).astype(np.int64) + 1
+        self.shape = (int(nx), int(ny))
+
+        # Every segment goes into all cells its bounding box touches.
+        c0 = ((low - self.origin) // self.cell_size).astype(np.int64)
+        c1 = ((high - self.origin) // self.cell_size).astype(np.int64)
+        width = c1[:, 0] - c0[:, 0] + 1
+        counts = width * (c1[:, 1] - c0[:, 1] + 1)
+        segment = np.repeat(np.arange(len(s)), counts)
+        k = np.arange(len(segment)) - np.repeat(np.cumsum(counts) - counts, counts)
+        ix = c0[segment, 0] + k % width[segment]
+        iy = c0[segment, 1] + k // width[segment]
+        cell = iy * nx + ix
+
+        order = np.argsort(cell, kind='stable')
+        self.cell_segments = segment[order]
+        self.cell_start = np.searchsorted(cell[order], np.arange(nx * ny + 1))
+
+    def _candidates(self, x0, y0, x1, y1):
+        """Return the segments in all cells overlapping an LV95 rectangle."""
+        nx, ny = self.shape
+        ix0, iy0 = np.floor((np.array([x0, y0]) - self.origin) / self.cell_size).astype(int)
+        ix1, iy1 = np.floor((np.array([x1, y1]) - self.origin) / self.cell_size).astype(int)
+        ix0, ix1 = max(ix0, 0), min(ix1, nx - 1)
+        iy0, iy1 = max(iy0, 0), min(iy1, ny - 1)
+        if ix0 > ix1 or iy0 > iy1:
+            return np.zeros(0, dtype=np.int64)
+        parts = [self.cell_segments[self.cell_start[iy * nx + ix0]:self.cell_start[iy * nx + ix1 + 1]]
+                 for iy in range(iy0, iy1 + 1)]
+        return np.unique(np.concatenate(parts))
+
+    def _per_tour(self, candidates, distances):
+        """Return (slug, smallest distance) per tour, closest first."""
+        if len(candidates) == 0:
+            return []
+        tours = self.tour_of[candidates]
+        best = np.full(len(self), np.inf)
+        np.minimum.at(best, tours, distances)
+        found = np.flatnonzero(np.isfinite(best))
+        found = found[np.argsort(best[found], kind='stable')]
+        return [(str(self.slugs[t]), float(best[t])) for t in found]
+
+    def within(self, lat, lon, radius):
+        """
+        Return the tours that pass within ``radius`` metres of a point.
+
+        Args:
+            lat (float): Latitude in degrees.
+            lon (float): Longitude in degrees.
+            radius (float): Radius in metres.
+
+        Returns:
+            list: (slug, distance in metres) tuples, closest first.
+        """
+        px, py = lv95(lat, lon)
+        candidates = self._candidates(px - radius, py - radius, px + radius, py + radius)
+        distances = _point_segment_distance(px, py, self.segments[candidates])
+        close = distances <= radius
+        return self._per_tour(candidates[close], distances[close])
+
+    def in_bbox(self, min_lat, min_lon, max_lat, max_lon):
+        """
+        Return the tours with at least one part inside a bounding box.
+
+        Args:
+            min_lat (float): Southern edge in degrees.
+            min_lon (float): Western edge in degrees.
+            max_lat (float): Northern edge in degrees.
+            max_lon (float): Eastern edge in degrees.
+
+        Returns:
+            list: Slugs in index order.
+        """
+        # In LV95 the box is slightly curved; the cells come from the
+        # envelope of points along its edges, the test itself is done in
+        # degrees.
+        t = np.linspace(0, 1, 17)
+        edge_lat = np.concatenate((np.full_like(t, min_lat), np.full_like(t, max_lat),
+                                   min_lat + t * (max_lat - min_lat),
+                                   min_lat + t * (max_lat - min_lat)))
+        edge_lon = np.concatenate((min_lon + t * (max_lon - min_lon),
+                                   min_lon + t * (max_lon - min_lon),
+                                   np.full_like(t, min_lon), np.full_like(t, max_lon)))
+        ex, ey = lv95(edge_lat, edge_lon)
+        candidates = self._candidates(ex.min(), ey.min(), ex.max(), ey.max())
+        ax, ay, bx, by = self.geographic[candidates].T
+        x0, y0, x1, y1 = min_lon, min_lat, max_lon, max_lat
+
+        # The segment's bounding box must overlap the box, and the box's
+        # corners must not all lie on one side of the segment.
+        overlap = ((np.minimum(ax, bx) <= x1) & (np.maximum(ax, bx) >= x0) &
+                   (np.minimum(ay, by) <= y1) & (np.maximum(ay, by) >= y0))
+        sides = np.stack([(bx - ax) * (cy - ay) - (by - ay) * (cx - ax)
+                          for cx, cy in ((x0, y0), (x1, y0), (x0, y1), (x1, y1))])
+        crossing = (sides.min(axis=0) <= 0) & (sides.max(axis=0) >= 0)
+        hit = np.unique(self.tour_of[candidates[overlap & crossing]])
+        return [str(self.slugs[t]) for t in hit]
+
+    def nearest(self, lat, lon, k=1):
+        """
+        Return the ``k`` tours closest to a point.
+
+        Searches within a growing radius; every tour found within a radius
+        has its exact distance, so the first ``k`` of them are the answer.
+
+        Args:
+            lat (float): Latitude in degrees.
+            lon (float): Longitude in degrees.
+            k (int, optional): Number of tours.
+
+        Returns:
+            list: (slug, distance in metres) tuples, closest first.
+        """
+        k = min(k, len(self))
+        if k <= 0:
+            return []
+        px, py = lv95(lat, lon)
+        low = self.origin
+        high = self.origin + self.cell_size * np.array(self.shape)
+        # Far enough to reach every cell of the grid.
+        limit = math.hypot(max(abs(px - low[0]), abs(px - high[0])),
+                           max(abs(py - low[1]), abs(py - high[1])))
+        radius = self.cell_size
+        while True:
+            found = self.within(lat, lon, radius)
+            if len(found) >= k or radius >= limit:
+                return found[:k]
+            radius *= 2
+
+    def save(self, path=INDEX_PATH):
+        """Store the index atomically (the grid is rebuilt when loading)."""
+        buffer = io.BytesIO()
+        np.savez(buffer, version=INDEX_VERSION, slugs=self.slugs, hashes=self.hashes,
+                 offsets=self.offsets, segments=np.hstack((self.segments, self.geographic)))
+        atomic_write(path, buffer.getvalue())
+
+    @classmethod
+    def load(cls, path=INDEX_PATH):
+        """Return the stored index, or None if there is none (or it is outdated)."""
+        try:
+            with np.load(path) as data:
+                if int(data['version']) != INDEX_VERSION:
+                    return None
+                return cls(data['slugs'], data['hashes'], data['offsets'], data['segments'])
+        except (FileNotFoundError, KeyError, ValueError, OSError):
+            return None
+
+    def tour_segments(self, slug):
+        """Return the segments of one tour, or None if it is not indexed."""
+        match = np.flatnonzero(self.slugs == slug)
+        if len(match) == 0:
+            return None
+        t = match[0]
+        return self.segments[self.offsets[t]:self.offsets[t + 1]]
+
+
+def build_index(tours=None, force=False, path=INDEX_PATH):
+    """
+    Bring the stored index up to date and return it.
+
+    Only tours whose GPX file changed (or that are new) are loaded; the
+    segments of the others are taken from the stored index.
+
+    Args:
+        tours (list, optional): Tours to index. Defaults to all tours.
+        force (bool, optional): Load every track again.
+        path (str, optional): Where the index is stored.
+
+    Returns:
+        SpatialIndex: The index.
+    """
+    tours = discover_tours() if tours is None else tours
+    old = None if force else SpatialIndex.load(path)
+    known = {} if old is None else {str(slug): (str(sha), t)
+                                    for t, (slug, sha) in enumerate(zip(old.slugs, old.hashes))}
+
+    slugs, hashes, parts = [], [], []
+    changed = old is None or len(old) != len(tours)
+    for tour in tours:
+        sha = file_sha256(tour.gpx)
+        previous = known.get(tour.slug)
+        if previous and previous[0] == sha:
+            t = previous[1]
+            part = slice(old.offsets[t], old.offsets[t + 1])
+            parts.append(np.hstack((old.segments[part], old.geographic[part])))
+        else:
+            parts.append(track_segments(load_track(tour.gpx)))
+            changed = True
+        slugs.append(tour.slug)
+        hashes.append(sha)
+
+    if not changed and list(old.slugs) == slugs:
+        return old
+    offsets = np.concatenate(([0], np.cumsum([len(p) for p in parts])))
+    segments = np.concatenate(parts) if parts else np.zeros((0, 8))
+    index = SpatialIndex(slugs, hashes, offsets, segments)
+    index.save(path)
+    return index
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Spatial queries over all tour tracks.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build_parser = commands.add_parser('build', help='update the stored index')
+    build_parser.add_argument('--force', action='store_true', help='reload every track')
+    within_parser = commands.add_parser('within', help='tours passing near a point')
+    within_parser.add_argument('lat', type=float)
+    within_parser.add_argument('lon', type=float)
+    within_parser.add_argument('-r', '--radius', type=float, default=2000,
+                               help='radius in metres (default: 2000)')
+    bbox_parser = commands.add_parser('bbox', help='tours inside a bounding box')
+    for name in ('min_lat', 'min_lon', 'max_lat', 'max_lon'):
+        bbox_parser.add_argument(name, type=float)
+    nearest_parser = commands.add_parser('nearest', help='tours closest to a point')
+    nearest_parser.add_argument('lat', type=float)
+    nearest_parser.add_argument('lon', type=float)
+    nearest_parser.add_argument('-k', type=int, default=1, help='number of tours (default: 1)')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    index = build_index(force=getattr(args, 'force', False))
+    loaded = time.perf_counter()
+    if args.command == 'build':
+        print(index)
+        print(f"Index aktualisiert in {loaded - start:.2f} s → "
+              f"{os.path.relpath(INDEX_PATH, BASE_DIR)}")
+        return 0
+
+    if args.command == 'within':
+        results = index.within(args.lat, args.lon, args.radius)
+    elif args.command == 'nearest':
+        results = index.nearest(args.lat, args.lon, args.k)
+    else:
+        results = [(slug, None) for slug in
+                   index.in_bbox(args.min_lat, args.min_lon, args.max_lat, args.max_lon)]
+    query = time.perf_counter() - loaded
+
+    for slug, distance in results:
+        print(slug if distance is None else f"{slug:<28}{distance:>10.0f} m")
+    print(f"{len(results)} Touren ({query * 1000:.1f} ms)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
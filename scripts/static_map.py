@@ -0,0 +1,212 @@
+"""
+Browser-free map renderer.
+
+Draws the same view that ``create_map`` screenshots with Chrome, directly
+with Pillow: background tiles from a local tile directory, the GPX track as a
+red polyline and the view fitted to the track like Leaflet's ``fitBounds``.
+No browser and no network access are needed, and the renderer keeps no global
+state, so it can be used inside a process pool.
+
+Tiles are read from ``<tile_dir>/<layer>/<z>/<x>/<y>.png`` in the usual Web
+Mercator (XYZ) scheme. Missing tiles are left blank; ``missing_tiles``
+lists them.
+"""
+
+import math
+import os
+
+from PIL import Image, ImageDraw
+
+
+TILE_SIZE = 256
+DEFAULT_TILE_DIR = os.environ.get(
+    'WANDERALBUM_TILE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '.cache', 'tiles'))
+
+LAYERS = ('osm', 'swisstopo')
+
+# Same style as the folium.GeoJson layer in create_map.
+TRACK_COLOR = (255, 0, 0)
+TRACK_WEIGHT = 3
+TRACK_OPACITY = 0.7
+
+# Leaflet's default map background colour, shown where tiles are missing.
+BACKGROUND = (221, 221, 221)
+
+# Lines are drawn at this factor and scaled down to get anti-aliasing.
+SUPERSAMPLE = 2
+
+
+def project(lon, lat, zoom):
+    """
+    Project WGS84 coordinates to Web Mercator pixel coordinates.
+
+    Args:
+        lon (float): Longitude in degrees.
+        lat (float): Latitude in degrees.
+        zoom (float): Zoom level.
+
+    Returns:
+        tuple: (x, y) in pixels from the top left corner of the world.
+    """
+    scale = TILE_SIZE * 2 ** zoom
+    lat = max(min(lat, 85.0511287798), -85.0511287798)
+    sin_lat = math.sin(math.radians(lat))
+    x = (lon + 180.0) / 360.0 * scale
+    y = (0.5 - math.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)) * scale
+    return x, y
+
+
+def fit_bounds(lines, width, height, max_zoom=18):
+    """
+    Compute the zoom and center that Leaflet's ``fitBounds`` would choose.
+
+    Args:
+        lines (list): Track segments as sequences of [lon, lat] pairs.
+        width (int): Map width in pixels.
+        height (int): Map height in pixels.
+        max_zoom (int, optional): Highest zoom level allowed. Defaults to 18.
+
+    Returns:
+        tuple: (zoom, center_x, center_y) with the center in pixels at ``zoom``.
+    """
+    points = [project(lon, lat, 0) for line in lines for lon, lat in line]
+    min_x = min(x for x, _ in points)
+    max_x = max(x for x, _ in points)
+    min_y = min(y for _, y in points)
+    max_y = max(y for _, y in points)
+
+    bounds_w = max(max_x - min_x, 1e-12)
+    bounds_h = max(max_y - min_y, 1e-12)
+    zoom = math.floor(math.log2(min(width / bounds_w, height / bounds_h)))
+    zoom = max(0, min(max_zoom, zoom))
+
+    scale = 2 ** zoom
+    return zoom, (min_x + max_x) / 2 * scale, (min_y + max_y) / 2 * scale
+
+
+def tile_path(tile_dir, layer, z, x, y):
+    """Return the path of a tile in the local tile directory."""
+    return os.path.join(tile_dir, layer, str(z), str(x), f'{y}.png')
+
+
+def _view(lines, width, height, max_zoom, center, zoom):
+    # (zoom, left, top) of the view, with the origin in world pixels.
+    if lines:
+        zoom, center_x, center_y = fit_bounds(lines, width, height, max_zoom)
+    elif center is not None:
+        center_x, center_y = project(center[1], center[0], zoom)
+    else:
+        raise ValueError("No track points or center to render")
+    # Leaflet rounds the pixel origin of the map pane.
+    return zoom, round(center_x - width / 2), round(center_y - height / 2)
+
+
+def _tiles(zoom, left, top, width, height):
+    # (tx, ty) of the tiles covering the view; tx may wrap around the world.
+    n = 2 ** zoom
+    first_x = int(math.floor(left / TILE_SIZE))
+    first_y = int(math.floor(top / TILE_SIZE))
+    last_x = int(math.floor((left + width - 1) / TILE_SIZE))
+    last_y = int(math.floor((top + height - 1) / TILE_SIZE))
+    for tx in range(first_x, last_x + 1):
+        for ty in range(first_y, last_y + 1):
+            if 0 <= ty < n:
+                yield tx, ty
+
+
+def _draw_tiles(image, tile_dir, layer, zoom, left, top):
+    width, height = image.size
+    n = 2 ** zoom
+    for tx, ty in _tiles(zoom, left, top, width, height):
+        path = tile_path(tile_dir, layer, zoom, tx % n, ty)
+        if not os.path.exists(path):
+            continue
+        with Image.open(path) as tile:
+            tile = tile.convert('RGB')
+            image.paste(tile, (tx * TILE_SIZE - left, ty * TILE_SIZE - top))
+
+
+def missing_tiles(lines, width=800, height=600, tile_dir=None, layer='osm',
+                  max_zoom=18, center=None, zoom=13):
+    """
+    Return the tiles of a view that are not in the local tile directory.
+
+    Takes the arguments of ``render_static_map``.
+
+    Returns:
+        list: Paths of the missing tiles.
+    """
+    lines = [line for line in lines if len(line)]
+    tile_dir = tile_dir or DEFAULT_TILE_DIR
+    zoom, left, top = _view(lines, width, height, max_zoom, center, zoom)
+    n = 2 ** zoom
+    paths = (tile_path(tile_dir, layer, zoom, tx % n, ty)
+             for tx, ty in _tiles(zoom, left, top, width, height))
+    return [path for path in paths if not os.path.exists(path)]
+
+
+def _draw_track(image, lines, zoom, left, top):
+    width, height = image.size
+    overlay = Image.new('L', (width * SUPERSAMPLE, height * SUPERSAMPLE), 0)
+    draw = ImageDraw.Draw(overlay)
+    line_width = TRACK_WEIGHT * SUPERSAMPLE
+    radius = line_width / 2
+
+    for line in lines:
+        xy = []
+        for lon, lat in line:
+            x, y = project(lon, lat, zoom)
+            xy.append(((x - left) * SUPERSAMPLE, (y - top) * SUPERSAMPLE))
+        if len(xy) > 1:
+            draw.line(xy, fill=255, width=line_width, joint='curve')
+        # Round line caps, as drawn by Leaflet.
+        for x, y in (xy[0], xy[-1]) if xy else ():
+            draw.ellipse((x - radius, y - radius, x + radius, y + radius), fill=255)
+
+    mask = overlay.resize((width, height), Image.LANCZOS)
+    mask = mask.point(lambda value: int(value * TRACK_OPACITY))
+    image.paste(Image.new('RGB', (width, height), TRACK_COLOR), (0, 0), mask)
+
+
+def render_static_map(lines, output_filename, width=800, height=600,
+                      tile_dir=None, layer='osm', max_zoom=18,
+                      center=None, zoom=13):
+    """
+    Render a track on top of local map tiles and save it as a PNG.
+
+    Args:
+        lines (list): Track segments as sequences of [lon, lat] pairs, e.g.
+            the ``coordinates`` of the GeoJSON features built by ``create_map``.
+        output_filename (str): Path of the PNG to write.
+        width (int, optional): Width of the PNG in pixels. Defaults to 800.
+        height (int, optional): Height of the PNG in pixels. Defaults to 600.
+        tile_dir (str, optional): Root of the local tile directory. Defaults to
+            ``WANDERALBUM_TILE_DIR`` or ``.cache/tiles`` in the repository.
+        layer (str, optional): Tile layer, ``'osm'`` or ``'swisstopo'``.
+            Defaults to ``'osm'``.
+        max_zoom (int, optional): Highest zoom level used. Defaults to 18.
+        center (list, optional): [latitude, longitude] to show if ``lines``
+            contains no points.
+        zoom (int, optional): Zoom level used together with ``center``.
+            Defaults to 13, like ``create_map``.
+
+    Returns:
+        str: The path of the written PNG.
+
+    Raises:
+        ValueError: If ``layer`` is unknown, or if there are no track points
+            and no ``center``.
+    """
+    if layer not in LAYERS:
+        raise ValueError(f"Unknown tile layer: {layer}")
+    lines = [line for line in lines if len(line)]
+
+    tile_dir = tile_dir or DEFAULT_TILE_DIR
+    zoom, left, top = _view(lines, width, height, max_zoom, center, zoom)
+
+    image = Image.new('RGB', (width, height), BACKGROUND)
+    _draw_tiles(image, tile_dir, layer, zoom, left, top)
+    _draw_track(image, lines, zoom, left, top)
+    image.save(output_filename)
+    return output_filename
@@ -0,0 +1,195 @@
+"""
+Vectorized statistics for elevation profiles.
+
+Computes distance, minimum and maximum elevation, total ascent and descent
+and the hiking time (Marschzeit) of a track from its NumPy arrays, so
+that ``profile`` and other callers (catalog, build) share one implementation
+and do not need to plot anything.
+
+Usage:
+    from stats import track_stats
+    stats = track_stats('260203_bachtel.gpx')
+    print(stats.summary())
+"""
+
+import numpy as np
+
+try:
+    from .tracks import Track, load_track
+except ImportError:
+    from tracks import Track, load_track
+
+
+# Elevation changes smaller than this (in metres) are treated as noise.
+DEFAULT_THRESHOLD = 2.0
+
+# Rates for the hiking time (Marschzeit). The defaults reproduce the
+# SchweizMobil times typed into the tour notebooks to within about 20 minutes.
+FLAT_SPEED = 4.2        # km/h
+ASCENT_RATE = 350.0     # m/h
+DESCENT_RATE = 1200.0   # m/h
+
+
+class TrackStats:
+    """
+    Summary statistics of a track.
+
+    Attributes:
+        distance (float): Total distance in metres.
+        min_elevation (float): Lowest elevation in metres.
+        max_elevation (float): Highest elevation in metres.
+        ascent (float): Total ascent in metres.
+        descent (float): Total descent in metres.
+        marschzeit (float): Hiking time in minutes.
+    """
+
+    __slots__ = ('distance', 'min_elevation', 'max_elevation', 'ascent',
+                 'descent', 'marschzeit')
+
+    def __init__(self, distance, min_elevation, max_elevation, ascent, descent,
+                 marschzeit):
+        self.distance = distance
+        self.min_elevation = min_elevation
+        self.max_elevation = max_elevation
+        self.ascent = ascent
+        self.descent = descent
+        self.marschzeit = marschzeit
+
+    def __repr__(self):
+        return f"TrackStats({self.summary()})"
+
+    def as_dict(self):
+        """Return the statistics as a plain dictionary."""
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def format_marschzeit(self):
+        """Return the hiking time as e.g. '3 h 10', rounded to 5 minutes."""
+        minutes = int(5 * round(self.marschzeit / 5))
+        hours, minutes = divmod(minutes, 60)
+        return f"{hours} h {minutes:02d}" if minutes else f"{hours} h"
+
+    def summary(self):
+        """Return the one-line summary shown below the elevation profile."""
+        return (f'Distanz: {self.distance / 1000:.2f} km | '
+                f'Min: {self.min_elevation:.0f} m | Max: {self.max_elevation:.0f} m | '
+                f'↑ {self.ascent:.0f} m | ↓ {self.descent:.0f} m')
+
+
+def _turning_points(elevations):
+    """Reduce a series to its first and last value and its local extrema."""
+    diff = np.diff(elevations)
+    nonzero = np.flatnonzero(diff)
+    if len(nonzero) == 0:
+        return elevations[:1]
+    direction = np.sign(diff[nonzero])
+    turns = nonzero[1:][direction[1:] != direction[:-1]]
+    return elevations[np.concatenate(([0], turns, [len(elevations) - 1]))]
+
+
+def ascent_descent(elevations, threshold=DEFAULT_THRESHOLD):
+    """
+    Return the total ascent and descent with a hysteresis threshold.
+
+    While climbing, every new high counts; the climb only turns into a
+    descent once the elevation drops more than ``threshold`` metres below
+    the last high (and vice versa), so that noise of a few metres is not
+    added up as climbing. The series is first reduced
+    to its turning points with NumPy; only those (typically a few hundred)
+    are walked in Python. With a threshold of 0 the result equals the sum of
+    all positive and negative differences.
+
+    Args:
+        elevations (numpy.ndarray): Elevations in metres, NaN values ignored.
+        threshold (float, optional): Hysteresis in metres.
+
+    Returns:
+        tuple: (ascent, descent) in metres.
+    """
+    elevations = np.asarray(elevations, dtype=np.float64)
+    elevations = elevations[~np.isnan(elevations)]
+    if len(elevations) < 2:
+        return 0.0, 0.0
+    if threshold <= 0:
+        diff = np.diff(elevations)
+        return float(diff[diff > 0].sum()), float(-diff[diff < 0].sum())
+
+    ascent = descent = 0.0
+    points = _turning_points(elevations)
+    reference = points[0]
+    direction = 0
+    for value in points[1:]:
+        change = value - reference
+        if direction >= 0 and change > 0 and (direction or change > threshold):
+            # Climbing: extend the climb with every new high.
+            ascent += change
+            reference = value
+            direction = 1
+        elif direction <= 0 and change < 0 and (direction or -change > threshold):
+            descent -= change
+            reference = value
+            direction = -1
+        elif abs(change) > threshold:
+            # Reversal by more than the threshold.
+            if change > 0:
+                ascent += change
+            else:
+                descent -= change
+            reference = value
+            direction = 1 if change > 0 else -1
+    return float(ascent), float(descent)
+
+
+def marschzeit(distance, ascent, descent, flat_speed=FLAT_SPEED,
+               ascent_rate=ASCENT_RATE, descent_rate=DESCENT_RATE):
+    """
+    Return the hiking time in minutes.
+
+    Uses the rule of DIN 33466, as taught by the Swiss and German alpine
+    clubs: horizontal and vertical time are computed separately, and the
+    smaller of the two is added at half weight to the larger.
+
+    Args:
+        distance (float): Distance in metres.
+        ascent (float): Total ascent in metres.
+        descent (float): Total descent in metres.
+        flat_speed (float, optional): Speed on the flat in km/h.
+        ascent_rate (float, optional): Climbing rate in metres per hour.
+        descent_rate (float, optional): Descending rate in metres per hour.
+
+    Returns:
+        float: Hiking time in minutes.
+    """
+    horizontal = distance / 1000 / flat_speed
+    vertical = ascent / ascent_rate + descent / descent_rate
+    return 60 * (max(horizontal, vertical) + min(horizontal, vertical) / 2)
+
+
+def track_stats(track, threshold=DEFAULT_THRESHOLD):
+    """
+    Compute the statistics of a track from its arrays.
+
+    Args:
+        track (Track or str): A loaded Track or the path to a GPX file.
+        threshold (float, optional): Hysteresis for ascent and descent in
+            metres. Defaults to 2 m.
+
+    Returns:
+        TrackStats: The statistics.
+    """
+    if not isinstance(track, Track):
+        track = load_track(track)
+
+    if len(track) == 0 or np.all(np.isnan(track.ele)):
+        min_elevation = max_elevation = float('nan')
+    else:
+        min_elevation = float(np.nanmin(track.ele))
+        max_elevation = float(np.nanmax(track.ele))
+    ascent, descent = ascent_descent(track.ele, threshold)
+    return TrackStats(
+        distance=track.distance,
+        min_elevation=min_elevation,
+        max_elevation=max_elevation,
+        ascent=ascent,
+        descent=descent,
+        marschzeit=marschzeit(track.distance, ascent, descent),
+    )
@@ -1,7 +1,10 @@
 import json
 import base64
+import sys
 from pathlib import Path
 
+BASE_DIR = Path(__file__).resolve().parent.parent
+
 def encode_gpx_url_for_mobile_app(gpx_url):
     """Encode GPX URL to base64 for Swisstopo Mobile App."""
     encoded = base64.b64encode(gpx_url.encode('utf-8')).decode('utf-8')
@@ -13,8 +16,11 @@ def extract_gpx_url_from_swisstopo_link(swisstopo_url):
         return swisstopo_url.split('layers=GPX|')[1]
     return None
 
-# Test with one notebook
-notebook_path = Path(r"c:\Users\jcms\Documents\wanderalbum\files\2025\250629_maderanertal\maderanertal.ipynb")
+# Test with one notebook (or the one given on the command line)
+if len(sys.argv) > 1:
+    notebook_path = Path(sys.argv[1])
+else:
+    notebook_path = BASE_DIR / 'files' / '2025' / '250629_maderanertal' / 'maderanertal.ipynb'
 
 print(f"Testing: {notebook_path}")
 
@@ -0,0 +1,434 @@
+"""
+On-disk tile cache and local tile server for the map layers used by create_map.
+
+The cache stores OpenStreetMap tiles and swisstopo WMS tiles under
+``<root>/<layer>/<z>/<x>/<y>.png`` (the layout ``static_map.py`` reads) and
+evicts the least recently used tiles once the cache exceeds its size limit.
+WMS requests whose bounding box matches a Web Mercator tile are stored under
+that tile's z/x/y key, other bounding boxes under a hash of the request.
+
+Usage:
+    python -m scripts.tile_cache serve [--port 8765] [--offline]
+    python -m scripts.tile_cache prefetch [--zooms 12-15] [--layers swisstopo,osm]
+
+Set ``WANDERALBUM_TILE_SERVER=http://127.0.0.1:8765`` to make create_map load
+its tiles through the local server. With ``--offline`` (or
+``WANDERALBUM_OFFLINE=1``) tiles are served from the cache only.
+
+The OpenStreetMap tile usage policy does not allow bulk downloads, so
+``prefetch`` only fetches OSM tiles when asked to with ``--layers``, and
+then over at most OSM_MAX_CONNECTIONS connections.
+"""
+
+import argparse
+import glob
+import hashlib
+import math
+import os
+import sys
+import threading
+import urllib.parse
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    from .atomic import atomic_write
+    from .static_map import DEFAULT_TILE_DIR, TILE_SIZE, fit_bounds, project
+except ImportError:
+    from atomic import atomic_write
+    from static_map import DEFAULT_TILE_DIR, TILE_SIZE, fit_bounds, project
+
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+DEFAULT_MAX_BYTES = int(os.environ.get('WANDERALBUM_TILE_CACHE_MB', 500)) * 1024 * 1024
+DEFAULT_PORT = 8765
+USER_AGENT = 'wanderalbum-tile-cache/1.0 (+https://github.com/Jacques-Mock-Schindler/wanderalbum_illustriert)'
+
+OSM_URL = 'https://tile.openstreetmap.org/{z}/{x}/{y}.png'
+# Limit of the OSM tile usage policy for parallel downloads.
+OSM_MAX_CONNECTIONS = 2
+WMS_URL = 'https://wms.geo.admin.ch/'
+
+# WMS layer name -> local layer name
+WMS_LAYERS = {'ch.swisstopo.pixelkarte-farbe': 'swisstopo'}
+
+# Half the width of the EPSG:3857 world in metres.
+WORLD_EXTENT = 20037508.342789244
+
+
+def xyz_key(layer, z, x, y):
+    """Return the cache key of an XYZ tile."""
+    return f'{layer}/{z}/{x}/{y}.png'
+
+
+def tile_bbox(z, x, y):
+    """
+    Return the EPSG:3857 bounding box of an XYZ tile.
+
+    Returns:
+        tuple: (minx, miny, maxx, maxy) in metres.
+    """
+    size = 2 * WORLD_EXTENT / 2 ** z
+    minx = -WORLD_EXTENT + x * size
+    maxy = WORLD_EXTENT - y * size
+    return minx, maxy - size, minx + size, maxy
+
+
+def wms_key(layer, bbox, width=TILE_SIZE, height=TILE_SIZE):
+    """
+    Return the cache key of a WMS GetMap request.
+
+    Requests for a 256x256 image whose EPSG:3857 bounding box is exactly one
+    Web Mercator tile (which is what Leaflet asks for) share the key of that
+    tile, so the browser and ``static_map.py`` use the same files.
+
+    Args:
+        layer (str): Local layer name, e.g. ``'swisstopo'``.
+        bbox (tuple): (minx, miny, maxx, maxy) in EPSG:3857 metres.
+        width (int, optional): Image width in pixels.
+        height (int, optional): Image height in pixels.
+
+    Returns:
+        str: The cache key.
+    """
+    minx, miny, maxx, maxy = bbox
+    size = maxx - minx
+    if width == height == TILE_SIZE and size > 0:
+        z = math.log2(2 * WORLD_EXTENT / size)
+        x = (minx + WORLD_EXTENT) / size
+        y = (WORLD_EXTENT - maxy) / size
+        if all(abs(v - round(v)) < 1e-6 for v in (z, x, y)) and abs(maxy - miny - size) < 1e-3:
+            return xyz_key(layer, round(z), round(x), round(y))
+
+    digest = hashlib.sha1(
+        f'{minx:.3f},{miny:.3f},{maxx:.3f},{maxy:.3f},{width},{height}'.encode()).hexdigest()
+    return f'{layer}/bbox/{digest}.png'
+
+
+def upstream_url(layer, z, x, y):
+    """Return the URL of an XYZ tile on the upstream server."""
+    if layer == 'osm':
+        return OSM_URL.format(z=z, x=x, y=y)
+    wms_layer = next(name for name, local in WMS_LAYERS.items() if local == layer)
+    return WMS_URL + '?' + urllib.parse.urlencode({
+        'service': 'WMS',
+        'request': 'GetMap',
+        'layers': wms_layer,
+        'styles': '',
+        'format': 'image/png',
+        'transparent': 'false',
+        'version': '1.1.1',
+        'width': TILE_SIZE,
+        'height': TILE_SIZE,
+        'srs': 'EPSG:3857',
+        'bbox': ','.join(str(v) for v in tile_bbox(z, x, y)),
+    })
+
+
+def download(url, timeout=30):
+    """Fetch ``url`` and return the response body."""
+    request = urllib.request.Request(url, headers={'User-Agent': USER_AGENT})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return response.read()
+
+
+class TileCache:
+    """
+    Size-bounded on-disk tile store with least-recently-used eviction.
+
+    Recency is tracked through the modification time of the tile files, so it
+    survives restarts: a cache hit touches the file, and eviction removes the
+    oldest files first.
+
+    Args:
+        root (str, optional): Cache directory. Defaults to
+            ``WANDERALBUM_TILE_DIR`` or ``.cache/tiles`` in the repository.
+        max_bytes (int, optional): Size limit. Defaults to
+            ``WANDERALBUM_TILE_CACHE_MB`` (500 MB).
+        offline (bool, optional): Never contact upstream servers. Defaults to
+            the ``WANDERALBUM_OFFLINE`` environment variable.
+    """
+
+    def __init__(self, root=None, max_bytes=DEFAULT_MAX_BYTES, offline=None):
+        self.root = root or DEFAULT_TILE_DIR
+        self.max_bytes = max_bytes
+        if offline is None:
+            offline = os.environ.get('WANDERALBUM_OFFLINE', '') not in ('', '0')
+        self.offline = offline
+        self._lock = threading.Lock()
+        self._entries = None
+        self._size = 0
+
+    def path(self, key):
+        """Return the file path of ``key``."""
+        return os.path.join(self.root, *key.split('/'))
+
+    def _load_index(self):
+        entries = []
+        for path in glob.glob(os.path.join(self.root, '**', '*.png'), recursive=True):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            key = os.path.relpath(path, self.root).replace(os.sep, '/')
+            entries.append((stat.st_mtime, key, stat.st_size))
+        entries.sort()
+        self._entries = OrderedDict((key, size) for _, key, size in entries)
+        self._size = sum(self._entries.values())
+
+    def _index(self):
+        if self._entries is None:
+            self._load_index()
+        return self._entries
+
+    @property
+    def size(self):
+        """Total size of all cached tiles in bytes."""
+        with self._lock:
+            self._index()
+            return self._size
+
+    def get(self, key):
+        """Return the cached bytes of ``key``, or None on a miss."""
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            entries = self._index()
+            if key in entries:
+                entries.move_to_end(key)
+            else:
+                entries[key] = len(data)
+                self._size += len(data)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return data
+
+    def put(self, key, data):
+        """Store ``data`` under ``key`` and evict old tiles if needed."""
+        atomic_write(self.path(key), data)
+        with self._lock:
+            entries = self._index()
+            self._size += len(data) - entries.pop(key, 0)
+            entries[key] = len(data)
+            self._evict()
+
+    def _evict(self):
+        while self._size > self.max_bytes and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            self._size -= size
+            try:
+                os.remove(self.path(key))
+            except FileNotFoundError:
+                pass
+
+    def fetch(self, key, url):
+        """
+        Return the tile ``key``, downloading it from ``url`` on a miss.
+
+        Returns:
+            bytes or None: The tile, or None if it is not cached and the
+            cache is offline.
+        """
+        data = self.get(key)
+        if data is None and not self.offline:
+            data = download(url)
+            self.put(key, data)
+        return data
+
+    def tile(self, layer, z, x, y):
+        """Return the XYZ tile of ``layer``, downloading it on a miss."""
+        return self.fetch(xyz_key(layer, z, x, y), upstream_url(layer, z, x, y))
+
+
+class TileRequestHandler(BaseHTTPRequestHandler):
+    """
+    Serves ``/<layer>/<z>/<x>/<y>.png`` and ``/wms?<GetMap query>`` from a
+    TileCache bound to the server as ``server.cache``.
+    """
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        parts = url.path.strip('/').split('/')
+        cache = self.server.cache
+        try:
+            if parts[0] == 'wms':
+                data = self._wms(cache, urllib.parse.parse_qs(url.query))
+            elif len(parts) == 4 and parts[3].endswith('.png'):
+                layer, z, x, y = parts[0], int(parts[1]), int(parts[2]), int(parts[3][:-4])
+                data = cache.tile(layer, z, x, y)
+            else:
+                self.send_error(404)
+                return
+        except (ValueError, KeyError, StopIteration):
+            self.send_error(400)
+            return
+        except OSError as e:
+            self.send_error(502, str(e))
+            return
+
+        if data is None:
+            self.send_error(404, 'Tile not cached')
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/png')
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('Cache-Control', 'max-age=86400')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _wms(self, cache, query):
+        params = {name.lower(): values[0] for name, values in query.items()}
+        layer = WMS_LAYERS[params['layers']]
+        bbox = tuple(float(v) for v in params['bbox'].split(','))
+        key = wms_key(layer, bbox, int(params['width']), int(params['height']))
+        upstream = WMS_URL + '?' + urllib.parse.urlencode(params)
+        return cache.fetch(key, upstream)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port=DEFAULT_PORT, cache=None):
+    """Run the local tile server until interrupted."""
+    server = ThreadingHTTPServer(('127.0.0.1', port), TileRequestHandler)
+    server.cache = cache or TileCache()
+    print(f"Serving tiles from {server.cache.root} on http://127.0.0.1:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def tiles_for_bounds(bounds, zoom):
+    """
+    Return the XYZ tiles covering a bounding box at one zoom level.
+
+    Args:
+        bounds (tuple): (min_lat, min_lon, max_lat, max_lon).
+        zoom (int): Zoom level.
+
+    Returns:
+        list: (z, x, y) tuples.
+    """
+    min_lat, min_lon, max_lat, max_lon = bounds
+    left, top = project(min_lon, max_lat, zoom)
+    right, bottom = project(max_lon, min_lat, zoom)
+    return [(zoom, x, y)
+            for x in range(int(left // TILE_SIZE), int(right // TILE_SIZE) + 1)
+            for y in range(int(top // TILE_SIZE), int(bottom // TILE_SIZE) + 1)]
+
+
+def tiles_for_view(bounds, width=800, height=600):
+    """Return the tiles of the view ``create_map`` fits to ``bounds``."""
+    min_lat, min_lon, max_lat, max_lon = bounds
+    zoom, cx, cy = fit_bounds([[[min_lon, min_lat], [max_lon, max_lat]]], width, height)
+    left, top = round(cx - width / 2), round(cy - height / 2)
+    return [(zoom, x, y)
+            for x in range(left // TILE_SIZE, (left + width - 1) // TILE_SIZE + 1)
+            for y in range(top // TILE_SIZE, (top + height - 1) // TILE_SIZE + 1)]
+
+
+def gpx_bounds(files_dir=os.path.join(BASE_DIR, 'files')):
+    """Yield (path, bounds) for every GPX file below ``files_dir``."""
+    import gpxpy
+
+    for path in sorted(glob.glob(os.path.join(files_dir, '**', '*.gpx'), recursive=True)):
+        with open(path, 'r') as gpx_file:
+            b = gpxpy.parse(gpx_file).get_bounds()
+        if b is not None:
+            yield path, (b.min_latitude, b.min_longitude, b.max_latitude, b.max_longitude)
+
+
+def prefetch(zooms=(), layers=('swisstopo',), cache=None, workers=4):
+    """
+    Warm the cache for the bounding box of every GPX track under files/.
+
+    For each track the tiles of the 800x600 view rendered by ``create_map``
+    are fetched, plus every tile covering the bounding box at ``zooms``.
+
+    Args:
+        zooms (tuple, optional): Extra zoom levels for the track bounds.
+        layers (tuple, optional): Layers to fetch. ``'osm'`` has to be
+            named explicitly; its tiles are fetched over at most
+            OSM_MAX_CONNECTIONS connections, whatever ``workers`` is.
+        cache (TileCache, optional): Cache to fill.
+        workers (int, optional): Parallel downloads of the other layers.
+
+    Returns:
+        tuple: (number of tiles requested, number of failures).
+    """
+    cache = cache or TileCache()
+    wanted = set()
+    for _, bounds in gpx_bounds():
+        tiles = set(tiles_for_view(bounds))
+        for zoom in zooms:
+            tiles.update(tiles_for_bounds(bounds, zoom))
+        wanted.update((layer,) + tile for layer in layers for tile in tiles)
+
+    def fetch(item):
+        try:
+            cache.tile(*item)
+            return True
+        except OSError as e:
+            print(f"Failed {item}: {e}")
+            return False
+
+    results = []
+    for osm in (False, True):
+        items = sorted(item for item in wanted if (item[0] == 'osm') == osm)
+        if not items:
+            continue
+        limit = min(workers, OSM_MAX_CONNECTIONS) if osm else workers
+        with ThreadPoolExecutor(max_workers=max(limit, 1)) as pool:
+            results.extend(pool.map(fetch, items))
+    return len(results), results.count(False)
+
+
+def _zoom_range(text):
+    if not text:
+        return ()
+    first, _, last = text.partition('-')
+    return tuple(range(int(first), int(last or first) + 1))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    serve_parser = sub.add_parser('serve', help='run the local tile server')
+    serve_parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    serve_parser.add_argument('--offline', action='store_true',
+                              help='serve cached tiles only')
+
+    prefetch_parser = sub.add_parser('prefetch', help='warm the cache for all GPX tracks')
+    prefetch_parser.add_argument('--zooms', default='',
+                                 help='extra zoom range for the track bounds, e.g. 12-15')
+    prefetch_parser.add_argument('--layers', default='swisstopo',
+                                 help='comma-separated layers; add osm explicitly, '
+                                      f'it is fetched over at most {OSM_MAX_CONNECTIONS} '
+                                      'connections')
+    prefetch_parser.add_argument('--workers', type=int, default=4)
+
+    args = parser.parse_args(argv)
+    if args.command == 'serve':
+        serve(args.port, TileCache(offline=args.offline or None))
+    else:
+        count, failed = prefetch(_zoom_range(args.zooms), args.layers.split(','),
+                                 workers=args.workers)
+        print(f"Prefetched {count - failed} of {count} tiles")
+        return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,290 @@
+"""
+Discovery of tour directories under files/.
+
+A tour is a directory ``files/<year>/<yymmdd>_<name>/`` that contains a GPX
+track, usually next to a notebook and a ``_metadata.yml``. This module finds
+them and collects what the build tools need to know about each one.
+
+Usage:
+    from tours import discover_tours
+    for tour in discover_tours():
+        print(tour.slug, tour.gpx, tour.metadata.get('canton'))
+"""
+
+import ast
+import datetime
+import glob
+import json
+import os
+import re
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+FILES_DIR = os.path.join(BASE_DIR, 'files')
+
+GITHUB_RAW_BASE = 'https://raw.githubusercontent.com/Jacques-Mock-Schindler/wanderalbum_illustriert/main'
+
+_TOUR_DIR = re.compile(r'^(\d{6})_')
+_MAGIC = re.compile(r"^\s*[%!].*$", re.MULTILINE)
+_HEADING = re.compile(r"^#\s+(.+)$", re.MULTILINE)
+
+
+class Tour:
+    """
+    One tour directory.
+
+    Attributes:
+        directory (str): Absolute path of the tour directory.
+        year (str): Name of the year directory, e.g. ``'2026'``.
+        slug (str): Name of the tour directory, e.g. ``'260203_bachtel'``.
+        prefix (str): Date prefix of the directory name, e.g. ``'260203'``.
+        gpx (str): Absolute path of the GPX file.
+        notebook (str or None): Absolute path of the notebook, if any.
+    """
+
+    def __init__(self, directory, gpx, notebook=None):
+        self.directory = directory
+        self.year = os.path.basename(os.path.dirname(directory))
+        self.slug = os.path.basename(directory)
+        self.prefix = _TOUR_DIR.match(self.slug).group(1)
+        self.gpx = gpx
+        self.notebook = notebook
+        self._metadata = None
+        self._variables = None
+        self._title = None
+
+    def __repr__(self):
+        return f"Tour({self.year}/{self.slug})"
+
+    @property
+    def rel_dir(self):
+        """Tour directory relative to the repository root, with '/'."""
+        return os.path.relpath(self.directory, BASE_DIR).replace(os.sep, '/')
+
+    @property
+    def gpx_url(self):
+        """Raw GitHub URL of the GPX file, as used in the swisstopo links."""
+        return f"{GITHUB_RAW_BASE}/{self.rel_dir}/{os.path.basename(self.gpx)}"
+
+    @property
+    def page_url(self):
+        """Site path of the rendered notebook, as in ``listings.json``."""
+        if not self.notebook:
+            return None
+        page = os.path.splitext(os.path.basename(self.notebook))[0] + '.html'
+        return f"/{self.rel_dir}/{page}"
+
+    @property
+    def title(self):
+        """Title from the metadata or the notebook's first heading."""
+        if self._title is None:
+            self._title = self.metadata.get('title') or (
+                notebook_title(self.notebook) if self.notebook else None) or self.slug
+        return self._title
+
+    @property
+    def metadata(self):
+        """Quarto metadata: the year's ``_metadata.yml`` overridden by the tour's."""
+        if self._metadata is None:
+            self._metadata = {}
+            for directory in (os.path.dirname(self.directory), self.directory):
+                self._metadata.update(read_metadata(directory))
+        return self._metadata
+
+    @property
+    def date(self):
+        """Date of the tour from the metadata, or from the directory prefix."""
+        value = self.metadata.get('date')
+        if isinstance(value, datetime.date):
+            return value
+        if isinstance(value, str):
+            try:
+                return datetime.date.fromisoformat(value)
+            except ValueError:
+                pass
+        return datetime.datetime.strptime(self.prefix, '%y%m%d').date()
+
+    @property
+    def variables(self):
+        """``center``, ``swiss_grid`` and ``path`` as set in the notebook."""
+        if self._variables is None:
+            self._variables = notebook_variables(self.notebook) if self.notebook else {}
+        return self._variables
+
+
+def read_metadata(directory):
+    """Return the content of ``_metadata.yml`` in ``directory`` (or {})."""
+    path = os.path.join(directory, '_metadata.yml')
+    if not os.path.exists(path):
+        return {}
+    import yaml
+
+    with open(path, 'r', encoding='utf-8') as f:
+        return yaml.safe_load(f) or {}
+
+
+# Names of the notebook variables; the older notebooks misspell the grid one.
+_VARIABLES = {
+    'center': 'center',
+    'cener_swiss_grid': 'swiss_grid',
+    'center_swiss_grid': 'swiss_grid',
+    'path': 'path',
+}
+# The notebooks write qr_tag.png with this helper.
+_QR_HELPER = 'generate_qr_code_for_url'
+
+
+def code_variables(source):
+    """
+    Return ``center``, ``swiss_grid``, ``path`` and ``qr_url`` of a code cell.
+
+    Only top-level assignments of literals count, and for ``qr_url`` a
+    top-level ``generate_qr_code_for_url`` call with a literal URL; IPython
+    magics and shell escapes are ignored.
+
+    Args:
+        source (str): Source of the cell.
+
+    Returns:
+        dict: The variables found; missing ones are left out.
+    """
+    if not any(name in source for name in (*_VARIABLES, _QR_HELPER)):
+        return {}
+    try:
+        tree = ast.parse(_MAGIC.sub('', source))
+    except SyntaxError:
+        return {}
+
+    variables = {}
+    for node in tree.body:
+        call = getattr(node, 'value', None)
+        if (isinstance(node, (ast.Expr, ast.Assign)) and isinstance(call, ast.Call)
+                and getattr(call.func, 'id', None) == _QR_HELPER and call.args
+                and isinstance(call.args[0], ast.Constant)
+                and isinstance(call.args[0].value, str)):
+            variables.setdefault('qr_url', call.args[0].value)
+            continue
+        if not isinstance(node, ast.Assign):
+            continue
+        for target in node.targets:
+            name = _VARIABLES.get(getattr(target, 'id', None))
+            if name is None or name in variables:
+                continue
+            try:
+                value = ast.literal_eval(node.value)
+                if name != 'path':
+                    value = [float(v) for v in value]
+            except (ValueError, TypeError, SyntaxError):
+                continue
+            if name == 'path' and not isinstance(value, str):
+                continue
+            if name != 'path' and len(value) != 2:
+                continue
+            variables[name] = value
+    return variables
+
+
+def notebook_variables(path):
+    """
+    Return ``center``, ``swiss_grid``, ``path`` and ``qr_url`` (the URL
+    passed to ``generate_qr_code_for_url``) from a notebook's code.
+
+    Args:
+        path (str): Path to the notebook.
+
+    Returns:
+        dict: The variables found; missing ones are left out.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        notebook = json.load(f)
+
+    variables = {}
+    for cell in notebook['cells']:
+        if cell['cell_type'] != 'code':
+            continue
+        for name, value in code_variables(''.join(cell['source'])).items():
+            variables.setdefault(name, value)
+        if len(variables) == 4:
+            break
+    return variables
+
+
+def notebook_title(path):
+    """Return the first level-one heading of a notebook, or None."""
+    with open(path, 'r', encoding='utf-8') as f:
+        notebook = json.load(f)
+
+    for cell in notebook['cells']:
+        if cell['cell_type'] == 'markdown':
+            heading = _HEADING.search(''.join(cell['source']))
+            if heading:
+                return heading.group(1).strip()
+    return None
+
+
+def lv95(lat, lon):
+    """
+    Convert WGS84 coordinates to Swiss LV95 (E, N) in metres.
+
+    Uses swisstopo's approximate formulas, accurate to about a metre in
+    Switzerland. Works on scalars and on NumPy arrays.
+
+    Args:
+        lat (float or numpy.ndarray): Latitude in degrees.
+        lon (float or numpy.ndarray): Longitude in degrees.
+
+    Returns:
+        tuple: (east, north)
+    """
+    phi = (lat * 3600 - 169028.66) / 10000
+    lam = (lon * 3600 - 26782.5) / 10000
+    east = (2600072.37 + 211455.93 * lam - 10938.51 * lam * phi
+            - 0.36 * lam * phi ** 2 - 44.54 * lam ** 3)
+    north = (1200147.07 + 308807.95 * phi + 3745.25 * lam ** 2 + 76.63 * phi ** 2
+             - 194.56 * lam ** 2 * phi + 119.79 * phi ** 3)
+    return east, north
+
+
+def wgs84_to_lv95(lat, lon):
+    """
+    Convert one WGS84 coordinate to Swiss LV95, as used in the swisstopo links.
+
+    Args:
+        lat (float): Latitude in degrees.
+        lon (float): Longitude in degrees.
+
+    Returns:
+        list: [east, north], rounded to centimetres.
+    """
+    east, north = lv95(lat, lon)
+    return [round(east, 2), round(north, 2)]
+
+
+def find_tour(directory):
+    """Return the Tour of ``directory``, or None if it holds no GPX file."""
+    directory = os.path.abspath(directory)
+    if not _TOUR_DIR.match(os.path.basename(directory)):
+        return None
+    gpx_files = sorted(glob.glob(os.path.join(directory, '*.gpx')))
+    if not gpx_files:
+        return None
+    notebooks = sorted(glob.glob(os.path.join(directory, '*.ipynb')))
+    return Tour(directory, gpx_files[0], notebooks[0] if notebooks else None)
+
+
+def discover_tours(files_dir=FILES_DIR):
+    """
+    Return every tour below ``files_dir``, sorted by year and directory.
+
+    Args:
+        files_dir (str, optional): Root to search. Defaults to files/.
+
+    Returns:
+        list: Tour objects.
+    """
+    tours = []
+    for directory in sorted(glob.glob(os.path.join(files_dir, '*', '*'))):
+        if os.path.isdir(directory):
+            tour = find_tour(directory)
+            if tour is not None:
+                tours.append(tour)
+    return tours
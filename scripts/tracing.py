@@ -0,0 +1,396 @@
+"""
+Stage-level timing of the render helpers.
+
+When a render is slow, the total time of ``create_map`` does not tell
+whether it went to parsing the GPX file, building the map, ``m.save``,
+starting Chrome, waiting for the tiles or writing the screenshot. The
+helpers wrap each of these stages in a named span:
+
+    with span('map.save'):
+        m.save(html_path)
+
+With ``WANDERALBUM_TRACE`` set, every span appends one JSON line to a trace
+file when it ends:
+
+    name         stage, e.g. 'screenshot.wait'
+    tour         tour directory relative to files/ (from the GPX path of the
+                 outermost span, else the working directory)
+    pid, id      process and span number; ``parent`` is the id of the
+                 enclosing span in the same thread
+    ts           start, seconds since the epoch
+    wall_ms      wall time
+    cpu_ms       CPU time of the process (all threads, not Chrome)
+    peak_rss_mb  peak resident set size of the process at the end
+    rss_growth_mb
+                 how much the span raised that peak
+    error        exception type, if the span ended with one
+    attrs        further values, e.g. ``{'memo': 'hit'}``
+
+``WANDERALBUM_TRACE=1`` writes to ``.cache/trace.jsonl``; any other value
+is the file to write to, relative to the repository. Lines are appended
+with a single write, so the kernels of a ``quarto render`` and the workers
+of ``build.py`` can share one file. Without the variable ``span`` returns a
+shared do-nothing context manager.
+
+Usage:
+    WANDERALBUM_TRACE=1 quarto render
+    python -m scripts.tracing [--top 10] [--file .cache/trace.jsonl]
+    python -m scripts.tracing clear
+"""
+
+import functools
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+BASE_DIR = os.path.dirname(SCRIPTS_DIR)
+FILES_DIR = os.path.join(BASE_DIR, 'files')
+DEFAULT_TRACE = os.path.join(BASE_DIR, '.cache', 'trace.jsonl')
+
+_MIB = 1024 * 1024
+
+_local = threading.local()
+_ids = itertools.count(1)
+_peak_rss = None
+
+
+def trace_path():
+    """Return the trace file named by ``WANDERALBUM_TRACE``, or None if tracing is off."""
+    value = os.environ.get('WANDERALBUM_TRACE')
+    if not value or value.lower() in ('0', 'false', 'no', 'off'):
+        return None
+    if value.lower() in ('1', 'true', 'yes', 'on'):
+        return DEFAULT_TRACE
+    return os.path.join(BASE_DIR, os.path.expanduser(value))
+
+
+def peak_rss():
+    """Return the peak resident set size of this process in bytes, or None."""
+    global _peak_rss
+    if _peak_rss is None:
+        try:
+            import resource
+        except ImportError:
+            # Windows: the peak working set, if psutil is installed.
+            try:
+                import psutil
+            except ImportError:
+                _peak_rss = lambda: None
+            else:
+                process = psutil.Process()
+                _peak_rss = lambda: getattr(process.memory_info(), 'peak_wset', None)
+        else:
+            # ru_maxrss is in bytes on macOS and in KiB elsewhere.
+            scale = 1 if sys.platform == 'darwin' else 1024
+            _peak_rss = lambda: resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    return _peak_rss()
+
+
+def tour_of(path=None):
+    """
+    Return the tour a file or the working directory belongs to.
+
+    Args:
+        path (str, optional): A file of the tour, e.g. its GPX file.
+
+    Returns:
+        str: Its directory relative to files/ (e.g. '2025/250629_maderanertal'),
+            or the directory name outside files/.
+    """
+    directory = os.path.dirname(os.path.abspath(path)) if path else os.getcwd()
+    try:
+        relative = os.path.relpath(directory, FILES_DIR)
+    except ValueError:
+        # Another drive on Windows.
+        relative = os.pardir
+    if relative == os.pardir or relative.startswith(os.pardir + os.sep):
+        return os.path.basename(directory)
+    return relative.replace(os.sep, '/')
+
+
+def _stack():
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+class _NoSpan:
+    """The span returned while tracing is off."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+_NO_SPAN = _NoSpan()
+
+
+class Span:
+    """
+    A timed stage; use ``span`` to create one.
+
+    Args:
+        name (str): Name of the stage.
+        trace_file (str): File to append the record to.
+        path (str, optional): File of the tour (see ``tour_of``). Nested
+            spans take the tour of the enclosing one.
+        attrs (dict, optional): Values to record.
+    """
+
+    def __init__(self, name, trace_file, path=None, attrs=None):
+        self.name = name
+        self.trace_file = trace_file
+        self.path = path
+        self.attrs = dict(attrs or {})
+
+    def set(self, **attrs):
+        """Record further values, e.g. whether a cache was hit."""
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        stack = _stack()
+        parent = stack[-1] if stack else None
+        self.id = next(_ids)
+        self.parent = parent.id if parent else None
+        if self.path is None and parent is not None:
+            self.tour = parent.tour
+        else:
+            self.tour = tour_of(self.path)
+        stack.append(self)
+        self._peak = peak_rss()
+        self._ts = time.time()
+        self._cpu = time.process_time()
+        self._wall = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall = time.perf_counter() - self._wall
+        cpu = time.process_time() - self._cpu
+        peak = peak_rss()
+        stack = _stack()
+        if stack and stack[-1] is self:
+            stack.pop()
+        record = {
+            'name': self.name,
+            'tour': self.tour,
+            'pid': os.getpid(),
+            'id': self.id,
+            'parent': self.parent,
+            'ts': round(self._ts, 3),
+            'wall_ms': round(wall * 1000, 3),
+            'cpu_ms': round(cpu * 1000, 3),
+            'peak_rss_mb': round(peak / _MIB, 1) if peak is not None else None,
+            'rss_growth_mb': (round((peak - self._peak) / _MIB, 1)
+                              if peak is not None and self._peak is not None else None),
+        }
+        if exc_type is not None:
+            record['error'] = exc_type.__name__
+        if self.attrs:
+            record['attrs'] = self.attrs
+        _append(self.trace_file, record)
+        return False
+
+
+def _append(trace_file, record):
+    line = (json.dumps(record, ensure_ascii=False, separators=(',', ':'), default=str)
+            + '\n').encode('utf-8')
+    try:
+        os.makedirs(os.path.dirname(trace_file), exist_ok=True)
+        # One write to a file opened for appending: lines of concurrent
+        # processes do not interleave.
+        fd = os.open(trace_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+    except OSError:
+        # The trace must never break a render.
+        pass
+
+
+def span(name, path=None, **attrs):
+    """
+    Return a context manager that times a stage.
+
+    Args:
+        name (str): Name of the stage, e.g. 'screenshot.wait'.
+        path (str, optional): File of the tour, for the outermost span.
+        **attrs: Values to record with the span.
+
+    Returns:
+        Span: The span, or a shared no-op stand-in if tracing is off. Both
+            have ``set(**attrs)``.
+    """
+    trace_file = trace_path()
+    if trace_file is None:
+        return _NO_SPAN
+    return Span(name, trace_file, path, attrs)
+
+
+def annotate(**attrs):
+    """Record values with the innermost open span of this thread, if any."""
+    stack = getattr(_local, 'stack', None)
+    if stack:
+        stack[-1].set(**attrs)
+
+
+def traced(name=None, path=None):
+    """
+    Decorator that wraps every call of a function in a span.
+
+    Args:
+        name (str, optional): Name of the span. Defaults to the function name.
+        path (str, optional): Name of the argument holding the tour's file.
+    """
+    def decorator(function):
+        span_name = name or function.__name__
+        state = {}
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            trace_file = trace_path()
+            if trace_file is None:
+                return function(*args, **kwargs)
+            tour_file = None
+            if path:
+                if 'signature' not in state:
+                    import inspect
+
+                    state['signature'] = inspect.signature(function)
+                try:
+                    tour_file = state['signature'].bind(*args, **kwargs).arguments.get(path)
+                except TypeError:
+                    pass
+            with Span(span_name, trace_file, tour_file):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def read_trace(trace_file):
+    """Return the records of a trace file, skipping lines that do not parse."""
+    records = []
+    with open(trace_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                # A line cut off by a killed process.
+                continue
+    return records
+
+
+def summarize(records):
+    """
+    Aggregate trace records by stage and by tour.
+
+    Args:
+        records (list): Records from ``read_trace``.
+
+    Returns:
+        tuple: ``stages`` (name -> dict with count, wall_ms, cpu_ms, max_ms,
+            peak_rss_mb and errors) and ``tours`` (tour -> dict with calls,
+            wall_ms of its outermost spans and ``stages``, name -> wall_ms of
+            the nested ones).
+    """
+    stages = {}
+    tours = {}
+    for record in records:
+        stage = stages.setdefault(record['name'], {
+            'count': 0, 'wall_ms': 0.0, 'cpu_ms': 0.0, 'max_ms': 0.0,
+            'peak_rss_mb': None, 'errors': 0})
+        stage['count'] += 1
+        stage['wall_ms'] += record['wall_ms']
+        stage['cpu_ms'] += record['cpu_ms']
+        stage['max_ms'] = max(stage['max_ms'], record['wall_ms'])
+        if record.get('peak_rss_mb') is not None:
+            stage['peak_rss_mb'] = max(stage['peak_rss_mb'] or 0, record['peak_rss_mb'])
+        if record.get('error'):
+            stage['errors'] += 1
+
+        tour = tours.setdefault(record.get('tour') or '?',
+                                {'calls': 0, 'wall_ms': 0.0, 'stages': {}})
+        if record.get('parent') is None:
+            tour['calls'] += 1
+            tour['wall_ms'] += record['wall_ms']
+        else:
+            tour['stages'][record['name']] = (tour['stages'].get(record['name'], 0.0)
+                                              + record['wall_ms'])
+    return stages, tours
+
+
+def print_summary(records, top=10):
+    """Print the stages by total time and the ``top`` slowest tours."""
+    stages, tours = summarize(records)
+    processes = {record['pid'] for record in records}
+    start = min(record['ts'] for record in records)
+    end = max(record['ts'] + record['wall_ms'] / 1000 for record in records)
+    print(f"{len(records)} Spans aus {len(processes)} Prozessen, "
+          f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(start))} "
+          f"bis {time.strftime('%H:%M:%S', time.localtime(end))}")
+
+    print(f"\n{'Stufe':<26}{'Anzahl':>7}{'total s':>10}{'Mittel ms':>11}"
+          f"{'max ms':>10}{'CPU s':>8}{'RSS MiB':>9}")
+    for name, stage in sorted(stages.items(), key=lambda item: -item[1]['wall_ms']):
+        rss = f"{stage['peak_rss_mb']:.0f}" if stage['peak_rss_mb'] is not None else '-'
+        errors = f"  {stage['errors']} Fehler" if stage['errors'] else ''
+        print(f"{name:<26}{stage['count']:>7}{stage['wall_ms'] / 1000:>10.2f}"
+              f"{stage['wall_ms'] / stage['count']:>11.1f}{stage['max_ms']:>10.1f}"
+              f"{stage['cpu_ms'] / 1000:>8.2f}{rss:>9}{errors}")
+
+    print(f"\nLangsamste Touren (Top {top}):")
+    slowest = sorted(tours.items(), key=lambda item: -item[1]['wall_ms'])[:top]
+    for name, tour in slowest:
+        if tour['stages']:
+            stage, wall = max(tour['stages'].items(), key=lambda item: item[1])
+            detail = f"  davon {stage} {wall / 1000:.2f} s"
+        else:
+            detail = ''
+        print(f"  {tour['wall_ms'] / 1000:7.2f} s  {tour['calls']:>3} Aufrufe  {name}{detail}")
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Summarise or clear the render trace.')
+    parser.add_argument('command', nargs='?', choices=('summary', 'clear'), default='summary')
+    parser.add_argument('--file', help='trace file (default: WANDERALBUM_TRACE or '
+                                       '.cache/trace.jsonl)')
+    parser.add_argument('--top', type=int, default=10, help='number of tours to list')
+    args = parser.parse_args(argv)
+
+    trace_file = os.path.abspath(args.file) if args.file else trace_path() or DEFAULT_TRACE
+    if args.command == 'clear':
+        if os.path.exists(trace_file):
+            os.remove(trace_file)
+        print(f"Trace geleert: {trace_file}")
+        return 0
+
+    try:
+        records = read_trace(trace_file)
+    except FileNotFoundError:
+        records = []
+    if not records:
+        print(f"Keine Spans in {trace_file}; mit WANDERALBUM_TRACE=1 aufzeichnen.")
+        return 1
+    print_summary(records, args.top)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,366 @@
+"""
+Cached loading of GPX tracks as NumPy arrays.
+
+Parsing a GPX file with gpxpy builds thousands of Python objects. This module
+streams each file once with a lightweight reader and stores latitude,
+longitude, elevation and cumulative distance as contiguous float arrays in an
+``.npz`` file keyed by the SHA-256 of the GPX content. Later loads, from the same or another
+process, read the arrays back instead of parsing the XML again. When a GPX
+file changes, its old cache entry is removed.
+
+Usage:
+    from tracks import load_track
+    track = load_track('260203_bachtel.gpx')
+    track.lat, track.lon, track.ele, track.dist
+"""
+
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+
+try:
+    from .atomic import atomic_path, atomic_write
+    from .tracing import span
+except ImportError:
+    from atomic import atomic_path, atomic_write
+    from tracing import span
+
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+DEFAULT_CACHE_DIR = os.environ.get(
+    'WANDERALBUM_TRACK_CACHE', os.path.join(BASE_DIR, '.cache', 'tracks'))
+
+EARTH_RADIUS = 6371000.0
+
+# Bump when the cached arrays change meaning, to ignore old cache files.
+CACHE_VERSION = 1
+
+GPX_NS = '{http://www.topografix.com/GPX/1/1}'
+_TRKSEG = GPX_NS + 'trkseg'
+_TRKPT = GPX_NS + 'trkpt'
+_ELE = GPX_NS + 'ele'
+
+# Approximate size of one <trkpt> in a MySchweizMobil export, used to size
+# the arrays up front.
+_BYTES_PER_POINT = 100
+
+
+class Track:
+    """
+    A GPX track as flat NumPy arrays.
+
+    All points of all segments are stored back to back; ``offsets`` holds the
+    start index of every segment followed by the total number of points.
+
+    Attributes:
+        lat (numpy.ndarray): Latitudes in degrees.
+        lon (numpy.ndarray): Longitudes in degrees.
+        ele (numpy.ndarray): Elevations in metres (NaN where missing).
+        dist (numpy.ndarray): Cumulative 2D distance in metres. The gap
+            between two segments is not counted.
+        offsets (numpy.ndarray): Segment boundaries, ``len(segments) + 1``.
+        sha256 (str): Hash of the GPX file the track was read from.
+    """
+
+    __slots__ = ('lat', 'lon', 'ele', 'dist', 'offsets', 'sha256')
+
+    def __init__(self, lat, lon, ele, dist, offsets, sha256=''):
+        self.lat = lat
+        self.lon = lon
+        self.ele = ele
+        self.dist = dist
+        self.offsets = offsets
+        self.sha256 = sha256
+
+    def __len__(self):
+        return len(self.lat)
+
+    def __repr__(self):
+        return (f"Track({len(self)} points, {len(self.offsets) - 1} segments, "
+                f"{self.distance / 1000:.2f} km)")
+
+    @property
+    def distance(self):
+        """Total distance in metres."""
+        return float(self.dist[-1]) if len(self.dist) else 0.0
+
+    def segments(self):
+        """Yield a ``slice`` into the arrays for every segment."""
+        for start, stop in zip(self.offsets[:-1], self.offsets[1:]):
+            yield slice(int(start), int(stop))
+
+    def coordinates(self):
+        """Return every segment as a list of [lon, lat] pairs (GeoJSON order)."""
+        return [np.column_stack((self.lon[s], self.lat[s])).tolist()
+                for s in self.segments()]
+
+    def bounds(self):
+        """Return (min_lat, min_lon, max_lat, max_lon)."""
+        return (float(self.lat.min()), float(self.lon.min()),
+                float(self.lat.max()), float(self.lon.max()))
+
+
+def cumulative_distance(lat, lon, offsets):
+    """
+    Return the cumulative haversine distance along a track in metres.
+
+    Args:
+        lat (numpy.ndarray): Latitudes in degrees.
+        lon (numpy.ndarray): Longitudes in degrees.
+        offsets (numpy.ndarray): Segment boundaries; the step from the last
+            point of one segment to the first of the next counts as zero.
+
+    Returns:
+        numpy.ndarray: Distance from the first point, same length as ``lat``.
+    """
+    phi = np.radians(lat)
+    lam = np.radians(lon)
+    dphi = np.diff(phi)
+    dlam = np.diff(lam)
+    a = np.sin(dphi / 2) ** 2 + np.cos(phi[:-1]) * np.cos(phi[1:]) * np.sin(dlam / 2) ** 2
+    step = 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+    # Boundaries inside the track; empty segments at either end add 0 or len(lat).
+    gaps = offsets[1:-1]
+    step[gaps[(gaps > 0) & (gaps < len(lat))] - 1] = 0.0
+
+    dist = np.zeros(len(lat))
+    np.cumsum(step, out=dist[1:])
+    return dist
+
+
+def parse_gpx(path):
+    """
+    Parse a GPX file with gpxpy into a Track (without caching).
+
+    Args:
+        path (str): Path to the GPX file.
+
+    Returns:
+        Track: The parsed track.
+    """
+    import gpxpy
+
+    with open(path, 'r') as gpx_file:
+        gpx = gpxpy.parse(gpx_file)
+
+    lat, lon, ele, offsets = [], [], [], [0]
+    for track in gpx.tracks:
+        for segment in track.segments:
+            for point in segment.points:
+                lat.append(point.latitude)
+                lon.append(point.longitude)
+                ele.append(np.nan if point.elevation is None else point.elevation)
+            offsets.append(len(lat))
+
+    lat = np.array(lat, dtype=np.float64)
+    lon = np.array(lon, dtype=np.float64)
+    ele = np.array(ele, dtype=np.float64)
+    offsets = np.array(offsets, dtype=np.int64)
+    return Track(lat, lon, ele, cumulative_distance(lat, lon, offsets), offsets)
+
+
+def read_gpx(path):
+    """
+    Read a GPX 1.1 file into a Track without building the gpxpy object tree.
+
+    The file is streamed with ``iterparse``; each ``<trkpt>`` is written into
+    preallocated arrays and then discarded, so peak memory stays
+    proportional to the output arrays. Files in another namespace (e.g.
+    GPX 1.0) fall back to :func:`parse_gpx`.
+
+    Args:
+        path (str): Path to the GPX file.
+
+    Returns:
+        Track: The parsed track.
+    """
+    from xml.etree.ElementTree import iterparse
+
+    capacity = max(os.path.getsize(path) // _BYTES_PER_POINT, 16)
+    lat = np.empty(capacity)
+    lon = np.empty(capacity)
+    ele = np.empty(capacity)
+    offsets = [0]
+    n = 0
+    segment = None
+
+    context = iterparse(path, events=('start', 'end'))
+    _, root = next(context)
+    if not root.tag.startswith(GPX_NS):
+        return parse_gpx(path)
+
+    for event, elem in context:
+        if event == 'start':
+            if elem.tag == _TRKSEG:
+                segment = elem
+            continue
+        if elem.tag == _TRKPT:
+            if n == capacity:
+                capacity *= 2
+                lat.resize(capacity, refcheck=False)
+                lon.resize(capacity, refcheck=False)
+                ele.resize(capacity, refcheck=False)
+            lat[n] = float(elem.get('lat'))
+            lon[n] = float(elem.get('lon'))
+            elevation = elem.find(_ELE)
+            ele[n] = float(elevation.text) if elevation is not None and elevation.text else np.nan
+            n += 1
+            if segment is not None:
+                segment.clear()
+        elif elem.tag == _TRKSEG:
+            offsets.append(n)
+            segment = None
+            root.clear()
+
+    # Shrink in place instead of copying, to keep the peak at one set of arrays.
+    for array in (lat, lon, ele):
+        array.resize(n, refcheck=False)
+    offsets = np.array(offsets, dtype=np.int64)
+    return Track(lat, lon, ele, cumulative_distance(lat, lon, offsets), offsets)
+
+
+def file_sha256(path):
+    """Return the hex SHA-256 of a file's content."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class TrackCache:
+    """
+    Content-hash keyed store of parsed tracks.
+
+    Arrays live in ``<cache_dir>/<sha256>.npz``. ``paths/`` remembers which
+    hash each GPX path had last time, one small file per path, so that the
+    entry of a changed file can be removed; the worker processes of
+    ``build.py`` update it concurrently without losing each other's
+    entries. Within one process, tracks are also kept in memory and the
+    file is only re-hashed when its size or mtime changes.
+
+    Args:
+        cache_dir (str, optional): Where to keep the ``.npz`` files. Defaults
+            to ``WANDERALBUM_TRACK_CACHE`` or ``.cache/tracks``.
+    """
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir or DEFAULT_CACHE_DIR
+        self._memory = {}
+        self._lock = threading.Lock()
+
+    def _entry_path(self, sha256):
+        return os.path.join(self.cache_dir, f'{sha256}.npz')
+
+    def _paths_dir(self):
+        return os.path.join(self.cache_dir, 'paths')
+
+    def _path_record(self, path):
+        name = hashlib.sha256(path.encode('utf-8')).hexdigest()[:32]
+        return os.path.join(self._paths_dir(), f'{name}.json')
+
+    def _read_record(self, record):
+        try:
+            with open(record, 'r', encoding='utf-8') as f:
+                return json.load(f)['sha256']
+        except (FileNotFoundError, ValueError, KeyError, TypeError):
+            return None
+
+    def _remember(self, path, sha256):
+        """Record the hash of ``path`` and drop its previous entry."""
+        record = self._path_record(path)
+        with self._lock:
+            previous = self._read_record(record)
+            if previous == sha256:
+                return
+            os.makedirs(self._paths_dir(), exist_ok=True)
+            atomic_write(record, json.dumps({'path': path, 'sha256': sha256}))
+        if not previous:
+            return
+        # Another GPX file may have the same content.
+        for name in os.listdir(self._paths_dir()):
+            if self._read_record(os.path.join(self._paths_dir(), name)) == previous:
+                return
+        try:
+            os.remove(self._entry_path(previous))
+        except FileNotFoundError:
+            pass
+
+    def _read(self, sha256):
+        try:
+            with np.load(self._entry_path(sha256)) as data:
+                if int(data['version']) != CACHE_VERSION:
+                    return None
+                return Track(data['lat'], data['lon'], data['ele'], data['dist'],
+                             data['offsets'], sha256)
+        except (FileNotFoundError, KeyError, ValueError, OSError):
+            return None
+
+    def _write(self, track):
+        with atomic_path(self._entry_path(track.sha256)) as tmp_path:
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, version=CACHE_VERSION, lat=track.lat, lon=track.lon,
+                         ele=track.ele, dist=track.dist, offsets=track.offsets)
+
+    def load(self, path, parser=read_gpx):
+        """
+        Return the Track of a GPX file, parsing it only if it changed.
+
+        Args:
+            path (str): Path to the GPX file.
+            parser (callable, optional): Function turning a path into a Track.
+
+        Returns:
+            Track: The track.
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        cached = self._memory.get(path)
+        if cached and cached[0] == stamp:
+            return cached[1]
+
+        with span('gpx.load') as stage:
+            sha256 = file_sha256(path)
+            track = self._read(sha256)
+            if track is None:
+                stage.set(cache='miss')
+                with span('gpx.parse', size=stat.st_size):
+                    track = parser(path)
+                track.sha256 = sha256
+                self._write(track)
+            else:
+                stage.set(cache='disk')
+            self._remember(path, sha256)
+        self._memory[path] = (stamp, track)
+        return track
+
+    def clear(self):
+        """Remove all cached tracks."""
+        self._memory.clear()
+        if os.path.isdir(self.cache_dir):
+            for name in os.listdir(self.cache_dir):
+                if name.endswith('.npz'):
+                    os.remove(os.path.join(self.cache_dir, name))
+        if os.path.isdir(self._paths_dir()):
+            for name in os.listdir(self._paths_dir()):
+                os.remove(os.path.join(self._paths_dir(), name))
+
+
+_default_cache = TrackCache()
+
+
+def load_track(path):
+    """
+    Load a GPX file as a Track, using the shared on-disk cache.
+
+    Args:
+        path (str): Path to the GPX file.
+
+    Returns:
+        Track: The track.
+    """
+    return _default_cache.load(path)
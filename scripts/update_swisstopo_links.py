@@ -1,223 +1,410 @@
+"""
+Keep the swisstopo links and QR-code cells of all tour notebooks up to date.
+
+After the elevation profile, every tour notebook has three cells:
+
+    markdown   links to map.geo.admin.ch and to the swisstopo app
+    code       ``generate_qr_code_for_url("<app link>")``
+    markdown   PDF only: table with the two QR codes
+
+The links are built from the notebook's ``cener_swiss_grid`` and ``path``
+variables. Every notebook below files/ is handled in a single pass over its
+cells (see ``TRANSFORMS``); missing cells are inserted, existing ones are
+regenerated, and the QR table keeps the image paths it has.
+
+A notebook is only written, atomically and in the format Jupyter itself
+writes, if its bytes change. Unchanged notebooks keep their modification
+time, so Quarto does not execute them again. Large runs are spread over a
+process pool.
+
+A run over all notebooks takes a fraction of a second, so the script can
+serve as a Quarto pre-render hook; when Quarto renders only some files, only
+those notebooks are looked at:
+
+    project:
+      pre-render: scripts/update_swisstopo_links.py
+
+Usage:
+    python scripts/update_swisstopo_links.py [--dry-run] [--check] [--jobs N]
+                                             [notebook or tour directory ...]
+"""
+
+import argparse
+import base64
+import binascii
+import difflib
+import glob
+import hashlib
 import json
 import os
 import re
-import base64
-import glob
+import sys
+import time
+
+try:
+    from .atomic import atomic_write
+    from .scripts import create_swisstopo_link, create_swisstopo_url
+    from .tours import (BASE_DIR, FILES_DIR, GITHUB_RAW_BASE, code_variables, find_tour,
+                        wgs84_to_lv95)
+except ImportError:
+    from atomic import atomic_write
+    from scripts import create_swisstopo_link, create_swisstopo_url
+    from tours import (BASE_DIR, FILES_DIR, GITHUB_RAW_BASE, code_variables, find_tour,
+                       wgs84_to_lv95)
+
+
+LINK_MARKER = 'Die Karte auf der Website von'
+
+_APP_LINK = re.compile(r"swisstopo\.app/u/([A-Za-z0-9+/=]+)")
+_CENTER_PARAM = re.compile(r"center=([-\d.]+),([-\d.]+)")
+
+# Notebooks fewer than this are not worth starting a pool for.
+_MIN_PARALLEL = 64
+
+
+def serialize(notebook):
+    """Return ``notebook`` as Jupyter writes it (nbformat's JSON layout)."""
+    return json.dumps(notebook, indent=1, sort_keys=True, ensure_ascii=False) + '\n'
+
+
+def _source(cell):
+    source = cell.get('source', '')
+    return source if isinstance(source, str) else ''.join(source)
+
+
+def _lines(text):
+    return text.splitlines(keepends=True)
+
+
+def canonical(text):
+    """
+    Return ``text`` with equivalent spellings of the links unified.
+
+    ``refs/heads/main`` and ``main`` name the same raw GitHub file,
+    ``2742565.30`` and ``2742565.3`` the same coordinate; app links are
+    compared by the URL they encode. Cells that only differ in such
+    spellings are left alone.
+    """
+    def app_link(match):
+        try:
+            payload = base64.b64decode(match.group(1), validate=True).decode('utf-8')
+        except (binascii.Error, UnicodeDecodeError):
+            return match.group(0)
+        return f"swisstopo.app/u/<{canonical(payload)}>"
+
+    def center(match):
+        try:
+            return f"center={float(match.group(1))!r},{float(match.group(2))!r}"
+        except ValueError:
+            return match.group(0)
+
+    text = text.replace('/refs/heads/main/', '/main/')
+    text = _APP_LINK.sub(app_link, text)
+    return _CENTER_PARAM.sub(center, text)
+
+
+def cell_kind(cell):
+    """
+    Classify a cell for the transforms.
+
+    Returns:
+        str or None: ``'link'``, ``'qr'`` or ``'qr_table'`` for the cells
+            this script maintains, ``'profile'`` or ``'map'`` for the cells
+            the block goes after, None for every other cell.
+    """
+    source = _source(cell)
+    if cell['cell_type'] == 'markdown':
+        if LINK_MARKER in source:
+            return 'link'
+        if 'when-format="pdf"' in source and 'qr_tag' in source:
+            return 'qr_table'
+    elif cell['cell_type'] == 'code':
+        if 'generate_qr_code_for_url' in source:
+            return 'qr'
+        if 'profile(path' in source:
+            return 'profile'
+        if 'create_map' in source:
+            return 'map'
+    return None
+
+
+class Context:
+    """
+    What the transforms of one notebook need to know.
+
+    Attributes:
+        path (str): Path of the notebook.
+        tour (Tour or None): The tour the notebook belongs to.
+        variables (dict): Notebook variables seen so far in the pass.
+    """
+
+    def __init__(self, path, tour=None):
+        self.path = path
+        self.tour = tour
+        self.variables = {}
+        self._urls = None
+
+    @property
+    def gpx_url(self):
+        """Raw GitHub URL of the notebook's ``path``, else of the tour's GPX."""
+        path = self.variables.get('path')
+        if path:
+            gpx = os.path.normpath(os.path.join(os.path.dirname(self.path), path))
+            if os.path.exists(gpx) and gpx.startswith(BASE_DIR + os.sep):
+                return f"{GITHUB_RAW_BASE}/{os.path.relpath(gpx, BASE_DIR).replace(os.sep, '/')}"
+        return self.tour.gpx_url if self.tour else None
+
+    @property
+    def urls(self):
+        """(map.geo.admin.ch link, app link), or None without the variables."""
+        if self._urls is None:
+            grid = self.variables.get('swiss_grid')
+            if grid is None and 'center' in self.variables:
+                grid = wgs84_to_lv95(*self.variables['center'])
+            gpx_url = self.gpx_url
+            if grid is None or gpx_url is None:
+                return None
+            self._urls = (create_swisstopo_url(grid, gpx_url), create_swisstopo_link(gpx_url))
+        return self._urls
+
+
+def link_cell(context):
+    """Source of the markdown cell with the two links."""
+    web_url, app_url = context.urls
+    return (f"Die Karte auf der Website von \n"
+            f"[swisstopo.ch]({web_url})\n"
+            f"oder in der \n"
+            f"[Mobile App]({app_url})\n"
+            f"von swisstopo öffnen.")
+
 
-# Base directory for files
-BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "files", "2025"))
-
-# Target notebooks to update
-NOTEBOOKS = [
-    "250629_maderanertal/maderanertal.ipynb",
-    "250706_hauenstein/hauenstein.ipynb",
-    "250712_guscha/guscha.ipynb",
-    "250719_appenzell/appenzell.ipynb",
-    "250722_aelpli/aelpli.ipynb",
-    "250727_dalpe/dalpe.ipynb",
-    "250731_isone/isone.ipynb",
-    "250803_suedrampe/suedrampe.ipynb",
-    "250805_zuerich/zuerich.ipynb",
-    "250807_hautrive/hauterive.ipynb"
-]
-
-def extract_variables(notebook_content):
-    """Extracts center, cener_swiss_grid, and path from the notebook."""
-    variables = {}
-    for cell in notebook_content['cells']:
+def qr_cell(context):
+    """Source of the code cell that generates the QR code."""
+    return f'generate_qr_code_for_url("{context.urls[1]}")'
+
+
+def qr_table_cell(context):
+    """Source of the PDF table of the QR codes, for notebooks that have none."""
+    try:
+        from .qr import images_dir, qr_filename
+    except ImportError:
+        from qr import images_dir, qr_filename
+
+    notebook_dir = os.path.dirname(context.path)
+
+    def image(kind):
+        if context.tour is None:
+            return f'{kind}.png'
+        path = os.path.join(images_dir(context.tour), qr_filename(context.tour, kind))
+        return os.path.relpath(path, notebook_dir).replace(os.sep, '/')
+
+    return ('::: {.content-visible when-format="pdf"}\n'
+            '| Swisstopo.ch | Mobile App |\n'
+            '| --- | --- |\n'
+            f'| ![]({image("qr_tag")}){{width=3cm height=3cm}} '
+            f'| ![]({image("app_qr_tag")}){{width=3cm height=3cm}} |\n'
+            ':::')
+
+
+# Kind of cell -> function that returns its new source. The QR table is only
+# created, never rewritten: its image paths follow the images/ layout.
+TRANSFORMS = {
+    'link': link_cell,
+    'qr': qr_cell,
+}
+
+# The block in notebook order, with the cell type and the source of new cells.
+BLOCK = (
+    ('link', 'markdown', link_cell),
+    ('qr', 'code', qr_cell),
+    ('qr_table', 'markdown', qr_table_cell),
+)
+
+
+def _new_cell(notebook, cell_type, source, context, kind):
+    cell = {'cell_type': cell_type, 'metadata': {}, 'source': _lines(source)}
+    if cell_type == 'code':
+        cell.update({'execution_count': None, 'outputs': []})
+    if (notebook.get('nbformat'), notebook.get('nbformat_minor', 0)) >= (4, 5):
+        # Deterministic, so a dry run shows what the real run writes.
+        seed = f"{os.path.relpath(context.path, BASE_DIR)}:{kind}".encode('utf-8')
+        cell['id'] = hashlib.sha256(seed).hexdigest()[:8]
+    return cell
+
+
+def transform(notebook, context):
+    """
+    Bring the link block of a notebook up to date, in one pass over its cells.
+
+    Args:
+        notebook (dict): The notebook; changed in place.
+        context (Context): The notebook's context.
+
+    Returns:
+        list: Messages about what could not be done.
+    """
+    cells = notebook['cells']
+    found = {}
+    anchor = map_index = None
+    for i, cell in enumerate(cells):
         if cell['cell_type'] == 'code':
-            source = "".join(cell['source'])
-            # Look for variables
-            center_match = re.search(r"center\s*=\s*\[([\d\.]+),\s*([\d\.]+)\]", source)
-            grid_match = re.search(r"(?:cener|center)_swiss_grid\s*=\s*\[([\d\.]+),\s*([\d\.]+)\]", source)
-            path_match = re.search(r"path\s*=\s*\"([^\"]+)\"", source)
-            
-            if center_match:
-                variables['center'] = [float(center_match.group(1)), float(center_match.group(2))]
-            if grid_match:
-                variables['swiss_grid'] = [float(grid_match.group(1)), float(grid_match.group(2))]
-            if path_match:
-                variables['path'] = path_match.group(1)
-            
-            if 'center' in variables and 'swiss_grid' in variables and 'path' in variables:
-                break
-    return variables
-
-def create_urls(variables):
-    """Constructs the Swisstopo URLs."""
-    path = variables['path']
-    # Extract folder and filename from path (e.g., "../../../files/2025/250629_maderanertal/250629_golzeren.gpx")
-    # We assume the path structure is consistent relative to the notebook or absolute-ish
-    # Actually, let's just grab the part after "files/2025/"
-    match = re.search(r"files/2025/(.+)$", path)
-    if not match:
-        print(f"Could not parse path: {path}")
-        return None
-    
-    rel_path = match.group(1)
-    github_raw_url = f"https://raw.githubusercontent.com/Jacques-Mock-Schindler/wanderalbum_illustriert/main/files/2025/{rel_path}"
-    
-    # Swisstopo Web URL
-    swiss_grid = variables['swiss_grid']
-    web_url = f"https://map.geo.admin.ch/#/map?lang=de&center={swiss_grid[0]},{swiss_grid[1]}&z=6&bgLayer=ch.swisstopo.pixelkarte-farbe&topic=ech&layers=GPX|{github_raw_url}"
-    
-    # Mobile App URL (Base64 encoded)
-    url_bytes = github_raw_url.encode('utf-8')
-    encoded_bytes = base64.b64encode(url_bytes)
-    encoded_string = encoded_bytes.decode('utf-8')
-    mobile_url = f"https://swisstopo.app/u/{encoded_string}"
-    
-    return {
-        'web_url': web_url,
-        'mobile_url': mobile_url
-    }
-
-def create_cells(urls):
-    """Creates the new cells to be inserted."""
-    
-    # 1. Markdown Link Cell
-    markdown_source = [
-        "Die Karte auf der Website von \n",
-        f"[swisstopo.ch]({urls['web_url']})\n",
-        "oder in der \n",
-        f"[Mobile App]({urls['mobile_url']})\n",
-        "von swisstopo öffnen."
-    ]
-    
-    markdown_cell = {
-        "cell_type": "markdown",
-        "metadata": {},
-        "source": markdown_source
-    }
-    
-    # 2. Code QR Cell
-    code_source = [
-        f"generate_qr_code_for_url(\"{urls['mobile_url']}\")"
-    ]
-    
-    code_cell = {
-        "cell_type": "code",
-        "execution_count": None,
-        "metadata": {},
-        "outputs": [],
-        "source": code_source
-    }
-    
-    # 3. PDF QR Cell
-    # Using qr_tag.png as it is generated in the CWD by the script
-    pdf_source = [
-        "::: {.content-visible when-format=\"pdf\"}\n",
-        "| Swisstopo.ch | Mobile App |\n",
-        "| --- | --- |\n",
-        "| ![](qr_tag.png){width=3cm height=3cm} | ![](qr_tag.png){width=3cm height=3cm} |\n",
-        ":::"
-    ]
-    
-    pdf_cell = {
-        "cell_type": "markdown",
-        "metadata": {},
-        "source": pdf_source
-    }
-    
-    return [markdown_cell, code_cell, pdf_cell]
-
-def update_notebook(file_path):
-    print(f"Processing {file_path}...")
-    
+            for name, value in code_variables(_source(cell)).items():
+                context.variables.setdefault(name, value)
+        kind = cell_kind(cell)
+        if kind in ('link', 'qr', 'qr_table'):
+            found.setdefault(kind, i)
+            if kind in TRANSFORMS and context.urls is not None:
+                source = TRANSFORMS[kind](context)
+                if canonical(_source(cell)) != canonical(source):
+                    cell['source'] = _lines(source)
+        elif kind == 'profile' and anchor is None:
+            anchor = i + 1
+        elif i == anchor and 'elevation_profile' in _source(cell):
+            # The PDF image of the profile stays with it.
+            anchor = i + 1
+        elif kind == 'map' and map_index is None:
+            map_index = i
+    if anchor is None and map_index is not None:
+        # Skip the markdown cell with the map output that usually follows.
+        anchor = map_index + 2
+
+    if context.urls is None:
+        return [] if not found else ['Variablen center/cener_swiss_grid/path nicht gefunden']
+
+    # Insert the missing cells of the block after their predecessor.
+    position = anchor
+    for kind, cell_type, make in BLOCK:
+        if kind in found:
+            position = found[kind] + 1
+            continue
+        if position is None:
+            return ['Einfügestelle (profile oder create_map) nicht gefunden']
+        cells.insert(position, _new_cell(notebook, cell_type, make(context), context, kind))
+        found = {k: (j + 1 if j >= position else j) for k, j in found.items()}
+        position += 1
+    return []
+
+
+def update_notebook(path, dry_run=False):
+    """
+    Update one notebook.
+
+    Args:
+        path (str): Path of the notebook.
+        dry_run (bool, optional): Only compute the change.
+
+    Returns:
+        tuple: (path, unified diff or '' if unchanged, list of messages)
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        original = f.read()
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            notebook = json.load(f)
-    except Exception as e:
-        print(f"Error reading {file_path}: {e}")
-        return
-
-    variables = extract_variables(notebook)
-    if not variables or 'swiss_grid' not in variables:
-        print(f"Skipping {file_path}: Could not find necessary variables.")
-        return
-
-    urls = create_urls(variables)
-    if not urls:
-        return
-
-    new_cells = create_cells(urls)
-    
-    # Find insertion point
-    insert_index = -1
-    for i, cell in enumerate(notebook['cells']):
-        # We look for the profile(path) call
-        if cell['cell_type'] == 'code' and 'profile(path)' in "".join(cell['source']):
-            insert_index = i + 1
-            break
-    
-    if insert_index == -1:
-        # Fallback: look for create_map
-        for i, cell in enumerate(notebook['cells']):
-            if cell['cell_type'] == 'code' and 'create_map' in "".join(cell['source']):
-                insert_index = i + 2 # Skip the map output markdown cell usually following it
-                break
-    
-    if insert_index == -1:
-        print(f"Skipping {file_path}: Could not find insertion point (profile or create_map).")
-        return
-
-    # Check if cells already exist (idempotency)
-    # We check the next few cells to see if they look like our target cells
-    # If they do, we update them. If not, we insert.
-    
-    # Simple check: does "Die Karte auf der Website von" exist in the notebook?
-    existing_link_index = -1
-    for i, cell in enumerate(notebook['cells']):
-        if cell['cell_type'] == 'markdown' and "Die Karte auf der Website von" in "".join(cell['source']):
-            existing_link_index = i
-            break
-            
-    if existing_link_index != -1:
-        print(f"Updating existing cells in {file_path}...")
-        # Update the existing markdown cell
-        notebook['cells'][existing_link_index] = new_cells[0]
-        # Assuming the next ones are the code and PDF cells, we update them too if they match type
-        # But safer to just replace/insert around that area.
-        # Actually, let's just replace the found cell and insert the others if missing.
-        
-        # Check for QR code cell
-        if existing_link_index + 1 < len(notebook['cells']) and \
-           notebook['cells'][existing_link_index + 1]['cell_type'] == 'code' and \
-           "generate_qr_code_for_url" in "".join(notebook['cells'][existing_link_index + 1]['source']):
-            notebook['cells'][existing_link_index + 1] = new_cells[1]
-        else:
-            notebook['cells'].insert(existing_link_index + 1, new_cells[1])
-            
-        # Check for PDF cell
-        if existing_link_index + 2 < len(notebook['cells']) and \
-           notebook['cells'][existing_link_index + 2]['cell_type'] == 'markdown' and \
-           "content-visible when-format=\"pdf\"" in "".join(notebook['cells'][existing_link_index + 2]['source']) and \
-           "qr_tag" in "".join(notebook['cells'][existing_link_index + 2]['source']):
-             notebook['cells'][existing_link_index + 2] = new_cells[2]
-        else:
-             notebook['cells'].insert(existing_link_index + 2, new_cells[2])
+        notebook = json.loads(original)
+    except ValueError as e:
+        return path, '', [f"kein gültiges JSON: {e}"]
+
+    context = Context(path, find_tour(os.path.dirname(path)))
+    messages = transform(notebook, context)
+    updated = serialize(notebook)
+    if updated == original:
+        return path, '', messages
+
+    name = os.path.relpath(path, BASE_DIR)
+    diff = ''.join(difflib.unified_diff(_lines(original), _lines(updated),
+                                        f'a/{name}', f'b/{name}'))
+    if not dry_run:
+        atomic_write(path, updated)
+    return path, diff, messages
+
+
+def _update(task):
+    return update_notebook(*task)
+
+
+def find_notebooks(paths=None):
+    """
+    Return the notebooks to process.
+
+    Args:
+        paths (list, optional): Notebooks or directories. Defaults to the
+            files Quarto is rendering (``QUARTO_PROJECT_INPUT_FILES``) or, for
+            a full render, every notebook below files/.
+
+    Returns:
+        list: Absolute paths of the notebooks.
+    """
+    if not paths and not os.environ.get('QUARTO_PROJECT_RENDER_ALL'):
+        paths = os.environ.get('QUARTO_PROJECT_INPUT_FILES', '').split('\n')
+        paths = [os.path.join(BASE_DIR, p) for p in paths if p.endswith('.ipynb')]
+        if not paths and os.environ.get('QUARTO_PROJECT_INPUT_FILES'):
+            return []
+    if not paths:
+        paths = [FILES_DIR]
+
+    notebooks = set()
+    for path in paths:
+        path = os.path.abspath(path)
+        if os.path.isdir(path):
+            notebooks.update(glob.glob(os.path.join(path, '**', '*.ipynb'), recursive=True))
+        elif path.endswith('.ipynb') and os.path.exists(path):
+            notebooks.add(path)
+    return sorted(p for p in notebooks if '.ipynb_checkpoints' not in p)
 
+
+def update_notebooks(paths=None, dry_run=False, workers=None):
+    """
+    Update many notebooks, on a process pool if there are many.
+
+    Args:
+        paths (list, optional): See ``find_notebooks``.
+        dry_run (bool, optional): Only compute the changes.
+        workers (int, optional): Size of the process pool. Defaults to the
+            number of CPUs; 1 works in this process.
+
+    Returns:
+        list: (path, diff, messages) per notebook, sorted by path.
+    """
+    tasks = [(path, dry_run) for path in find_notebooks(paths)]
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(tasks) >= _MIN_PARALLEL:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_update, tasks, chunksize=max(1, len(tasks) // (4 * workers))))
     else:
-        print(f"Inserting new cells in {file_path} at index {insert_index}...")
-        # Insert all 3 cells
-        for cell in reversed(new_cells):
-            notebook['cells'].insert(insert_index, cell)
+        results = [_update(task) for task in tasks]
+    return sorted(results)
 
-    # Save notebook
-    try:
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(notebook, f, indent=1)
-        print(f"Successfully updated {file_path}")
-    except Exception as e:
-        print(f"Error writing {file_path}: {e}")
-
-def main():
-    for rel_path in NOTEBOOKS:
-        file_path = os.path.join(BASE_DIR, rel_path)
-        if os.path.exists(file_path):
-            update_notebook(file_path)
-        else:
-            print(f"File not found: {file_path}")
-
-if __name__ == "__main__":
-    main()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Update the swisstopo links and QR-code cells of the tour notebooks.')
+    parser.add_argument('paths', nargs='*',
+                        help='notebooks or directories (default: all notebooks in files/)')
+    parser.add_argument('-n', '--dry-run', action='store_true',
+                        help='print the changes as a diff instead of writing them')
+    parser.add_argument('--check', action='store_true',
+                        help='like --dry-run, but exit with status 1 if anything would change')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='number of worker processes (default: CPU count)')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    dry_run = args.dry_run or args.check
+    results = update_notebooks(args.paths, dry_run, args.jobs)
+    changed = 0
+    for path, diff, messages in results:
+        name = os.path.relpath(path, BASE_DIR)
+        for message in messages:
+            print(f"⚠ {name}: {message}")
+        if diff:
+            changed += 1
+            print(diff if dry_run else f"✓ {name}", end='' if dry_run else '\n')
+    verb = 'zu aktualisieren' if dry_run else 'aktualisiert'
+    print(f"{len(results)} Notebooks, {changed} {verb} "
+          f"({time.perf_counter() - start:.2f} s)")
+    return 1 if args.check and changed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())